@@ -55,6 +55,10 @@ def create_app():
     except Exception as e:
         app.logger.exception("DB init failed (will still start): %s", e)
 
+    # versão do catálogo entre workers (tabela catalog_version)
+    from .extensions.catalog import init_app as init_catalog
+    init_catalog(app)
+
     # Registra blueprints 
     try:
         from .controllers.auth_controller import bp as auth_bp
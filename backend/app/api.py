@@ -1,4 +1,5 @@
 from __future__ import annotations
+import click
 from flask import Blueprint, request, jsonify, session, current_app
 import os
 import base64
@@ -9,16 +10,28 @@ from datetime import datetime, timedelta, timezone
 import numpy as np
 
 from .constants import (
+    ANIMAL_FEATURE_COLUMNS,
     ERR_UNAUTHENTICATED,
     SQL_DELETE_ANIMAL_BY_ID,
+    SQL_DELETE_ANIMAL_FEATURES,
     SQL_INSERT_ANIMAL,
+    SQL_INSERT_ANIMAL_FEATURES,
     SQL_INSERT_PERFIL_VALUES,
     SQL_SELECT_ANIMAL_BY_ID,
     SQL_SELECT_ANIMAL_ROW,
+    SQL_SELECT_ANIMAL_ROW_BY_ID,
     SQL_SELECT_ANIMAL_ROW_NO_OWNER,
+    SQL_SELECT_ANIMALS_FOR_FEATURES,
+    SQL_SELECT_ANIMALS_MISSING_FEATURES,
     SQL_SELECT_DONOR_BY_ANIMAL_ID,
+    SQL_SELECT_PERFIL_ADOTANTE,
+    SQL_SELECT_PERFIL_PREFS,
+    SQL_SELECT_RECOMMENDED_ANIMAL_ROWS,
 )
+from .extensions import catalog
+from .recommendation import scoring
 from .extensions import db as db_ext
+from .extensions.response_cache import cached_response, conditional_get, query_key
 
 try:
     import jwt as pyjwt
@@ -263,23 +276,104 @@ def _build_animal_vector(a: dict) -> list[float]:
 
     return [v0, v1, v2, v3]
 
+# --- vetor pré-calculado (tabela animal_features)
+def _animal_features(a: dict) -> dict:
+    """Colunas de animal_features para a linha `a` (gravadas no create/update)."""
+    return dict(zip(ANIMAL_FEATURE_COLUMNS, _build_animal_vector(a)))
+
+def _stored_animal_vector(a: dict) -> list[float]:
+    """Vetor do animal lido de animal_features; calcula na hora se ainda não foi gerado."""
+    vec = [a.get(c) for c in ANIMAL_FEATURE_COLUMNS]
+    if any(v is None for v in vec):
+        return _build_animal_vector(a)
+    return [float(v) for v in vec]
+
+def _save_animal_features(cur, animal_id, features: dict) -> None:
+    cur.execute(SQL_DELETE_ANIMAL_FEATURES, (animal_id,))
+    cur.execute(
+        SQL_INSERT_ANIMAL_FEATURES,
+        (animal_id, *(features[c] for c in ANIMAL_FEATURE_COLUMNS)),
+    )
+
+def backfill_animal_features(recompute: bool = False) -> int:
+    """
+    Gera animal_features para os animais cadastrados antes da tabela existir
+    (ou para todos, com recompute=True). Só preenche linhas: a tabela vem da
+    migração 6. Devolve quantos animais foram gravados.
+    """
+    with db_ext.db() as conn:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute(SQL_SELECT_ANIMALS_FOR_FEATURES if recompute else SQL_SELECT_ANIMALS_MISSING_FEATURES)
+            rows = cur.fetchall() or []
+            for r in rows:
+                _save_animal_features(cur, r["id"], _animal_features(r))
+            db_version = catalog.bump_in_transaction(cur) if rows else None
+    if rows:
+        catalog.bump(db_version=db_version)
+    return len(rows)
+
+# --- scorer da rota /recomendacoes: vetor de 4 dimensões, minkowski p=2 com VEC_WEIGHTS
+VEC4_SCORER = "vec4_minkowski"
+_VEC_SQRT_WEIGHTS = np.sqrt(VEC_WEIGHTS)
+_VEC_MAX_DISTANCE = float(np.sqrt(np.sum(VEC_WEIGHTS)))
+
+class _Vec4Space:
+    """
+    Espaço de features do scorer vec4: os vetores são multiplicados por
+    sqrt(VEC_WEIGHTS), então a euclidiana comum equivale à minkowski ponderada.
+    Não depende do catálogo, por isso `track` sempre aceita a linha.
+    """
+
+    def __init__(self, animals):
+        pass
+
+    def track(self, row, delta):
+        return True
+
+    def transform(self, animals):
+        X = np.array([_stored_animal_vector(a) for a in animals], dtype=float).reshape(-1, len(VEC_WEIGHTS))
+        return X * _VEC_SQRT_WEIGHTS
+
+    def user_vector(self, prefs):
+        return np.array([_build_user_vector(prefs)], dtype=float) * _VEC_SQRT_WEIGHTS
+
+def _vec4_score(dist: float) -> dict:
+    return {"compatibility_score": round(max(0.0, 100 * (1 - dist / _VEC_MAX_DISTANCE)), 1)}
+
+scoring.register_scorer(scoring.Scorer(VEC4_SCORER, _Vec4Space, _vec4_score))
+
+# --- ranking no banco (RECOMMENDATION_SCORING=sql): só os n melhores saem do banco
+def _sql_scoring_enabled() -> bool:
+    return (os.environ.get("RECOMMENDATION_SCORING") or "").strip().lower() == "sql"
+
+def _rank_in_sql(perfil: dict, n: int) -> list[dict]:
+    """
+    Mesmo ranking/score do scorer vec4, calculado com ORDER BY ... LIMIT n sobre
+    animal_features. Animais sem vetor gravado ficam de fora (rodar o backfill).
+    """
+    params = []
+    for w, u in zip(VEC_WEIGHTS.tolist(), _build_user_vector(perfil)):
+        params.extend([w, u, u])
+    params.append(n)
+    with db_ext.db() as conn:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute(SQL_SELECT_RECOMMENDED_ANIMAL_ROWS, tuple(params))
+            rows = cur.fetchall() or []
+    for r in rows:
+        sq = max(0.0, float(r.pop("sq_distance") or 0.0))
+        r.update(_vec4_score(float(np.sqrt(sq))))
+    return rows
+
 # --- Rotas: PERFIL ADOTANTE 
 @bp_api.get("/perfil_adotante")
+@db_ext.readonly_route(replica=False)  # dados do próprio usuário: lê do primário
 def get_perfil_adotante():
     uid = _require_auth()
     if not uid:
         return _json_error(ERR_UNAUTHENTICATED, 401)
     with db_ext.db() as conn:
         with conn.cursor(dictionary=True) as cur:
-            cur.execute(
-                """
-                SELECT usuario_id, tipo_moradia, tem_criancas,
-                       tempo_disponivel_horas_semana, estilo_vida, atualizado_em
-                  FROM perfil_adotante
-                 WHERE usuario_id = %s
-                """,
-                (uid,),
-            )
+            cur.execute(SQL_SELECT_PERFIL_ADOTANTE, (uid,))
             row = cur.fetchone()
     if row and "tem_criancas" in row:
         row["tem_criancas"] = _normalize_to_int_bool(row.get("tem_criancas"))
@@ -310,7 +404,8 @@ def upsert_perfil_adotante():
                       SET tipo_moradia = EXCLUDED.tipo_moradia,
                           tem_criancas = EXCLUDED.tem_criancas,
                           tempo_disponivel_horas_semana = EXCLUDED.tempo_disponivel_horas_semana,
-                          estilo_vida = EXCLUDED.estilo_vida
+                          estilo_vida = EXCLUDED.estilo_vida,
+                          versao = perfil_adotante.versao + 1
                     """,
                     (uid, tipo_moradia, tem_criancas, tempo, estilo_vida),
                 )
@@ -322,14 +417,19 @@ def upsert_perfil_adotante():
                         tipo_moradia = VALUES(tipo_moradia),
                         tem_criancas = VALUES(tem_criancas),
                         tempo_disponivel_horas_semana = VALUES(tempo_disponivel_horas_semana),
-                        estilo_vida = VALUES(estilo_vida)
+                        estilo_vida = VALUES(estilo_vida),
+                        versao = versao + 1
                     """,
                     (uid, tipo_moradia, tem_criancas, tempo, estilo_vida),
                 )
+    catalog.profile_changed(uid)
     return jsonify({"ok": True})
 
 # --- Rotas: ANIMAIS (list, create, get, update, delete, mine) 
 @bp_api.get("/animais")
+@conditional_get(etag=lambda: catalog.version_tag())
+@cached_response(key=lambda: query_key("especie", "idade", "porte", "cidade", lower=("idade", "porte", "cidade")))
+@db_ext.readonly_route(replica=False)  # ETag/cache pela versão do primário: réplica atrasada não
 def list_animais():
     especie = request.args.get("especie") or ""
     idade = (request.args.get("idade") or "").lower()
@@ -426,16 +526,28 @@ def create_animal():
                     animal_id = cur.lastrowid
                 except Exception:
                     animal_id = None
+            features = _animal_features({
+                "especie": especie, "porte": porte, "idade": idade, "bom_com_criancas": bom_com_criancas,
+            })
+            if animal_id is not None:
+                _save_animal_features(cur, animal_id, features)
+            db_version = catalog.bump_in_transaction(cur)
+    catalog.animal_changed("insert", animal_id, {
+        "nome": nome, "especie": especie, "raca": raca, "idade": idade, "porte": porte,
+        "descricao": descricao, "cidade": cidade, "photo_url": photo_url,
+        "donor_name": donor_name, "donor_whatsapp": donor_whatsapp, "doador_id": uid,
+        "energia": energia, "bom_com_criancas": bom_com_criancas, **features,
+    }, db_version=db_version)
     return jsonify({"ok": True, "id": animal_id})
 
 @bp_api.get("/animais/<int:aid>")
+@conditional_get(etag=lambda aid: catalog.version_tag())
+@cached_response(key=lambda aid: aid, tags=lambda aid: (f"animal:{aid}",))
+@db_ext.readonly_route(replica=False)  # ETag/cache pela versão do primário: réplica atrasada não
 def get_animal(aid: int):
     with db_ext.db() as conn:
         with conn.cursor(dictionary=True) as cur:
-            cur.execute(
-                SQL_SELECT_ANIMAL_ROW + "\n                 WHERE id=%s",
-                (aid,),
-            )
+            cur.execute(SQL_SELECT_ANIMAL_ROW_BY_ID, (aid,))
             row = cur.fetchone()
     if not row:
         return _json_error("not found", 404)
@@ -499,6 +611,17 @@ def update_animal(aid: int):
                     aid,
                 ),
             )
+            features = _animal_features({
+                "especie": especie, "porte": porte, "idade": idade, "bom_com_criancas": bom_com_criancas,
+            })
+            _save_animal_features(cur, aid, features)
+            db_version = catalog.bump_in_transaction(cur)
+    catalog.animal_changed("update", aid, {
+        "nome": nome, "especie": especie, "raca": raca, "idade": idade, "porte": porte,
+        "descricao": descricao, "cidade": cidade, "photo_url": photo_url,
+        "energia": energia, "bom_com_criancas": bom_com_criancas, "adotado_em": adotado_em,
+        "disponivel": owner.get("disponivel"), **features,
+    }, db_version=db_version)
     return jsonify({"ok": True})
 
 @bp_api.delete("/animais/<int:aid>")
@@ -511,10 +634,19 @@ def delete_animal(aid: int):
             owner = cur.fetchone()
             if not owner: return _json_error("not found", 404)
             if int(owner.get("doador_id") or 0) != int(uid): return _json_error("forbidden", 403)
+            cur.execute(SQL_DELETE_ANIMAL_FEATURES, (aid,))
             cur.execute(SQL_DELETE_ANIMAL_BY_ID, (aid,))
+            db_version = catalog.bump_in_transaction(cur)
+    catalog.animal_changed("delete", aid, db_version=db_version)
     return jsonify({"ok": True})
 
+def _user_etag():
+    uid = _require_auth()
+    return f"{catalog.version_tag()}.u{uid}" if uid else None
+
 @bp_api.get("/animais/mine")
+@conditional_get(etag=_user_etag, private=True)
+@db_ext.readonly_route(replica=False)  # dados do próprio usuário: lê do primário
 def animais_mine():
     uid = _require_auth()
     if not uid: return _json_error(ERR_UNAUTHENTICATED, 401)
@@ -528,7 +660,24 @@ def animais_mine():
     return jsonify([_row_to_animal(r) for r in rows])
 
 # --- RECOMENDAÇÕES
+def _public_recomendacoes_key():
+    # só o fallback anônimo (últimos n) é igual para todos
+    if _require_auth():
+        return None
+    return int(request.args.get("n") or 6)
+
+def _recomendacoes_etag():
+    # anônimo: só o catálogo; com usuário: catálogo + versão do perfil dele
+    # (do cache compartilhado; no backend local, uma leitura por PK no primário)
+    uid = _require_auth()
+    if not uid:
+        return catalog.version_tag()
+    return f"{catalog.version_tag()}.u{uid}.p{catalog.profile_version(uid)}"
+
 @bp_api.get("/recomendacoes")
+@conditional_get(etag=_recomendacoes_etag, private=True)
+@cached_response(key=_public_recomendacoes_key)
+@db_ext.readonly_route(replica=False)  # ETag/cache pela versão do primário: réplica atrasada não
 def recomendacoes():
     n = int(request.args.get("n") or 6)
     uid = _require_auth()
@@ -574,15 +723,7 @@ def recomendacoes():
     # obtém perfil do usuário
     with db_ext.db() as conn:
         with conn.cursor(dictionary=True) as cur:
-            cur.execute(
-                """
-                SELECT tipo_moradia, tem_criancas,
-                       tempo_disponivel_horas_semana, estilo_vida
-                  FROM perfil_adotante
-                 WHERE usuario_id = %s
-                """,
-                (uid,),
-            )
+            cur.execute(SQL_SELECT_PERFIL_PREFS, (uid,))
             perfil = cur.fetchone()
 
     if perfil and "tem_criancas" in perfil:
@@ -599,78 +740,23 @@ def recomendacoes():
                 rows = cur.fetchall() or []
         return jsonify(_rows_to_payload(rows[:n], []))
 
-    with db_ext.db() as conn:
-        with conn.cursor(dictionary=True) as cur:
-            cur.execute(SQL_SELECT_ANIMAL_ROW)
-            animals = cur.fetchall() or []
-
-    # vetores e ranking
-    user_vec = _build_user_vector(perfil)
-    user_vec_np = np.array([user_vec])
-    animal_vectors = []
-    animal_map = []
-    for r in animals:
-        animal_vec = _build_animal_vector(r)
-        if len(animal_vec) == len(VEC_WEIGHTS):
-            animal_vectors.append(animal_vec)
-            animal_map.append(r)
-    X_animals = np.array(animal_vectors)
-    if X_animals.size == 0:
-        return jsonify(_rows_to_payload([], []))
-
-    # --- calcular distâncias usando sklearn pairwise_distances
-    try:
-        # importa explicitamente a função de pairwise
-        from sklearn.metrics import pairwise_distances as sk_pairwise_distances
-        import sklearn
-        sklearn_version = getattr(sklearn, "__version__", "unknown")
-    except Exception as e:
-        return jsonify({
-            "ok": False,
-            "error": "sklearn_required",
-            "message": "scikit-learn não está instalado ou não é importável. Instale scikit-learn e redeploy.",
-            "detail": str(e)
-        }), 500
-
-    try:
-        # calcula distâncias ponderadas (minkowski com weights VEC_WEIGHTS)
-        distances = sk_pairwise_distances(
-            user_vec_np,
-            X_animals,
-            metric='minkowski',
-            p=2,
-            w=VEC_WEIGHTS
-        )[0]
-        method_used = f"pairwise_distances(minkowski,w) sklearn {sklearn_version}"
-    except Exception as exc:
-        return jsonify({
-            "ok": False,
-            "error": "sklearn_pairwise_error",
-            "message": "Erro ao calcular distâncias com sklearn.metrics.pairwise_distances.",
-            "detail": str(exc)
-        }), 500
-
-    max_distance = float(np.sqrt(np.sum(VEC_WEIGHTS)))
-    scored = []
-    for dist, animal_data in zip(distances, animal_map):
-        compatibility = max(
-            0,
-            100 * (1 - float(dist) / max_distance)
-        )
-        animal_data["compatibility_score"] = round(compatibility, 1)
-        scored.append((float(dist), animal_data))
-    scored.sort(key=lambda x: x[0])
-    top = [a for _, a in scored[:n]]
+    if _sql_scoring_enabled():
+        # ranking no banco: ORDER BY distância LIMIT n
+        top = _rank_in_sql(perfil, n)
+        method_used = "SQL ORDER BY distância ponderada LIMIT n (animal_features)"
+    else:
+        # ranking pelo motor de recomendação (snapshot + índice do scorer vec4)
+        top = scoring.rank(VEC4_SCORER, perfil, top_n=n)
+        method_used = f"scoring engine '{VEC4_SCORER}' (euclidiana ponderada, top-k NumPy)"
     ids = [a["id"] for a in top]
 
     if str(request.args.get("debug") or "").strip() == "1":
-        debug_user_vec = user_vec
         debug_sample = []
-        for i, a_map in enumerate(animal_map[:6]):
+        for a_map in top[:6]:
             debug_sample.append({
                 "id": a_map.get("id"),
                 "nome": a_map.get("nome"),
-                "animal_vector": _build_animal_vector(a_map),
+                "animal_vector": _stored_animal_vector(a_map),
             })
         return jsonify({
             "ok": True,
@@ -678,9 +764,8 @@ def recomendacoes():
             "ids": ids,
             "debug": {
                 "method_used": method_used,
-                "sklearn_version": sklearn_version,
                 "VEC_WEIGHTS": VEC_WEIGHTS.tolist(),
-                "user_vector": debug_user_vec,
+                "user_vector": _build_user_vector(perfil),
                 "animal_sample": debug_sample,
             }
         })
@@ -713,6 +798,7 @@ def adopt_animal(aid: int):
                     cur.execute("UPDATE animais SET adotado_em = NOW() WHERE id=%s", (aid,))
                 else:
                     cur.execute("UPDATE animais SET adotado_em = NULL WHERE id=%s", (aid,))
+                db_version = catalog.bump_in_transaction(cur)
 
             try:
                 conn.commit()
@@ -721,11 +807,9 @@ def adopt_animal(aid: int):
 
             # busca o registro atualizado
             with conn.cursor(dictionary=True) as cur2:
-                cur2.execute(
-                    SQL_SELECT_ANIMAL_ROW + "\n                     WHERE id=%s",
-                    (aid,),
-                )
+                cur2.execute(SQL_SELECT_ANIMAL_ROW_BY_ID, (aid,))
                 row = cur2.fetchone()
+            catalog.animal_changed("adopt" if action == "mark" else "update", aid, row, db_version=db_version)
 
     except Exception as e:
         import traceback
@@ -748,6 +832,7 @@ def adopt_animal(aid: int):
 
 # --- metrics/adoptions 
 @bp_api.get("/animais/metrics/adoptions")
+@db_ext.readonly_route
 def adoption_metrics():
     try:
         days = int(request.args.get("days") or 7)
@@ -758,17 +843,18 @@ def adoption_metrics():
     days = min(days, 90)
     end = datetime.now(timezone.utc).date()
     start = end - timedelta(days=days - 1)
+    # faixa direto em adotado_em (e não DATE(adotado_em) BETWEEN) para usar idx_animais_adotado_em
     sql = """
         SELECT DATE(adotado_em) AS day, COUNT(*) AS cnt
           FROM animais
          WHERE adotado_em IS NOT NULL
-           AND DATE(adotado_em) BETWEEN %s AND %s
+           AND adotado_em >= %s AND adotado_em < %s
          GROUP BY DATE(adotado_em)
          ORDER BY DATE(adotado_em) ASC
     """
     with db_ext.db() as conn:
         with conn.cursor(dictionary=True) as cur:
-            cur.execute(sql, (start.isoformat(), end.isoformat()))
+            cur.execute(sql, (start.isoformat(), (end + timedelta(days=1)).isoformat()))
             rows = cur.fetchall() or []
     counts = {
         (r["day"].isoformat() if hasattr(r["day"], "isoformat") else str(r["day"])): int(r["cnt"] or 0)
@@ -781,6 +867,15 @@ def adoption_metrics():
         result.append({"day": ds, "count": counts.get(ds, 0)})
     return jsonify({"ok": True, "days": result})
 
+# --- comando CLI: flask backfill-animal-features
+@click.command("backfill-animal-features")
+@click.option("--all", "recompute", is_flag=True, help="Recalcula também os animais que já têm features.")
+def backfill_animal_features_command(recompute):
+    """Gera animal_features para os animais existentes."""
+    n = backfill_animal_features(recompute=recompute)
+    click.echo(f"animal_features: {n} animais gravados")
+
 # --- registro blueprint 
 def register_blueprints(app):
     app.register_blueprint(bp_api, url_prefix="/api")
+    app.cli.add_command(backfill_animal_features_command)
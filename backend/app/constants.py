@@ -1,5 +1,7 @@
 """Constantes compartilhadas (SQL, mensagens de API, DSN)."""
 
+from .extensions.statements import prepared
+
 ERR_UNAUTHENTICATED = "unauthenticated"
 
 # DSN PostgreSQL (Docker Compose / testes locais)
@@ -12,7 +14,7 @@ POSTGRESQL_PSYCOPG2_SCHEME = "postgresql+psycopg2://"
 
 # --- SQL: animais ---
 SQL_SELECT_DONOR_BY_ANIMAL_ID = "SELECT doador_id FROM animais WHERE id=%s"
-SQL_SELECT_ANIMAL_BY_ID = "SELECT * FROM animais WHERE id=%s"
+SQL_SELECT_ANIMAL_BY_ID = prepared("animal_by_id", "SELECT * FROM animais WHERE id=%s")
 SQL_DELETE_ANIMAL_BY_ID = "DELETE FROM animais WHERE id=%s"
 
 SQL_SELECT_ANIMAL_ROW = """
@@ -22,6 +24,27 @@ SQL_SELECT_ANIMAL_ROW = """
                        energia, bom_com_criancas, adotado_em
                   FROM animais"""
 
+# statements quentes (extensions.statements): preparados no servidor, com métricas
+SQL_SELECT_ANIMAL_ROW_BY_ID = prepared("animal_row_by_id", SQL_SELECT_ANIMAL_ROW + "\n                 WHERE id=%s")
+
+# catálogo do recomendador (fase 1): só animais ainda não adotados e não
+# marcados como indisponíveis (`disponivel` falso; NULL conta como disponível:
+# o cadastro pela API não preenche a coluna), com id e as
+# colunas usadas no ranking, incluindo o vetor pré-calculado de animal_features
+# (NULL quando ainda não foi gerado). As linhas completas dos vencedores são
+# buscadas depois por id (fase 2).
+SCORING_COLUMNS = (
+    "especie", "idade", "porte", "energia", "bom_com_criancas",
+    "vec_porte", "vec_criancas", "vec_tempo", "vec_atividade",
+)
+
+SQL_SELECT_SCORING_ROWS = """
+                SELECT a.id, a.especie, a.idade, a.porte, a.energia, a.bom_com_criancas,
+                       f.vec_porte, f.vec_criancas, f.vec_tempo, f.vec_atividade
+                  FROM animais a
+                  LEFT JOIN animal_features f ON f.animal_id = a.id
+                 WHERE a.adotado_em IS NULL AND a.disponivel IS NOT FALSE"""
+
 SQL_SELECT_ANIMAL_ROW_NO_OWNER = """
                 SELECT id, nome, especie, raca, idade, porte, descricao,
                        cidade, photo_url, donor_name, donor_whatsapp,
@@ -36,14 +59,61 @@ SQL_INSERT_ANIMAL = """
                          energia, bom_com_criancas)
                     VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)"""
 
+# --- SQL: animal_features (vetor de 4 dimensões da recomendação, gravado no insert/update) ---
+ANIMAL_FEATURE_COLUMNS = ("vec_porte", "vec_criancas", "vec_tempo", "vec_atividade")
+
+SQL_INSERT_ANIMAL_FEATURES = """
+                    INSERT INTO animal_features
+                        (animal_id, vec_porte, vec_criancas, vec_tempo, vec_atividade)
+                    VALUES (%s,%s,%s,%s,%s)"""
+SQL_DELETE_ANIMAL_FEATURES = "DELETE FROM animal_features WHERE animal_id=%s"
+SQL_SELECT_ANIMALS_FOR_FEATURES = """
+                SELECT a.id, a.especie, a.porte, a.idade, a.bom_com_criancas
+                  FROM animais a"""
+SQL_SELECT_ANIMALS_MISSING_FEATURES = SQL_SELECT_ANIMALS_FOR_FEATURES + """
+                  LEFT JOIN animal_features f ON f.animal_id = a.id
+                 WHERE f.animal_id IS NULL"""
+
+# ranking da recomendação no banco: distância ponderada ao quadrado sobre
+# animal_features (parâmetros por coluna: peso, u, u; depois o LIMIT).
+# Empate -> animal mais recente primeiro, como no motor em memória.
+SQL_SELECT_RECOMMENDED_ANIMAL_ROWS = """
+                SELECT a.id, a.nome, a.especie, a.raca, a.idade, a.porte, a.descricao,
+                       a.cidade, a.photo_url, a.donor_name, a.donor_whatsapp,
+                       a.doador_id, a.criado_em AS created_at,
+                       a.energia, a.bom_com_criancas, a.adotado_em,
+                       f.vec_porte, f.vec_criancas, f.vec_tempo, f.vec_atividade,
+                       (%s * (f.vec_porte - %s) * (f.vec_porte - %s)
+                        + %s * (f.vec_criancas - %s) * (f.vec_criancas - %s)
+                        + %s * (f.vec_tempo - %s) * (f.vec_tempo - %s)
+                        + %s * (f.vec_atividade - %s) * (f.vec_atividade - %s)) AS sq_distance
+                  FROM animais a
+                  JOIN animal_features f ON f.animal_id = a.id
+                 WHERE a.adotado_em IS NULL AND a.disponivel IS NOT FALSE
+                 ORDER BY sq_distance, a.id DESC
+                 LIMIT %s"""
+
+SQL_SELECT_PERFIL_ADOTANTE = prepared("perfil_adotante", """
+                SELECT usuario_id, tipo_moradia, tem_criancas,
+                       tempo_disponivel_horas_semana, estilo_vida, atualizado_em
+                  FROM perfil_adotante
+                 WHERE usuario_id = %s""")
+
+# preferências usadas pelo recomendador
+SQL_SELECT_PERFIL_PREFS = prepared("perfil_prefs", """
+                SELECT tipo_moradia, tem_criancas,
+                       tempo_disponivel_horas_semana, estilo_vida
+                  FROM perfil_adotante
+                 WHERE usuario_id = %s""")
+
 SQL_INSERT_PERFIL_VALUES = """
                     INSERT INTO perfil_adotante
                         (usuario_id, tipo_moradia, tem_criancas,
-                         tempo_disponivel_horas_semana, estilo_vida)
-                    VALUES (%s, %s, %s, %s, %s)"""
+                         tempo_disponivel_horas_semana, estilo_vida, versao)
+                    VALUES (%s, %s, %s, %s, %s, 1)"""
 
 # --- SQL: usuarios ---
-SQL_USER_BY_ID = "SELECT id, nome, email, avatar_url FROM usuarios WHERE id=%s"
+SQL_USER_BY_ID = prepared("user_by_id", "SELECT id, nome, email, avatar_url FROM usuarios WHERE id=%s")
 SQL_USER_ID_BY_EMAIL = "SELECT id FROM usuarios WHERE email=%s"
 SQL_USER_ID_BY_GOOGLE_SUB = "SELECT id FROM usuarios WHERE google_sub=%s"
 SQL_USER_LOGIN_BY_EMAIL = "SELECT id, password_hash FROM usuarios WHERE email=%s"
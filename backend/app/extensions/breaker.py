@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("app.db.breaker")
+
+
+class DatabaseUnavailable(RuntimeError):
+    """Banco fora do ar (circuito aberto): a requisição falha na hora com 503."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuito do banco:
+    - "closed": normal; `failure_threshold` falhas seguidas de conexão abrem o circuito;
+    - "open": `check()` levanta DatabaseUnavailable sem tocar no banco, enquanto
+      uma thread em background chama `reconnect()` com backoff exponencial
+      (`backoff` s dobrando até `max_backoff`);
+    - "half_open": tentativa de reconexão em andamento; se der certo, fecha.
+    """
+
+    def __init__(
+        self,
+        reconnect: Callable[[], Any],
+        failure_threshold: int = 3,
+        backoff: float = 1.0,
+        max_backoff: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self._reconnect = reconnect
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._next_probe: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._stats = {"trips": 0, "probes": 0, "rejected": 0}
+        self.probe_thread: Optional[threading.Thread] = None
+
+    def check(self) -> None:
+        """Levanta DatabaseUnavailable com o circuito aberto."""
+        if self.state == "closed":
+            return
+        with self._lock:
+            self._stats["rejected"] += 1
+            wait = max(0.0, (self._next_probe or self._clock()) - self._clock())
+        raise DatabaseUnavailable(f"banco indisponível: {self._last_error}", retry_after=max(1.0, wait))
+
+    def record_success(self) -> None:
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+
+    def record_failure(self, exc: BaseException) -> None:
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(exc)
+            trip = self.state == "closed" and self._failures >= self.failure_threshold
+        if trip:
+            self.trip(exc)
+
+    def trip(self, exc: BaseException) -> None:
+        """Abre o circuito e inicia a thread de reconexão (se ainda não houver)."""
+        with self._lock:
+            self._last_error = str(exc)
+            if self.state != "closed":
+                return
+            self.state = "open"
+            self._opened_at = self._clock()
+            self._next_probe = self._opened_at + self.backoff
+            self._stats["trips"] += 1
+            self.probe_thread = threading.Thread(target=self._probe_loop, name="db-reconnect", daemon=True)
+        logger.error("banco indisponível, circuito aberto: %s", exc)
+        self.probe_thread.start()
+
+    def _probe_loop(self) -> None:
+        delay = self.backoff
+        while True:
+            self._sleep(delay)
+            with self._lock:
+                self.state = "half_open"
+                self._stats["probes"] += 1
+            try:
+                self._reconnect()
+            except Exception as exc:
+                delay = min(delay * 2, self.max_backoff)
+                with self._lock:
+                    self.state = "open"
+                    self._last_error = str(exc)
+                    self._next_probe = self._clock() + delay
+                logger.warning("reconexão ao banco falhou (próxima em %.1fs): %s", delay, exc)
+                continue
+            with self._lock:
+                self.state = "closed"
+                self._failures = 0
+                self._opened_at = self._next_probe = None
+            logger.info("banco de volta, circuito fechado")
+            return
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._opened_at = self._next_probe = self._last_error = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out.update(state=self.state, failures=self._failures, last_error=self._last_error)
+            if self._opened_at is not None:
+                out["open_seconds"] = round(self._clock() - self._opened_at, 1)
+            return out
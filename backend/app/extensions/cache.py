@@ -0,0 +1,481 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.parse
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+# =========================
+# Backends de cache
+# =========================
+# Interface única (get / get_many / set / delete / incr, TTL e tags) para o que
+# a API guarda em cache, com dois backends escolhidos por CACHE_BACKEND:
+# - "local" (padrão): LRU + TTL em memória, um por processo;
+# - "redis": qualquer servidor que fale o protocolo do Redis (CACHE_URL,
+#   ex.: redis://:senha@host:6379/0), compartilhado por todos os workers e
+#   máquinas e que sobrevive a restarts. Cliente próprio (RESP2) sem
+#   dependência nova; com o servidor fora do ar tudo vira miss.
+
+logger = logging.getLogger("app.cache")
+
+
+class CacheBackend(ABC):
+    """
+    Interface dos backends. Valores ausentes ou vencidos voltam como None;
+    `tags` agrupam chaves para `invalidate`. `shared` diz se o cache é visto
+    por outros processos. Backend sem algum dos métodos não pode ser criado.
+    """
+
+    shared = False
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many(self, keys: Sequence[Hashable]) -> Dict[Hashable, Any]:
+        """Só as chaves encontradas."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = (), ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, *keys: Hashable) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def incr(self, key: Hashable, delta: int = 1, ttl: Optional[float] = None) -> int:
+        """Contador atômico (começa em 0); `ttl` só na criação."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def invalidate(self, *tags: str) -> int:
+        """Remove as entradas com qualquer uma das tags; devolve quantas saíram."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Esvazia o cache e zera as métricas."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def metrics(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class LocalCache(CacheBackend):
+    """LRU + TTL com tags em memória; thread-safe."""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # chave -> (valor, expira_em, tags)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        self._reset_metrics()
+
+    def _reset_metrics(self) -> None:
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    # internos (chamados com _lock)
+    def _drop(self, key: Hashable) -> None:
+        _value, _expires, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= self._clock():
+            self._drop(key)
+            self._stats["expirations"] += 1
+            entry = None
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return entry[0]
+
+    def _store(self, key: Hashable, value: Any, tags: Tuple[str, ...], expires: float) -> None:
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, expires, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            return self._lookup(key)
+
+    def get_many(self, keys: Sequence[Hashable]) -> Dict[Hashable, Any]:
+        with self._lock:
+            found = {key: self._lookup(key) for key in keys}
+        return {k: v for k, v in found.items() if v is not None}
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = (), ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._store(key, value, tuple(tags), self._clock() + ttl)
+            self._stats["stores"] += 1
+
+    def delete(self, *keys: Hashable) -> int:
+        with self._lock:
+            found = [k for k in keys if k in self._entries]
+            for key in found:
+                self._drop(key)
+            return len(found)
+
+    def incr(self, key: Hashable, delta: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self._clock():
+                value, expires, tags = 0, self._clock() + (self.ttl if ttl is None else ttl), ()
+            else:
+                value, expires, tags = entry
+            value = int(value) + delta
+            self._store(key, value, tags, expires)
+            return value
+
+    def invalidate(self, *tags: str) -> int:
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._drop(key)
+            self._stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._reset_metrics()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out.update(backend="local", size=len(self._entries), max=self.max_entries, ttl=self.ttl)
+            return out
+
+
+# -------------------------
+# protocolo do Redis (RESP2)
+# -------------------------
+class RedisError(Exception):
+    """Resposta de erro (-ERR ...) do servidor."""
+
+
+class _RedisConnection:
+    def __init__(self, host: str, port: int, timeout: float, password: Optional[str], db: int):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self.sock.makefile("rb")
+        try:
+            if password:
+                self.execute([("AUTH", password)])
+            if db:
+                self.execute([("SELECT", db)])
+        except Exception:
+            self.close()
+            raise
+
+    @staticmethod
+    def _encode(args: Sequence[Any]) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _read(self) -> Any:
+        line = self._file.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("conexão com o cache fechada")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self._file.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise ConnectionError(f"resposta inválida do cache: {line!r}")
+
+    def execute(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """Manda os comandos de uma vez (pipeline) e lê as respostas em ordem."""
+        self.sock.sendall(b"".join(self._encode(c) for c in commands))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def close(self) -> None:
+        try:
+            self._file.close()
+            self.sock.close()
+        except Exception:
+            pass
+
+
+# invalidação atômica: ler os membros e apagar, numa única operação no servidor,
+# para um `set` concorrente não entrar num SET de tag que será apagado sem
+# ter a entrada apagada junto (ela ficaria impossível de invalidar)
+_INVALIDATE_SCRIPT = """
+local n = 0
+for _, tag in ipairs(KEYS) do
+  for _, name in ipairs(redis.call('SMEMBERS', tag)) do
+    n = n + redis.call('DEL', name)
+  end
+  redis.call('DEL', tag)
+end
+return n
+"""
+
+
+class RedisCache(CacheBackend):
+    """
+    Backend no Redis (ou compatível). Layout, tudo sob `prefix`:
+    - `<prefix><chave>`: valor com PX = ttl, sem pickle (quem consegue
+      escrever no Redis não pode executar código nos processos da API):
+      `R<mimetype>\0<corpo>` para respostas prontas `(bytes, str)`,
+      `J<json>` para os demais valores (tuplas voltam como listas) e o
+      inteiro em texto para os contadores do `incr`;
+    - `<prefix>tag:<tag>`: SET com as chaves da tag.
+    Falha de conexão ou erro do servidor (NOAUTH, READONLY depois de um
+    failover, OOM, LOADING...) vira miss e desliga o backend por
+    `retry_after` s: cache com problema nunca derruba o request.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        url: str,
+        prefix: str = "adoptme:",
+        ttl: float = 60.0,
+        timeout: float = 0.25,
+        retry_after: float = 1.0,
+        max_idle: int = 8,
+    ):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = urllib.parse.unquote(parsed.password) if parsed.password else None
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle: List[_RedisConnection] = []
+        self._down_until = 0.0
+        self._reset_metrics()
+
+    def _reset_metrics(self) -> None:
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0, "errors": 0}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def _key(self, key: Hashable) -> str:
+        return f"{self.prefix}{key}"
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    def _ms(self, ttl: Optional[float]) -> int:
+        return max(1, int((self.ttl if ttl is None else ttl) * 1000))
+
+    def _execute(self, commands: Sequence[Sequence[Any]]) -> Optional[List[Any]]:
+        """Pipeline numa conexão do pool; None com o servidor indisponível."""
+        if time.monotonic() < self._down_until:
+            return None
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        try:
+            if conn is None:
+                conn = _RedisConnection(self.host, self.port, self.timeout, self.password, self.db)
+            replies = conn.execute(commands)
+        except (OSError, ConnectionError, RedisError) as exc:
+            if conn is not None:
+                conn.close()
+            self._count("errors")
+            self._down_until = time.monotonic() + self.retry_after
+            logger.warning("cache %s:%s indisponível: %s", self.host, self.port, exc)
+            return None
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+        return replies
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        if (
+            isinstance(value, tuple) and len(value) == 2
+            and isinstance(value[0], bytes) and isinstance(value[1], str) and "\0" not in value[1]
+        ):
+            return b"R" + value[1].encode() + b"\0" + value[0]
+        return b"J" + json.dumps(value, separators=(",", ":")).encode()
+
+    @staticmethod
+    def _decode(data: Optional[bytes]) -> Any:
+        if data is None:
+            return None
+        kind = data[:1]
+        if kind == b"R":
+            mimetype, _, body = data[1:].partition(b"\0")
+            return body, mimetype.decode()
+        if kind == b"J":
+            return json.loads(data[1:])
+        return int(data)  # contador do incr
+
+    def get(self, key: Hashable) -> Any:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Sequence[Hashable]) -> Dict[Hashable, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        replies = self._execute([("MGET", *(self._key(k) for k in keys))])
+        values = replies[0] if replies else [None] * len(keys)
+        found = {}
+        for k, v in zip(keys, values):
+            if v is None:
+                continue
+            try:
+                found[k] = self._decode(v)
+            except ValueError:
+                logger.warning("cache: valor ilegível em %s, ignorado", self._key(k))
+        self._count("hits", len(found))
+        self._count("misses", len(keys) - len(found))
+        return found
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = (), ttl: Optional[float] = None) -> None:
+        name, ms = self._key(key), self._ms(ttl)
+        try:
+            data = self._encode(value)
+        except (TypeError, ValueError) as exc:
+            logger.warning("cache: valor de %s não serializável, não guardado: %s", name, exc)
+            return
+        commands: List[Tuple[Any, ...]] = [("SET", name, data, "PX", ms)]
+        for tag in tags:
+            # a tag vive pelo menos tanto quanto a entrada mais nova dela
+            commands += [("SADD", self._tag(tag), name), ("PEXPIRE", self._tag(tag), ms)]
+        if self._execute(commands) is not None:
+            self._count("stores")
+
+    def delete(self, *keys: Hashable) -> int:
+        if not keys:
+            return 0
+        replies = self._execute([("DEL", *(self._key(k) for k in keys))])
+        return int(replies[0]) if replies else 0
+
+    def incr(self, key: Hashable, delta: int = 1, ttl: Optional[float] = None) -> int:
+        name = self._key(key)
+        replies = self._execute([("INCRBY", name, delta)])
+        if not replies:
+            raise ConnectionError(f"cache {self.host}:{self.port} indisponível")
+        value = int(replies[0])
+        if value == delta:  # acabou de ser criado
+            self._execute([("PEXPIRE", name, self._ms(ttl))])
+        return value
+
+    def invalidate(self, *tags: str) -> int:
+        if not tags:
+            return 0
+        replies = self._execute([("EVAL", _INVALIDATE_SCRIPT, len(tags), *(self._tag(t) for t in tags))])
+        if replies is None:
+            return 0
+        n = int(replies[0])
+        self._count("invalidations", n)
+        return n
+
+    def clear(self) -> None:
+        """Apaga tudo sob o prefixo (SCAN + DEL em lotes)."""
+        cursor = b"0"
+        while True:
+            replies = self._execute([("SCAN", cursor, "MATCH", f"{self.prefix}*", "COUNT", 500)])
+            if replies is None:
+                return
+            cursor, names = replies[0]
+            if names:
+                self._execute([("DEL", *names)])
+            if cursor in (b"0", "0"):
+                return
+
+    def reset(self) -> None:
+        self.clear()
+        with self._lock:
+            self._reset_metrics()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+        out.update(backend="redis", server=f"{self.host}:{self.port}/{self.db}", ttl=self.ttl)
+        return out
+
+
+def make_backend(namespace: str, max_entries: int = 512, ttl: float = 60.0) -> CacheBackend:
+    """
+    Backend configurado no ambiente: CACHE_BACKEND=local (padrão) ou redis
+    (CACHE_URL, CACHE_PREFIX; `namespace` separa os usos dentro do prefixo).
+    """
+    kind = (os.getenv("CACHE_BACKEND") or "local").strip().lower()
+    if kind == "local":
+        return LocalCache(max_entries=max_entries, ttl=ttl)
+    if kind == "redis":
+        return RedisCache(
+            os.getenv("CACHE_URL") or "redis://127.0.0.1:6379/0",
+            prefix=(os.getenv("CACHE_PREFIX") or "adoptme:") + namespace,
+            ttl=ttl,
+            timeout=float(os.getenv("CACHE_TIMEOUT") or 0.25),
+        )
+    raise RuntimeError(f"CACHE_BACKEND desconhecido: {kind!r} (use local ou redis)")
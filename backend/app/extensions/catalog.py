@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from .cache import CacheBackend, make_backend
+
+# Versão do catálogo de animais: incrementada a cada escrita em `animais`
+# (insert, update, delete, adoção). Estruturas derivadas do catálogo
+# (ex.: índice de features do recomendador) comparam a versão que usaram
+# com a atual para saber se precisam ser reconstruídas.
+#
+# A versão local é um contador do processo. Entre processos (workers do
+# gunicorn, outras máquinas) vale a tabela `catalog_version`, incrementada na
+# mesma transação de cada escrita (`bump_in_transaction`); cada processo a
+# acompanha com um `VersionWatcher` (LISTEN/NOTIFY no Postgres, polling curto
+# nos demais) e, quando outro processo escreveu, avisa os ouvintes com uma
+# alteração sem detalhes (tudo é invalidado).
+_version: int = 0
+_lock = threading.Lock()
+# identifica este processo nas tags de versão enquanto a versão compartilhada
+# não é conhecida: a "versão 3" local de um worker não é a de outro
+_epoch = os.urandom(4).hex()
+# última versão de `catalog_version` conhecida e a versão local em que o
+# processo ficou sincronizado com ela (-1: não sincronizado)
+_shared_version: Optional[int] = None
+_synced_at: int = -1
+
+logger = logging.getLogger("app.catalog")
+
+# Ouvintes chamados a cada alteração: fn(evento, animal_id, linha, nova_versão).
+# Eventos: "insert", "update", "delete", "adopt", None (alteração sem detalhes)
+# ou REMOTE (escrita de outro processo, vista pelo VersionWatcher; também sem
+# detalhes, mas caches compartilhados já foram invalidados por quem escreveu).
+REMOTE = "remote"
+Listener = Callable[[Optional[str], Any, Optional[Dict[str, Any]], int], None]
+_listeners: List[Listener] = []
+
+
+def current_version() -> int:
+    """Versão atual do catálogo."""
+    return _version
+
+
+def version_tag() -> str:
+    """
+    Versão atual como texto opaco para ETags: `g<versão compartilhada>` com o
+    processo sincronizado (vale em qualquer worker), senão `<epoch>.<versão local>`.
+    """
+    if _synced_at == _version and _shared_version is not None:
+        return f"g{_shared_version}"
+    return f"{_epoch}.{_version}"
+
+
+def subscribe(fn: Listener) -> None:
+    """Registra um ouvinte de alterações do catálogo."""
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def _advance(event: Optional[str], animal_id: Any, row: Optional[Dict[str, Any]], db_version: Optional[int], sync: bool) -> int:
+    """Incrementa a versão local e avisa os ouvintes (chamar com _lock)."""
+    global _version, _shared_version, _synced_at
+    _version += 1
+    version = _version
+    for fn in list(_listeners):
+        try:
+            fn(event, animal_id, row, version)
+        except Exception:
+            logger.exception("catalog listener failed for %s %s", event, animal_id)
+    if db_version is not None:
+        _shared_version = db_version
+        if sync:
+            _synced_at = version
+    return version
+
+
+def animal_changed(
+    event: Optional[str],
+    animal_id: Any = None,
+    row: Optional[Dict[str, Any]] = None,
+    db_version: Optional[int] = None,
+) -> int:
+    """
+    Registra uma escrita em `animais` (chamar depois do commit) e avisa os
+    ouvintes, em ordem de versão. Falha de ouvinte é só logada: a escrita já
+    foi feita e o ouvinte deve se invalidar sozinho.
+    `db_version`: a versão que a escrita gravou em `catalog_version`. Se ela
+    pulou versões (outro processo escreveu antes e o watcher ainda não viu), a
+    alteração vira "sem detalhes" para os ouvintes descartarem tudo.
+    """
+    with _lock:
+        if db_version is None or _shared_version is None:
+            return _advance(event, animal_id, row, db_version, sync=False)
+        if db_version <= _shared_version:
+            return _version  # o watcher já viu esta escrita e invalidou tudo
+        synced = _synced_at == _version
+        if db_version != _shared_version + 1:
+            event, animal_id, row = None, None, None
+            synced = True
+        return _advance(event, animal_id, row, db_version, sync=synced)
+
+
+def bump(db_version: Optional[int] = None) -> int:
+    """Registra uma alteração no catálogo (sem detalhes) e devolve a nova versão."""
+    return animal_changed(None, db_version=db_version)
+
+
+def observe(db_version: int) -> bool:
+    """
+    Versão lida de `catalog_version` (polling ou NOTIFY). Se outro processo
+    escreveu (ou este processo ainda não estava sincronizado), os ouvintes
+    recebem uma alteração sem detalhes. True se houve invalidação.
+    """
+    with _lock:
+        if _shared_version is not None and db_version <= _shared_version and (
+            _synced_at == _version or db_version < _shared_version
+        ):
+            return False
+        _advance(REMOTE, None, None, db_version, sync=True)
+        return True
+
+
+def shared_version_unchanged() -> bool:
+    """True se o processo está sincronizado e `catalog_version` continua igual (lê o banco)."""
+    if _synced_at != _version or _shared_version is None:
+        return False
+    try:
+        return read_shared_version() == _shared_version
+    except Exception:
+        return False
+
+
+# =========================
+# Versão compartilhada (tabela catalog_version)
+# =========================
+CHANNEL = "catalog_version"
+
+
+def _row_version(row: Any) -> Optional[int]:
+    if isinstance(row, dict):
+        value = row.get("version")
+    elif row:
+        value = row[0]
+    else:
+        value = None
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def bump_in_transaction(cur) -> Optional[int]:
+    """
+    Incrementa `catalog_version` com o cursor da escrita em `animais`, na mesma
+    transação (confirmada ou desfeita junto com ela); no Postgres também faz o
+    NOTIFY, entregue só no commit. Devolve a nova versão (None se o cursor não
+    devolveu uma linha reconhecível). Passar o resultado para `animal_changed`.
+    """
+    from . import db as db_ext
+
+    cur.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+    version = _row_version(cur.fetchone())
+    if version is not None and db_ext.using_postgres():
+        cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, str(version)))
+    return version
+
+
+def read_shared_version() -> Optional[int]:
+    """Versão atual de `catalog_version` (leitura no primário)."""
+    from . import db as db_ext
+
+    with db_ext.db(readonly=True, replica=False) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+            return _row_version(cur.fetchone())
+        finally:
+            cur.close()
+
+
+class VersionWatcher:
+    """
+    Thread do processo que acompanha `catalog_version` e chama `observe`:
+    - Postgres: LISTEN no canal `catalog_version` numa conexão própria (a
+      invalidação chega no commit de quem escreveu), com uma leitura a cada
+      `safety_interval` s por garantia;
+    - SQLite / MySQL: leitura da tabela a cada `interval` s.
+    Falhas (banco fora do ar, migração ainda não aplicada) não param a thread:
+    ela tenta de novo com espera crescente, até `max_backoff` s.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        safety_interval: float = 5.0,
+        read: Callable[[], Optional[int]] = read_shared_version,
+        listen: Optional[Callable[[], Any]] = None,
+        max_backoff: float = 30.0,
+    ):
+        self.interval = interval
+        self.safety_interval = safety_interval
+        self.max_backoff = max_backoff
+        self._read = read
+        self._listen = listen
+        self._stop = threading.Event()
+        self._failing = False
+        self.thread: Optional[threading.Thread] = None
+        self.stats = {"polls": 0, "notifies": 0, "invalidations": 0, "errors": 0}
+
+    def poll(self) -> bool:
+        self.stats["polls"] += 1
+        version = self._read()
+        self._failing = False
+        return version is not None and self._observe(version)
+
+    def _observe(self, version: int) -> bool:
+        changed = observe(version)
+        if changed:
+            self.stats["invalidations"] += 1
+        return changed
+
+    def _failed(self, exc: Exception) -> None:
+        self.stats["errors"] += 1
+        # banco fora do ar: loga a primeira falha da sequência, não uma a cada intervalo
+        log = logger.debug if self._failing else logger.warning
+        log("catalog_version: falha ao acompanhar a versão: %s", exc)
+        self._failing = True
+
+    def start(self) -> "VersionWatcher":
+        try:
+            self.poll()  # sincroniza antes do primeiro request ser atendido
+        except Exception as exc:
+            # segue sem sincronizar (ETags por processo); a thread tenta de novo
+            self._failed(exc)
+        self.thread = threading.Thread(target=self._run, name="catalog-version", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        conn = None
+        backoff = self.interval
+        while not self._stop.is_set():
+            if self._failing:
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                if self._stop.is_set():
+                    break
+            else:
+                backoff = self.interval
+            try:
+                if self._listen is None:
+                    self._stop.wait(self.interval)
+                    self.poll()
+                    continue
+                if conn is None:
+                    conn = self._listen()
+                    self.poll()  # o que foi escrito enquanto não havia LISTEN
+                self._wait_notify(conn)
+            except Exception as exc:
+                self._failed(exc)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+
+    def _wait_notify(self, conn) -> None:
+        import select
+
+        if select.select([conn], [], [], self.safety_interval) == ([], [], []):
+            self.poll()
+            return
+        conn.poll()
+        latest = None
+        while conn.notifies:
+            note = conn.notifies.pop(0)
+            self.stats["notifies"] += 1
+            try:
+                latest = max(latest or 0, int(note.payload))
+            except (TypeError, ValueError):
+                latest = latest or 0
+        if latest:
+            self._observe(latest)
+
+
+_watcher: Optional[VersionWatcher] = None
+_watcher_pid: Optional[int] = None
+
+
+def watch_enabled() -> bool:
+    return (os.getenv("CATALOG_WATCH") or "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def ensure_watcher() -> Optional[VersionWatcher]:
+    """
+    Inicia o watcher deste processo (uma vez por pid: depois do fork do
+    gunicorn cada worker precisa da sua thread). Sem a tabela ou sem banco, a
+    thread sobe assim mesmo e continua tentando.
+    """
+    global _watcher, _watcher_pid
+    if _watcher_pid == os.getpid():
+        return _watcher
+    with _lock:
+        if _watcher_pid == os.getpid():
+            return _watcher
+        _watcher_pid = os.getpid()
+    from . import db as db_ext
+
+    watcher = VersionWatcher(
+        interval=float(os.getenv("CATALOG_POLL_INTERVAL") or 0.5),
+        listen=(lambda: db_ext.pg_listen_connection(CHANNEL)) if db_ext.using_postgres() else None,
+    )
+    try:
+        _watcher = watcher.start()
+    except Exception as exc:
+        logger.warning("catalog_version: watcher não iniciou, tentando no próximo request: %s", exc)
+        _watcher, _watcher_pid = None, None
+    return _watcher
+
+
+def init_app(app) -> None:
+    """Inicia o watcher no primeiro request de cada processo (fora dos testes)."""
+
+    @app.before_request
+    def _catalog_watch():
+        if watch_enabled() and not app.testing:
+            ensure_watcher()
+
+
+# Versão do perfil de adotante de cada usuário: coluna `perfil_adotante.versao`
+# (migração 5), incrementada pelo próprio upsert do perfil. Fica no banco, e
+# não num contador do processo, porque entra nas ETags das recomendações, que
+# valem em qualquer worker depois de sincronizado (`g<versão>`).
+#
+# Com backend compartilhado (CACHE_BACKEND=redis) a versão lida fica em cache
+# por usuário e o upsert a apaga depois do commit (`profile_changed`), então
+# um 304 de /recomendacoes não vai ao banco. O TTL (PROFILE_VERSION_TTL s,
+# padrão 30) limita o estrago de uma invalidação perdida (Redis fora do ar, ou
+# leitura da versão antiga gravada no cache logo depois do delete). No backend
+# local não há cache: outro worker não veria a invalidação, e cada revalidação
+# custa uma leitura por chave primária.
+_profile_versions: CacheBackend = make_backend(
+    "perfil:", max_entries=4096, ttl=float(os.getenv("PROFILE_VERSION_TTL") or 30)
+)
+
+
+def _read_profile_version(uid: int) -> int:
+    from . import db as db_ext
+
+    with db_ext.db(readonly=True, replica=False) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT versao AS version FROM perfil_adotante WHERE usuario_id = %s", (uid,))
+            return _row_version(cur.fetchone()) or 0
+        finally:
+            cur.close()
+
+
+def profile_version(uid: int) -> int:
+    """Versão atual do perfil de `uid` (0 sem perfil; cache compartilhado ou primário)."""
+    if not _profile_versions.shared:
+        return _read_profile_version(uid)
+    cached = _profile_versions.get(uid)
+    if cached is not None:
+        return int(cached)
+    version = _read_profile_version(uid)
+    _profile_versions.set(uid, version)
+    return version
+
+
+def profile_changed(uid: int) -> None:
+    """Upsert do perfil de `uid` confirmado: descarta a versão em cache."""
+    if _profile_versions.shared:
+        _profile_versions.delete(uid)
@@ -1,9 +1,30 @@
 ﻿from __future__ import annotations
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import re
 import sqlite3
+import threading
+import time
 import urllib.parse
+import weakref
 from contextlib import contextmanager
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Tuple
+
+from .breaker import CircuitBreaker, DatabaseUnavailable  # noqa: F401  (reexportado)
+from .pool import BlockingPool, PoolTimeoutError  # noqa: F401  (reexportado)
+from .statements import (  # noqa: F401  (reexportados)
+    Statement,
+    prepared,
+    record as _record_statement,
+    reset_statement_metrics,
+    statement_metrics,
+)
 
 # MySQL imports
 try:
@@ -21,7 +42,6 @@ _pg_pool = None
 _pg_extras = None
 try:
     import psycopg2
-    from psycopg2.pool import ThreadedConnectionPool
     from psycopg2 import extras as _pg_extras
     _psycopg2 = psycopg2
 except Exception:
@@ -29,11 +49,13 @@ except Exception:
 
 # globals
 _mysql_pool: Optional["MySQLConnectionPool"] = None
-_pg_pool: Optional["ThreadedConnectionPool"] = None
+_pg_pool: Optional[BlockingPool] = None
 _using_postgres: bool = False
 _using_sqlite: bool = False
 _sqlite_path: Optional[str] = None
 
+logger = logging.getLogger("app.db")
+
 
 def using_postgres() -> bool:
     return _using_postgres
@@ -44,31 +66,359 @@ def using_sqlite() -> bool:
     return _using_sqlite
 
 
+# --- instrumentação por request
+# Cada statement executado pelos cursores daqui (SQL normalizado, nº de
+# parâmetros, duração, linhas lidas) vai para um coletor em flask.g. No fim do
+# request um resumo é logado em "app.db.queries"; muitas queries no request, ou
+# o mesmo statement repetido várias vezes (padrão N+1), geram um warning.
+_QUERIES = "_db_queries"
+query_logger = logging.getLogger("app.db.queries")
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_PG_PARAM = re.compile(r"\$\d+")
+_SQL_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SQL_SPACES = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """SQL sem literais e com espaços colapsados: `WHERE id = ?`, `IN (...)`."""
+    out = _SQL_PG_PARAM.sub("?", _SQL_STRING.sub("?", str(sql)))
+    out = _SQL_NUMBER.sub("?", out).replace("%s", "?")
+    out = _SQL_IN_LIST.sub("(...)", out)
+    return _SQL_SPACES.sub(" ", out).strip()
+
+
+def query_log_enabled() -> bool:
+    return (os.getenv("DB_QUERY_LOG") or "1").strip().lower() not in ("0", "false", "no")
+
+
+class QueryRecord:
+    """Um statement executado no request."""
+
+    __slots__ = ("sql", "params", "seconds", "rows")
+
+    def __init__(self, sql: str, params: int, seconds: float):
+        self.sql = sql
+        self.params = params
+        self.seconds = seconds
+        self.rows = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"sql": self.sql, "params": self.params, "ms": round(self.seconds * 1000, 3), "rows": self.rows}
+
+
+def _param_count(params: Any) -> int:
+    if params is None:
+        return 0
+    try:
+        return len(params)
+    except TypeError:
+        return 1
+
+
+def _query_collector() -> Optional[list]:
+    if not query_log_enabled():
+        return None
+    try:
+        from flask import g, has_request_context
+    except Exception:
+        return None
+    if not has_request_context():
+        return None
+    queries = g.get(_QUERIES)
+    if queries is None:
+        queries = []
+        setattr(g, _QUERIES, queries)
+    return queries
+
+
+def _record_query(
+    sql: Any, params: Any, seconds: float, prepared_now: bool = False, failed: bool = False
+) -> Optional[QueryRecord]:
+    """
+    Registra o statement no coletor do request (e nas métricas, se for
+    Statement). `failed`: o statement levantou erro (timeout, sintaxe...); não
+    vai para o slow query log, o tempo dele não é o do plano.
+    """
+    if isinstance(sql, Statement):
+        _record_statement(sql, seconds, prepared_now)
+    if not failed and seconds * 1000 >= _slow_threshold_ms() > 0:
+        _on_slow_query(sql, params, seconds)
+    queries = _query_collector()
+    if queries is None:
+        return None
+    rec = QueryRecord(normalize_sql(sql), _param_count(params), seconds)
+    queries.append(rec)
+    return rec
+
+
+def request_queries() -> List[QueryRecord]:
+    """Statements executados até agora no request atual."""
+    try:
+        from flask import g, has_request_context
+    except Exception:
+        return []
+    return list(g.get(_QUERIES) or []) if has_request_context() else []
+
+
+def log_request_queries(exc: Optional[BaseException] = None) -> None:
+    """Loga o resumo de queries do request (registrado no teardown pelo init_db)."""
+    try:
+        from flask import g, has_request_context, request
+    except Exception:
+        return
+    if not has_request_context():
+        return
+    queries = g.pop(_QUERIES, None)
+    if not queries:
+        return
+    total = sum(q.seconds for q in queries)
+    slowest = max(queries, key=lambda q: q.seconds)
+    endpoint = f"{request.method} {request.path}"
+    query_logger.info(
+        "%s: %d queries, %.1f ms no banco; mais lenta %.1f ms: %s",
+        endpoint, len(queries), total * 1000, slowest.seconds * 1000, slowest.sql,
+    )
+
+    max_queries = int(os.getenv("DB_QUERY_WARN_COUNT", "10"))
+    if len(queries) > max_queries:
+        query_logger.warning(
+            "%s executou %d queries (limite DB_QUERY_WARN_COUNT=%d)", endpoint, len(queries), max_queries
+        )
+    repeat_limit = int(os.getenv("DB_QUERY_REPEAT_WARN", "5"))
+    counts: Dict[str, int] = {}
+    for q in queries:
+        counts[q.sql] = counts.get(q.sql, 0) + 1
+    for sql, n in counts.items():
+        if n >= repeat_limit:
+            query_logger.warning("%s: possível N+1, %d execuções de: %s", endpoint, n, sql)
+
+
+# --- slow query log
+# Statements acima de DB_SLOW_QUERY_MS vão para um log local rotativo (JSON por
+# linha) com SQL normalizado, formato dos parâmetros (tipos, nunca valores) e o
+# plano do banco. O EXPLAIN roda em background, para não mexer no
+# cursor/transação de quem executou, e no máximo uma vez por fingerprint a
+# cada DB_SLOW_QUERY_INTERVAL s (as demais ocorrências só contam). As capturas
+# passam por uma fila limitada (DB_SLOW_QUERY_QUEUE, padrão 32; cheia, a
+# captura é descartada) atendida por uma única thread, e cada EXPLAIN abre uma
+# conexão avulsa com timeout curto: o banco lento é justamente quando os
+# requests mais precisam das conexões do pool. Statements que falharam
+# (timeout, erro) não são capturados.
+slow_logger = logging.getLogger("app.db.slow")
+slow_logger.propagate = False
+_slow_lock = threading.Lock()
+_slow_seen: Dict[str, Dict[str, Any]] = {}
+_slow_handler: Optional[logging.Handler] = None
+_slow_in_background = True
+_slow_queue: Optional["queue.Queue"] = None
+_slow_worker_pid: Optional[int] = None
+_slow_stats = {"captured": 0, "dropped": 0}
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+
+def _slow_threshold_ms() -> float:
+    """DB_SLOW_QUERY_MS (padrão 500); 0 desliga."""
+    try:
+        return float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+    except ValueError:
+        return 0.0
+
+
+def _param_shapes(params: Any) -> List[str]:
+    if params is None:
+        return []
+    if not isinstance(params, (list, tuple)):
+        params = [params]
+    out = []
+    for p in params:
+        if isinstance(p, (str, bytes)):
+            out.append(f"{type(p).__name__}[{len(p)}]")
+        else:
+            out.append(type(p).__name__)
+    return out
+
+
+def _ensure_slow_handler() -> None:
+    global _slow_handler
+    path = os.getenv("DB_SLOW_QUERY_LOG") or "slow_queries.log"
+    with _slow_lock:
+        if _slow_handler is not None and getattr(_slow_handler, "baseFilename", None) == os.path.abspath(path):
+            return
+        if _slow_handler is not None:
+            slow_logger.removeHandler(_slow_handler)
+            _slow_handler.close()
+        handler = logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=int(os.getenv("DB_SLOW_QUERY_LOG_BYTES", str(5 * 1024 * 1024))),
+            backupCount=int(os.getenv("DB_SLOW_QUERY_LOG_BACKUPS", "3")),
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        slow_logger.addHandler(handler)
+        slow_logger.setLevel(logging.INFO)
+        _slow_handler = handler
+
+
+def _on_slow_query(sql: Any, params: Any, seconds: float) -> None:
+    normalized = normalize_sql(sql)
+    if normalized[:7].upper() == "EXPLAIN":
+        return  # o próprio EXPLAIN da captura
+    fingerprint = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+    interval = float(os.getenv("DB_SLOW_QUERY_INTERVAL", "300"))
+    now = time.monotonic()
+    with _slow_lock:
+        seen = _slow_seen.setdefault(fingerprint, {"last": None, "suppressed": 0})
+        if seen["last"] is not None and now - seen["last"] < interval:
+            seen["suppressed"] += 1
+            return
+        seen["last"] = now
+        suppressed, seen["suppressed"] = seen["suppressed"], 0
+
+    entry = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "fingerprint": fingerprint,
+        "ms": round(seconds * 1000, 1),
+        "sql": normalized,
+        "params": _param_shapes(params),
+        "suppressed": suppressed,
+    }
+    job = functools.partial(_write_slow_entry, str(sql), params, entry)
+    if not _slow_in_background:
+        job()
+        return
+    try:
+        _slow_jobs().put_nowait(job)
+    except queue.Full:
+        with _slow_lock:
+            _slow_stats["dropped"] += 1
+
+
+def _slow_jobs() -> "queue.Queue":
+    """Fila das capturas, com a thread que a atende (uma por processo)."""
+    global _slow_queue, _slow_worker_pid
+    with _slow_lock:
+        if _slow_worker_pid != os.getpid():
+            _slow_queue = queue.Queue(maxsize=max(1, int(os.getenv("DB_SLOW_QUERY_QUEUE", "32"))))
+            threading.Thread(target=_slow_worker, args=(_slow_queue,), name="slow-query-explain", daemon=True).start()
+            _slow_worker_pid = os.getpid()
+        return _slow_queue
+
+
+def _slow_worker(jobs: "queue.Queue") -> None:
+    while True:
+        job = jobs.get()
+        try:
+            job()
+        except Exception:
+            logger.warning("falha na captura de slow query", exc_info=True)
+
+
+def _explain_conn():
+    """Conexão avulsa (fora do pool dos requests) para o EXPLAIN, com timeout curto."""
+    timeout = float(os.getenv("DB_SLOW_QUERY_CONNECT_TIMEOUT", "2"))
+    if _using_sqlite:
+        # sem pool por thread: a thread da captura não deixa conexões para trás
+        return _SQLiteConnectionWrapper(_sqlite_path, readonly=True, pragmas=sqlite_pragmas())
+    if _using_postgres:
+        return _psycopg2.connect((os.getenv("DATABASE_URL") or "").strip(), connect_timeout=max(1, int(timeout)))
+    return mysql_connect(**_mysql_params(timeout))
+
+
+def _explain(sql: str, params: Any) -> Tuple[str, Any]:
+    """(dialeto, plano) do statement, numa conexão avulsa (`_explain_conn`)."""
+    if _using_sqlite:
+        dialect, prefix = "sqlite", "EXPLAIN QUERY PLAN "
+    elif _using_postgres:
+        dialect, prefix = "postgres", "EXPLAIN (FORMAT JSON) "
+    else:
+        dialect, prefix = "mysql", "EXPLAIN FORMAT=JSON "
+    if sql.lstrip().split(None, 1)[0].lower() not in _EXPLAINABLE:
+        return dialect, None
+    raw = _explain_conn()
+    proxy = ConnProxy(raw)
+    try:
+        cur = proxy.cursor()
+        try:
+            cur.execute(prefix + sql, params)
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+    finally:
+        proxy.rollback()
+        raw.close()  # não é do pool: ConnProxy.close devolveria ao pool do Postgres
+    if dialect == "sqlite":
+        return dialect, [" ".join(str(c) for c in tuple(r)[1:]) for r in rows]
+    plan = rows[0][0] if rows else None
+    return dialect, json.loads(plan) if isinstance(plan, str) else plan
+
+
+def _write_slow_entry(sql: str, params: Any, entry: Dict[str, Any]) -> None:
+    try:
+        entry["dialect"], entry["plan"] = _explain(sql, params)
+    except Exception as exc:
+        entry["plan_error"] = str(exc)
+    try:
+        _ensure_slow_handler()
+        slow_logger.info(json.dumps(entry, default=str, ensure_ascii=False))
+        with _slow_lock:
+            _slow_stats["captured"] += 1
+    except Exception:
+        logger.warning("falha ao gravar slow query log", exc_info=True)
+
+
+@functools.lru_cache(maxsize=512)
+def _to_qmark(sql: str) -> str:
+    return sql.replace("%s", "?")
+
+
 class _SQLiteCursorWrapper:
     """Wrapper para cursor SQLite: converte %s -> ? e suporta dictionary=True."""
 
     def __init__(self, cur, dict_mode=False):
         self._cur = cur
         self._dict = dict_mode
+        self._last: Optional[QueryRecord] = None
 
     def execute(self, sql, params=None):
         if params is None:
             params = ()
-        sql_converted = sql.replace("%s", "?")
-        return self._cur.execute(sql_converted, params)
+        native = sql.for_sqlite() if isinstance(sql, Statement) else _to_qmark(sql)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            out = self._cur.execute(native, params)
+            ok = True
+            return out
+        finally:
+            self._last = _record_query(sql, params, time.perf_counter() - t0, failed=not ok)
 
     def executemany(self, sql, seq_of_params):
-        sql_converted = sql.replace("%s", "?")
-        return self._cur.executemany(sql_converted, seq_of_params)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            out = self._cur.executemany(_to_qmark(sql), seq_of_params)
+            ok = True
+            return out
+        finally:
+            self._last = _record_query(sql, None, time.perf_counter() - t0, failed=not ok)
+
+    def _count(self, n: int) -> None:
+        if self._last is not None:
+            self._last.rows += n
 
     def fetchone(self):
         row = self._cur.fetchone()
         if row is None:
             return None
+        self._count(1)
         return dict(row) if self._dict else row
 
     def fetchall(self):
         rows = self._cur.fetchall()
+        self._count(len(rows))
         return [dict(r) for r in rows] if self._dict else rows
 
     def close(self):
@@ -95,12 +445,57 @@ class _SQLiteCursorWrapper:
         self.close()
 
 
+# --- SQLite: pragmas e pool de conexões por thread
+# Valores padrão pensados para o tier pequeno (um arquivo local, poucos workers):
+# WAL deixa leituras concorrentes com a escrita, synchronous=NORMAL é seguro com WAL.
+_SQLITE_PRAGMA_DEFAULTS = {
+    "journal_mode": ("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": ("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": ("SQLITE_CACHE_SIZE", "-20000"),  # negativo = KiB (~20 MB)
+    "mmap_size": ("SQLITE_MMAP_SIZE", "134217728"),  # 128 MB
+    "busy_timeout": ("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+}
+_SQLITE_WORD_PRAGMAS = ("journal_mode", "synchronous")
+
+
+def sqlite_pragmas() -> Dict[str, str]:
+    """Pragmas aplicados a cada conexão SQLite nova (configuráveis por env)."""
+    out: Dict[str, str] = {}
+    for name, (env, default) in _SQLITE_PRAGMA_DEFAULTS.items():
+        value = (os.getenv(env) or default).strip()
+        # pragmas não aceitam parâmetros: só palavras / inteiros vão para o SQL
+        if name in _SQLITE_WORD_PRAGMAS:
+            if not re.fullmatch(r"[A-Za-z]+", value):
+                raise ValueError(f"{env} inválido: {value!r}")
+        else:
+            value = str(int(value))
+        out[name] = value
+    return out
+
+
+def _apply_sqlite_pragmas(conn: sqlite3.Connection, pragmas: Dict[str, str], readonly: bool) -> None:
+    for name, value in pragmas.items():
+        if name == "journal_mode" and readonly:
+            continue  # modo do arquivo é definido pelas conexões de escrita
+        conn.execute(f"PRAGMA {name} = {value}")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+
+
 class _SQLiteConnectionWrapper:
 
-    def __init__(self, path):
+    def __init__(self, path, readonly=False, pragmas=None, pool=None):
         self._path = path
+        self.readonly = bool(readonly)
+        self._pool = pool
         self._conn = sqlite3.connect(path, check_same_thread=False)
         self._conn.row_factory = sqlite3.Row
+        if pragmas:
+            _apply_sqlite_pragmas(self._conn, pragmas, self.readonly)
+
+    @property
+    def key(self):
+        return (self._path, self.readonly)
 
     def cursor(self, dictionary=False):
         cur = self._conn.cursor()
@@ -119,6 +514,12 @@ class _SQLiteConnectionWrapper:
             pass
 
     def close(self):
+        """Com pool: devolve a conexão para reuso na thread; sem pool: fecha."""
+        if self._pool is not None and self._pool.release(self):
+            return
+        self._close()
+
+    def _close(self):
         try:
             self._conn.close()
         except Exception:
@@ -128,6 +529,182 @@ class _SQLiteConnectionWrapper:
         return getattr(self._conn, item)
 
 
+def _close_quietly(raw: Any) -> None:
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+class _SQLitePool:
+    """
+    Pool de conexões SQLite por thread: cada thread reaproveita as próprias
+    conexões ociosas (sem lock no caminho quente), com um conjunto separado
+    para blocos somente leitura (`PRAGMA query_only`). Blocos aninhados na
+    mesma thread recebem conexões distintas. O pool só guarda referências
+    fracas às conexões abertas: as ociosas de uma thread que terminou somem
+    com o `threading.local` dela e são fechadas pelo `weakref.finalize`.
+    """
+
+    def __init__(self, max_idle_per_thread: Optional[int] = None):
+        self.max_idle = max_idle_per_thread or int(os.getenv("SQLITE_POOL_IDLE", "4"))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open: "weakref.WeakSet[_SQLiteConnectionWrapper]" = weakref.WeakSet()
+        self.stats = {"opened": 0, "reused": 0, "discarded": 0}
+
+    def _idle(self, key) -> list:
+        idle = getattr(self._local, "idle", None)
+        if idle is None:
+            idle = self._local.idle = {}
+        return idle.setdefault(key, [])
+
+    def acquire(self, path: str, readonly: bool = False) -> _SQLiteConnectionWrapper:
+        # :memory: é um banco por conexão: leitura separada não enxergaria os dados
+        readonly = readonly and path != ":memory:"
+        idle = self._idle((path, readonly))
+        if idle:
+            with self._lock:
+                self.stats["reused"] += 1
+            return idle.pop()
+        conn = _SQLiteConnectionWrapper(path, readonly=readonly, pragmas=sqlite_pragmas(), pool=self)
+        weakref.finalize(conn, _close_quietly, conn._conn)
+        with self._lock:
+            self._open.add(conn)
+            self.stats["opened"] += 1
+        return conn
+
+    def release(self, conn: _SQLiteConnectionWrapper) -> bool:
+        """Devolve `conn` à lista ociosa da thread; False se deve ser fechada."""
+        try:
+            conn._conn.rollback()  # descarta transação que ficou aberta
+        except Exception:
+            return self._forget(conn)
+        idle = self._idle(conn.key)
+        if len(idle) >= self.max_idle or conn in idle:
+            return self._forget(conn)
+        idle.append(conn)
+        return True
+
+    def _forget(self, conn: _SQLiteConnectionWrapper) -> bool:
+        with self._lock:
+            self._open.discard(conn)
+            self.stats["discarded"] += 1
+        return False
+
+    def close_all(self) -> None:
+        """Fecha todas as conexões abertas pelo pool (em todas as threads)."""
+        with self._lock:
+            conns, self._open = list(self._open), weakref.WeakSet()
+        for conn in conns:
+            conn._pool = None
+            conn._close()
+        self._local = threading.local()
+
+
+_sqlite_pool = _SQLitePool()
+
+
+# --- réplicas de leitura (DATABASE_REPLICA_URLS)
+class _ReplicaSet:
+    """
+    Réplicas de leitura, escolhidas em round-robin: caminhos de arquivo no
+    SQLite, BlockingPools no Postgres.
+    """
+
+    def __init__(self, targets: List[Any]):
+        self.targets = list(targets)
+        self._next = itertools.count()
+        self.stats = {"checkouts": 0, "fallbacks": 0}
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def pick(self) -> Any:
+        return self.targets[next(self._next) % len(self.targets)]
+
+    def closeall(self) -> None:
+        for target in self.targets:
+            if hasattr(target, "closeall"):
+                try:
+                    target.closeall()
+                except Exception:
+                    pass
+        self.targets = []
+
+
+_replicas: Optional[_ReplicaSet] = None
+
+
+def replica_urls() -> List[str]:
+    """DATABASE_REPLICA_URLS: URLs separadas por vírgula (mesmo banco do primário)."""
+    raw = os.getenv("DATABASE_REPLICA_URLS") or ""
+    return [u.strip() for u in raw.split(",") if u.strip()]
+
+
+def _sqlite_file(url: str) -> str:
+    return url.replace("sqlite:///", "").split("?")[0]
+
+
+def _set_replicas(targets: List[Any]) -> None:
+    global _replicas
+    if _replicas is not None:
+        _replicas.closeall()
+    _replicas = _ReplicaSet(targets) if targets else None
+
+
+def _get_replica_conn() -> Optional[Tuple[Any, Any]]:
+    """
+    (conexão, pool) de uma réplica em round-robin, ou None sem réplicas.
+    Réplica indisponível não derruba a leitura: ela volta para o primário.
+    """
+    replicas = _replicas
+    if not replicas:
+        return None
+    target = replicas.pick()
+    try:
+        if _using_sqlite:
+            conn, pool = _sqlite_pool.acquire(target, readonly=True), None
+        else:
+            conn, pool = target.getconn(), target
+            try:
+                conn.autocommit = True
+            except Exception:
+                pass
+    except Exception:
+        replicas.stats["fallbacks"] += 1
+        logger.warning("réplica indisponível, lendo do primário", exc_info=True)
+        return None
+    replicas.stats["checkouts"] += 1
+    _mark_replica_read()
+    return conn, pool
+
+
+_USED_REPLICA_FLAG = "_db_used_replica"
+
+
+def _mark_replica_read() -> None:
+    try:
+        from flask import g, has_request_context
+    except Exception:
+        return
+    if has_request_context():
+        setattr(g, _USED_REPLICA_FLAG, True)
+
+
+def used_replica() -> bool:
+    """
+    True se o request atual leu de uma réplica. Respostas assim podem estar
+    atrasadas em relação à versão do catálogo (lida no primário) e não devem
+    ir para caches versionados por ela.
+    """
+    try:
+        from flask import g, has_request_context
+    except Exception:
+        return False
+    return has_request_context() and bool(g.get(_USED_REPLICA_FLAG))
+
+
 def init_db(app=None):
     """
     Inicializa pool de conexão:
@@ -135,19 +712,70 @@ def init_db(app=None):
     - Se DATABASE_URL for postgres://, usa pool Postgres (psycopg2).
     - Caso contrário, usa pool MySQL (DB_HOST, DB_PORT, etc.).
     """
-    global _mysql_pool, _pg_pool, _using_postgres, _using_sqlite, _sqlite_path
+    if app is not None:
+        # conexões por request (ver `_request_scope`) voltam ao pool no teardown
+        app.teardown_request(release_request_connections)
+        app.teardown_appcontext(release_request_connections)
+        app.teardown_request(log_request_queries)
+        app.register_error_handler(DatabaseUnavailable, _database_unavailable_response)
+
+        from .migrations import migrate_command
+
+        app.cli.add_command(migrate_command)
 
     database_url = (os.getenv("DATABASE_URL") or "").strip()
-    if os.getenv("PYTEST_CURRENT_TEST") and "postgres" in database_url:
+    if os.getenv("PYTEST_CURRENT_TEST") and any("postgres" in u for u in [database_url, *replica_urls()]):
         raise RuntimeError("Tests cannot use the production database")
 
+    _configure_breaker()
+    try:
+        _connect()
+    except Exception as exc:
+        # banco fora do ar no startup: o app sobe com o circuito aberto e
+        # uma thread em background recria os pools quando ele voltar
+        if not database_url.lower().startswith("sqlite"):
+            _breaker.trip(exc)
+        raise
+    _breaker.reset()
+
+    if (os.getenv("DB_AUTO_MIGRATE") or "").strip().lower() in ("1", "true", "yes"):
+        from .migrations import migrate
+
+        migrate()
+
+
+def _mysql_params(timeout: float) -> Dict[str, Any]:
+    """Parâmetros de conexão MySQL (DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME)."""
+    return dict(
+        host=os.getenv("DB_HOST", "127.0.0.1"),
+        port=int(os.getenv("DB_PORT", "3306")),
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASSWORD", ""),
+        database=os.getenv("DB_NAME", "adoptme"),
+        connection_timeout=timeout, use_pure=True, ssl_disabled=True,
+    )
+
+
+def _connect():
+    """Cria os pools (primário e réplicas) a partir do ambiente; chamado também na reconexão."""
+    global _mysql_pool, _pg_pool, _using_postgres, _using_sqlite, _sqlite_path
+
+    database_url = (os.getenv("DATABASE_URL") or "").strip()
+    replicas = replica_urls()
+    _set_replicas([])
+
     if database_url and database_url.lower().split(":", 1)[0] == "sqlite":
+        if any(u.lower().split(":", 1)[0] != "sqlite" for u in replicas):
+            raise RuntimeError("DATABASE_REPLICA_URLS deve usar o mesmo banco de DATABASE_URL")
         _using_sqlite = True
         _using_postgres = False
-        path = database_url.replace("sqlite:///", "").split("?")[0]
+        path = _sqlite_file(database_url)
+        _sqlite_pool.close_all()
         _sqlite_path = path
+        _set_replicas([_sqlite_file(u) for u in replicas])
         return
 
+    _using_sqlite = False
     pool_size = int(os.getenv("DB_POOL_SIZE", "12"))
     timeout = int(os.getenv("DB_TIMEOUT", "5"))
 
@@ -156,14 +784,31 @@ def init_db(app=None):
         if _psycopg2 is None:
             raise RuntimeError("psycopg2 não instalado. Rode: pip install psycopg2-binary")
 
-        minconn = 1
         maxconn = max(1, pool_size)
+        minconn = min(maxconn, int(os.getenv("DB_POOL_MIN", "1")))
+
+        def make_pool(url: str, size: int) -> BlockingPool:
+            # pool bloqueante: espera até DB_POOL_TIMEOUT s por uma conexão livre
+            return BlockingPool(
+                lambda: _psycopg2.connect(url),
+                maxconn=size,
+                minconn=min(size, minconn),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                idle_timeout=float(os.getenv("DB_POOL_IDLE_SECONDS", "300")),
+                max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            )
 
-        # ThreadedConnectionPool aceita dsn (connection string)
-        global _pg_pool
-        _pg_pool = ThreadedConnectionPool(minconn, maxconn, dsn=database_url)
+        old_pool, _pg_pool = _pg_pool, make_pool(database_url, maxconn)
+        if old_pool is not None and hasattr(old_pool, "closeall"):
+            old_pool.closeall()  # reconexão: conexões do pool antigo não voltam mais
         _using_postgres = True
 
+        # réplicas: um pool por URL, com DB_REPLICA_POOL_SIZE conexões cada
+        if any(u.lower().split(":", 1)[0] == "sqlite" for u in replicas):
+            raise RuntimeError("DATABASE_REPLICA_URLS deve usar o mesmo banco de DATABASE_URL")
+        replica_size = max(1, int(os.getenv("DB_REPLICA_POOL_SIZE", str(maxconn))))
+        _set_replicas([make_pool(u, replica_size) for u in replicas])
+
         # Teste simples de conexão
         conn = _pg_pool.getconn()
         try:
@@ -177,16 +822,7 @@ def init_db(app=None):
         # fallback MySQL (preservado)
         if not _MYSQL_AVAILABLE:
             raise RuntimeError("MySQL não disponível e DATABASE_URL não informada.")
-        host = os.getenv("DB_HOST", "127.0.0.1")
-        port = int(os.getenv("DB_PORT", "3306"))
-        user = os.getenv("DB_USER", "root")
-        password = os.getenv("DB_PASSWORD", "")
-        database = os.getenv("DB_NAME", "adoptme")
-
-        common = dict(
-            host=host, port=port, user=user, password=password, database=database,
-            connection_timeout=timeout, use_pure=True, ssl_disabled=True,
-        )
+        common = _mysql_params(timeout)
 
         # teste direto
         conn = mysql_connect(**common)
@@ -198,7 +834,6 @@ def init_db(app=None):
         finally:
             conn.close()
 
-        global _mysql_pool
         _mysql_pool = MySQLConnectionPool(
             pool_name=os.getenv("DB_POOL_NAME", "adoptme_pool"),
             pool_size=pool_size,
@@ -208,27 +843,32 @@ def init_db(app=None):
         _using_postgres = False
 
 
-def _get_raw_conn():
-    """Retorna a conexÃ£o bruta (psycopg2, mysql connector ou SQLite wrapper)."""
+def _get_raw_conn(readonly: bool = False):
+    """
+    Retorna a conexÃ£o bruta (psycopg2, mysql connector ou SQLite wrapper).
+    `readonly`: conjunto de conexões somente leitura no SQLite, autocommit no Postgres.
+    """
     global _mysql_pool, _pg_pool, _using_postgres, _using_sqlite, _sqlite_path
 
     if _using_sqlite and _sqlite_path:
-        return _SQLiteConnectionWrapper(_sqlite_path)
+        return _sqlite_pool.acquire(_sqlite_path, readonly=readonly)
 
+    _breaker.check()  # circuito aberto: falha na hora, sem esperar o timeout de conexão
     if _using_postgres:
         if _pg_pool is None:
             raise RuntimeError("Pool Postgres nÃ£o inicializado. Chame init_db() primeiro.")
-        conn = _pg_pool.getconn()
-        
+        conn = _checkout(_pg_pool.getconn)
+
         try:
-            conn.autocommit = False
+            # somente leitura: autocommit, sem BEGIN/COMMIT (flag local do psycopg2)
+            conn.autocommit = bool(readonly)
         except Exception:
             pass
         return conn
     else:
         if _mysql_pool is None:
             raise RuntimeError("Pool MySQL nÃ£o inicializado. Chame init_db() primeiro.")
-        conn = _mysql_pool.get_connection()
+        conn = _checkout(_mysql_pool.get_connection)
         # reconectar se necessÃ¡rio
         try:
             if hasattr(conn, "is_connected") and not conn.is_connected():
@@ -241,6 +881,76 @@ def _get_raw_conn():
         return conn
 
 
+# --- circuit breaker
+_breaker = CircuitBreaker(lambda: _connect())
+
+
+def _configure_breaker() -> None:
+    _breaker.failure_threshold = max(1, int(os.getenv("DB_BREAKER_FAILURES", "3")))
+    _breaker.backoff = float(os.getenv("DB_BREAKER_BACKOFF", "1"))
+    _breaker.max_backoff = float(os.getenv("DB_BREAKER_BACKOFF_MAX", "30"))
+
+
+def _checkout(getconn):
+    """Retira uma conexão do pool contabilizando sucesso/falha no circuito."""
+    try:
+        conn = getconn()
+    except PoolTimeoutError:
+        raise  # pool saturado não é banco fora do ar
+    except Exception as exc:
+        _breaker.record_failure(exc)
+        raise DatabaseUnavailable(f"falha ao conectar no banco: {exc}") from exc
+    _breaker.record_success()
+    return conn
+
+
+def breaker_state() -> Dict[str, Any]:
+    """Estado do circuito do banco (closed / open / half_open) e contadores."""
+    return _breaker.snapshot()
+
+
+def _database_unavailable_response(exc: DatabaseUnavailable):
+    from flask import jsonify
+
+    resp = jsonify({"ok": False, "error": "database unavailable"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(int(max(1, round(exc.retry_after))))
+    return resp
+
+
+def pool_metrics() -> Dict[str, Any]:
+    """
+    Contadores do pool Postgres (checkouts, espera, timeouts, em uso/ocioso)
+    e, com réplicas configuradas, os de cada réplica em `replicas`.
+    """
+    out: Dict[str, Any] = {}
+    if _using_postgres and _pg_pool is not None and hasattr(_pg_pool, "metrics"):
+        out = _pg_pool.metrics()
+    if _replicas:
+        out["replicas"] = dict(
+            _replicas.stats,
+            pools=[t.metrics() for t in _replicas.targets if hasattr(t, "metrics")],
+        )
+    return out
+
+
+def pg_listen_connection(channel: str):
+    """
+    Conexão Postgres própria (fora do pool, em autocommit) já em LISTEN no
+    canal `channel`; quem chama fica com ela (ex.: catalog.VersionWatcher).
+    """
+    if _psycopg2 is None:
+        raise RuntimeError("psycopg2 não instalado. Rode: pip install psycopg2-binary")
+    conn = _psycopg2.connect((os.getenv("DATABASE_URL") or "").strip())
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute(f"LISTEN {channel}")
+    finally:
+        cur.close()
+    return conn
+
+
 def get_conn():
     """
     Backwards-compatible: retorna a conexÃ£o crua (psycopg2 connection ou mysql connector connection).
@@ -250,14 +960,145 @@ def get_conn():
     return _get_raw_conn()
 
 
+# --- prepared statements (Postgres / MySQL)
+def prepared_statements_enabled() -> bool:
+    """DB_PREPARED_STATEMENTS=0 desliga (ex.: atrás de PgBouncer em modo transaction)."""
+    return (os.getenv("DB_PREPARED_STATEMENTS") or "1").strip().lower() not in ("0", "false", "no")
+
+
+# nomes já preparados em cada conexão Postgres (PREPARE vale para a sessão inteira)
+_pg_prepared: "weakref.WeakKeyDictionary[Any, set]" = weakref.WeakKeyDictionary()
+
+
+def _pg_prepared_names(raw_conn: Any) -> Optional[set]:
+    try:
+        return _pg_prepared.setdefault(raw_conn, set())
+    except TypeError:  # conexão sem suporte a weakref: executa sem preparar
+        return None
+
+
+class _CursorWrapper:
+    """
+    Cursor Postgres/MySQL: executa `Statement`s do registro como prepared
+    statements (SQL comum passa direto para o cursor do driver) e registra
+    cada execução no coletor do request.
+    """
+
+    def __init__(self, raw_conn: Any, cur: Any, dictionary: bool = False):
+        self._raw = raw_conn
+        self._cur = cur
+        self._plain = cur
+        self._prepared_cur = None
+        self._dict = dictionary
+        self._last: Optional[QueryRecord] = None
+
+    def execute(self, sql, params=None):
+        t0 = time.perf_counter()
+        prepared_now = False
+        ok = False
+        try:
+            if not isinstance(sql, Statement) or not prepared_statements_enabled():
+                self._cur = self._plain
+                out = self._plain.execute(sql, params)
+                ok = True
+                return out
+            if _using_postgres:
+                prepared_now = self._execute_pg(sql, params)
+            else:
+                self._execute_mysql(sql, params)
+            ok = True
+        finally:
+            self._last = _record_query(sql, params, time.perf_counter() - t0, prepared_now, failed=not ok)
+
+    def executemany(self, sql, seq_of_params):
+        self._cur = self._plain
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            out = self._plain.executemany(sql, seq_of_params)
+            ok = True
+            return out
+        finally:
+            self._last = _record_query(sql, None, time.perf_counter() - t0, failed=not ok)
+
+    def _execute_pg(self, stmt: Statement, params) -> bool:
+        self._cur = self._plain
+        names = _pg_prepared_names(self._raw)
+        if names is None:
+            self._plain.execute(stmt, params)
+            return False
+        prepared_now = stmt.name not in names
+        if prepared_now:
+            self._plain.execute(stmt.pg_prepare())
+            names.add(stmt.name)
+        self._plain.execute(stmt.pg_execute(), params)
+        return prepared_now
+
+    def _execute_mysql(self, stmt: Statement, params) -> None:
+        if self._prepared_cur is None:
+            try:
+                self._prepared_cur = self._raw.cursor(prepared=True, dictionary=self._dict)
+            except (TypeError, ValueError):  # driver sem cursor preparado com esse formato
+                self._prepared_cur = False
+        if not self._prepared_cur:
+            self._cur = self._plain
+            self._plain.execute(stmt, params)
+            return
+        self._cur = self._prepared_cur
+        self._prepared_cur.execute(str(stmt), params)
+
+    def _count(self, n: int) -> None:
+        if self._last is not None:
+            self._last.rows += n
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchall(self):
+        rows = self._cur.fetchall()
+        self._count(len(rows or []))
+        return rows
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cur.fetchmany(*args, **kwargs)
+        self._count(len(rows or []))
+        return rows
+
+    def close(self):
+        for cur in (self._plain, self._prepared_cur):
+            if cur:
+                try:
+                    cur.close()
+                except Exception:
+                    pass
+
+    def __iter__(self):
+        for row in self._cur:
+            self._count(1)
+            yield row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __getattr__(self, item):
+        return getattr(self._cur, item)
+
+
 class ConnProxy:
     """
     Pequena wrapper para tornar a API de cursor compatÃ­vel com o cÃ³digo que usa
     conn.cursor(dictionary=True) (MySQL) â€” no Postgres mapeamos para RealDictCursor.
     TambÃ©m expÃµe commit/rollback/close e mantÃ©m referÃªncia ao raw conn e ao pool.
     """
-    def __init__(self, raw_conn: Any):
+    def __init__(self, raw_conn: Any, pool: Any = None):
         self._raw = raw_conn
+        self._pool = pool  # pool de réplica de onde veio a conexão (Postgres)
 
     def cursor(self, *args, **kwargs):
         """
@@ -269,15 +1110,24 @@ class ConnProxy:
             dict_flag = kwargs.pop("dictionary")
         if _using_postgres:
             if dict_flag:
-                return self._raw.cursor(cursor_factory=_pg_extras.RealDictCursor)
-            return self._raw.cursor()
+                cur = self._raw.cursor(cursor_factory=_pg_extras.RealDictCursor)
+            else:
+                cur = self._raw.cursor()
+            return _CursorWrapper(self._raw, cur, dictionary=bool(dict_flag))
         else:
             if dict_flag:
                 kwargs["dictionary"] = True
-            return self._raw.cursor(*args, **kwargs)
+            cur = self._raw.cursor(*args, **kwargs)
+            if _using_sqlite or args or set(kwargs) - {"dictionary"}:
+                return cur  # SQLite traduz statements no próprio wrapper
+            return _CursorWrapper(self._raw, cur, dictionary=bool(dict_flag))
 
     def commit(self):
-        return self._raw.commit()
+        t0 = time.perf_counter()
+        try:
+            return self._raw.commit()
+        finally:
+            _record_query("COMMIT", None, time.perf_counter() - t0)
 
     def rollback(self):
         try:
@@ -293,10 +1143,10 @@ class ConnProxy:
         try:
             if _using_postgres:
                 # devolve para pool
-                global _pg_pool
-                if _pg_pool is not None:
+                pool = self._pool or _pg_pool
+                if pool is not None:
                     try:
-                        _pg_pool.putconn(self._raw)
+                        pool.putconn(self._raw)
                     except Exception:
                         try:
                             self._raw.close()
@@ -320,24 +1170,200 @@ class ConnProxy:
         return self._raw
 
 
+# --- conexão por request (flask.g)
+# Dentro de um request, todos os blocos db() usam a mesma conexão, retirada do
+# pool no primeiro uso e devolvida no teardown. O bloco mais externo faz
+# commit/rollback; blocos aninhados viram SAVEPOINTs.
+_REQUEST_CONNS = "_db_request_conns"
+_REPLICA = "replica"  # chave da conexão de réplica no escopo do request
+
+
+def request_scoped_enabled() -> bool:
+    return (os.getenv("DB_REQUEST_SCOPED") or "1").strip().lower() not in ("0", "false", "no")
+
+
+def _request_scope() -> Optional[Dict[Any, "_ScopedConn"]]:
+    """Conexões do request atual por modo (False, True, "replica"); None fora de um request."""
+    if not request_scoped_enabled():
+        return None
+    try:
+        from flask import g, has_request_context
+    except Exception:
+        return None
+    if not has_request_context():
+        return None
+    scope = g.get(_REQUEST_CONNS)
+    if scope is None:
+        scope = {}
+        setattr(g, _REQUEST_CONNS, scope)
+    return scope
+
+
+class _ScopedConn:
+    """Conexão do request e profundidade atual de blocos db() abertos nela."""
+
+    def __init__(self, raw_conn: Any, readonly: bool = False, pool: Any = None):
+        self.proxy = ConnProxy(raw_conn, pool=pool)
+        self.readonly = readonly
+        self.depth = 0
+
+    def execute(self, sql: str) -> None:
+        cur = self.proxy.cursor()
+        try:
+            cur.execute(sql)
+        finally:
+            try:
+                cur.close()
+            except Exception:
+                pass
+
+
+def release_request_connections(exc: Optional[BaseException] = None) -> None:
+    """Devolve ao pool as conexões do request (registrado nos teardowns do app)."""
+    try:
+        from flask import g, has_app_context
+    except Exception:
+        return
+    if not has_app_context():
+        return
+    g.pop(_USED_REPLICA_FLAG, None)
+    scope = g.pop(_REQUEST_CONNS, None)
+    for sc in (scope or {}).values():
+        try:
+            sc.proxy.rollback()  # nada pendente depois dos blocos; só por segurança
+        finally:
+            sc.proxy.close()
+
+
+def _scoped_conn(scope: Dict[Any, _ScopedConn], readonly: bool, replica: bool) -> _ScopedConn:
+    # leitura reaproveita a conexão de escrita do request, se já houver (read-your-writes)
+    sc = scope.get(False)
+    if sc is not None or not readonly:
+        if sc is None:
+            sc = scope[False] = _ScopedConn(_get_raw_conn())
+        return sc
+    if replica and _replicas:
+        sc = scope.get(_REPLICA)
+        if sc is None:
+            got = _get_replica_conn()
+            if got is not None:
+                sc = scope[_REPLICA] = _ScopedConn(got[0], readonly=True, pool=got[1])
+        if sc is not None:
+            return sc
+    sc = scope.get(True)
+    if sc is None:
+        sc = scope[True] = _ScopedConn(_get_raw_conn(readonly=True), readonly=True)
+    return sc
+
+
 @contextmanager
-def _db_context_manager():
+def _request_block(scope: Dict[Any, _ScopedConn], readonly: bool, replica: bool = False):
+    sc = _scoped_conn(scope, readonly, replica)
+
+    # conexão somente leitura não tem o que desfazer: sem SAVEPOINT nem COMMIT
+    savepoint = f"db_block_{sc.depth}" if sc.depth and not sc.readonly else None
+    if savepoint:
+        sc.execute(f"SAVEPOINT {savepoint}")
+    sc.depth += 1
+    try:
+        yield sc.proxy
+    except Exception:
+        try:
+            if savepoint:
+                sc.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                sc.execute(f"RELEASE SAVEPOINT {savepoint}")
+            else:
+                sc.proxy.rollback()
+        except Exception:
+            pass
+        raise
+    else:
+        if savepoint:
+            sc.execute(f"RELEASE SAVEPOINT {savepoint}")
+        elif not sc.readonly:
+            try:
+                sc.proxy.commit()
+            except Exception:
+                pass
+    finally:
+        sc.depth -= 1
+
+
+_READONLY_FLAG = "_db_readonly_route"
+
+
+def readonly_route(view=None, *, replica: bool = True):
+    """
+    Declara uma rota só de leitura: os blocos db() do request sem `readonly`
+    explícito passam a ser somente leitura (sem COMMIT no final) e vão para
+    uma réplica, se houver. `replica=False` mantém a rota no primário, para
+    leituras que precisam enxergar as próprias escritas do usuário.
+    Uso: `@readonly_route` ou `@readonly_route(replica=False)`.
+    """
+    if view is None:
+        return functools.partial(readonly_route, replica=replica)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        from flask import g
+
+        setattr(g, _READONLY_FLAG, "replica" if replica else "primary")
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.pop(_READONLY_FLAG, None)
+    return wrapper
+
+
+def _route_mode() -> Optional[str]:
+    """"replica"/"primary" dentro de uma rota `@readonly_route`, senão None."""
+    try:
+        from flask import g, has_app_context
+    except Exception:
+        return None
+    return g.get(_READONLY_FLAG) if has_app_context() else None
+
+
+@contextmanager
+def _db_context_manager(readonly: Optional[bool] = None, replica: Optional[bool] = None):
     """
     Context manager que devolve uma ConnProxy.
     Faz commit ao final (se nÃ£o houve exceÃ§Ã£o) e rollback em caso de erro.
+    `readonly=True` (ou rota com `@readonly_route`) abre uma transação somente
+    leitura: conexões query_only no SQLite, autocommit no Postgres, e nenhum
+    COMMIT no final do bloco.
+    Com DATABASE_REPLICA_URLS, blocos somente leitura vão para as réplicas em
+    round-robin; `replica=False` fixa o bloco no primário (read-your-writes).
+    Dentro de um request Flask, reutiliza a conexão do request (`_request_block`).
     Uso:
         with db() as conn:
             cur = conn.cursor(dictionary=True)
             cur.execute(...)
     """
-    conn = _get_raw_conn()
-    proxy = ConnProxy(conn)
+    mode = _route_mode()
+    if readonly is None:
+        readonly = mode is not None
+    if replica is None:
+        replica = mode != "primary"
+    scope = _request_scope()
+    if scope is not None:
+        with _request_block(scope, readonly, replica=replica) as proxy:
+            yield proxy
+        return
+
+    got = _get_replica_conn() if readonly and replica else None
+    if got is not None:
+        proxy = ConnProxy(got[0], pool=got[1])
+    else:
+        conn = _get_raw_conn(readonly=True) if readonly else _get_raw_conn()
+        proxy = ConnProxy(conn)
     try:
         yield proxy
-        try:
-            proxy.commit()
-        except Exception:
-            pass
+        if not readonly:
+            try:
+                proxy.commit()
+            except Exception:
+                pass
     except Exception:
         try:
             proxy.rollback()
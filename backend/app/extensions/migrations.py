@@ -0,0 +1,475 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from . import db as db_ext
+
+# =========================
+# Migrações de schema versionadas
+# =========================
+# Um único schema para Postgres, SQLite e MySQL (antes: init_postgres.sql,
+# init_sqlite_schema.py e tests/conftest.py, cada um com colunas diferentes).
+# Cada migração tem um número de versão crescente e, por dialeto, uma lista
+# de passos: SQL puro ou uma função `fn(cur, dialeto)`. As versões aplicadas
+# ficam em `schema_migrations`.
+#
+# Os passos são idempotentes (IF NOT EXISTS / checagem no catálogo): DDL não é
+# transacional no MySQL nem no SQLite em modo implícito, então uma migração
+# interrompida pode ser simplesmente reaplicada.
+
+logger = logging.getLogger("app.migrations")
+
+Step = Union[str, Callable[[Any, str], None]]
+
+
+class Migration:
+    """Versão, nome e passos por dialeto ("*" vale para todos)."""
+
+    def __init__(self, version: int, name: str, steps: Dict[str, Sequence[Step]]):
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+    def steps_for(self, dialect: str) -> List[Step]:
+        return list(self.steps.get("*", ())) + list(self.steps.get(dialect, ()))
+
+
+def current_dialect() -> str:
+    if db_ext.using_sqlite():
+        return "sqlite"
+    return "postgres" if db_ext.using_postgres() else "mysql"
+
+
+# -------------------------
+# helpers de catálogo (idempotência)
+# -------------------------
+def _columns(cur, dialect: str, table: str) -> List[str]:
+    if dialect == "sqlite":
+        cur.execute(f"PRAGMA table_info({table})")
+        return [r[1] for r in cur.fetchall()]
+    schema = "current_schema()" if dialect == "postgres" else "DATABASE()"
+    cur.execute(
+        f"SELECT column_name FROM information_schema.columns WHERE table_schema = {schema} AND table_name = %s",
+        (table,),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def add_column(table: str, column: str, types: Dict[str, str]) -> Callable[[Any, str], None]:
+    """Passo: ADD COLUMN só se a coluna ainda não existir."""
+
+    def step(cur, dialect: str) -> None:
+        if column.lower() not in (c.lower() for c in _columns(cur, dialect, table)):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {types.get(dialect) or types['*']}")
+
+    return step
+
+
+def create_index(
+    name: str,
+    table: str,
+    columns: str,
+    where: Optional[str] = None,
+    mysql_columns: Optional[str] = None,
+) -> Callable[[Any, str], None]:
+    """
+    Passo: CREATE INDEX IF NOT EXISTS. `where` vira índice parcial no Postgres
+    e no SQLite; o MySQL não tem índice parcial (usa `mysql_columns`, se
+    houver, e ignora o filtro) nem IF NOT EXISTS (checa information_schema).
+    """
+
+    def step(cur, dialect: str) -> None:
+        if dialect == "mysql":
+            cur.execute(
+                "SELECT 1 FROM information_schema.statistics"
+                " WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+                (table, name),
+            )
+            if cur.fetchall():
+                return
+            cur.execute(f"CREATE INDEX {name} ON {table} ({mysql_columns or columns})")
+            return
+        sql = f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+        if where:
+            sql += f" WHERE {where}"
+        cur.execute(sql)
+
+    return step
+
+
+# -------------------------
+# migrações
+# -------------------------
+_BASE_SCHEMA = {
+    "postgres": [
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id SERIAL PRIMARY KEY,
+            nome TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT,
+            google_id TEXT,
+            google_sub TEXT,
+            avatar_url TEXT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS animais (
+            id SERIAL PRIMARY KEY,
+            usuario_id INTEGER,
+            nome TEXT NOT NULL,
+            especie TEXT NOT NULL,
+            idade INTEGER,
+            porte TEXT,
+            energia TEXT,
+            bom_com_criancas BOOLEAN,
+            cidade TEXT,
+            city TEXT,
+            disponivel BOOLEAN,
+            doador_id INTEGER,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            donor_name TEXT,
+            donor_whatsapp TEXT,
+            photo_url TEXT,
+            raca TEXT,
+            descricao TEXT,
+            status TEXT,
+            adotado_em TIMESTAMP
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS perfil_adotante (
+            usuario_id INTEGER PRIMARY KEY REFERENCES usuarios(id) ON DELETE CASCADE,
+            tipo_moradia TEXT,
+            tem_criancas BOOLEAN,
+            tempo_disponivel_horas_semana INTEGER,
+            estilo_vida TEXT,
+            atualizado_em TIMESTAMP
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS adocoes (
+            id SERIAL PRIMARY KEY,
+            usuario_id INTEGER NOT NULL REFERENCES usuarios(id),
+            animal_id INTEGER NOT NULL REFERENCES animais(id),
+            status TEXT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+    ],
+    "sqlite": [
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT,
+            email TEXT UNIQUE,
+            password_hash TEXT,
+            google_id TEXT,
+            google_sub TEXT,
+            avatar_url TEXT,
+            criado_em TEXT DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS animais (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER,
+            nome TEXT,
+            especie TEXT,
+            raca TEXT,
+            idade TEXT,
+            porte TEXT,
+            descricao TEXT,
+            cidade TEXT,
+            city TEXT,
+            photo_url TEXT,
+            donor_name TEXT,
+            donor_whatsapp TEXT,
+            doador_id INTEGER,
+            criado_em TEXT DEFAULT CURRENT_TIMESTAMP,
+            adotado_em TEXT,
+            energia TEXT,
+            bom_com_criancas INTEGER,
+            disponivel INTEGER,
+            status TEXT
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS perfil_adotante (
+            usuario_id INTEGER PRIMARY KEY,
+            tipo_moradia TEXT,
+            tem_criancas INTEGER,
+            tempo_disponivel_horas_semana INTEGER,
+            estilo_vida TEXT,
+            atualizado_em TEXT
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS adocoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER NOT NULL,
+            animal_id INTEGER NOT NULL,
+            status TEXT,
+            criado_em TEXT DEFAULT CURRENT_TIMESTAMP
+        )""",
+    ],
+    # VARCHAR: o MySQL só indexa TEXT com prefixo
+    "mysql": [
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL UNIQUE,
+            password_hash VARCHAR(255),
+            google_id VARCHAR(255),
+            google_sub VARCHAR(255),
+            avatar_url TEXT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS animais (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            usuario_id INT,
+            nome VARCHAR(255) NOT NULL,
+            especie VARCHAR(64) NOT NULL,
+            idade VARCHAR(64),
+            porte VARCHAR(64),
+            energia VARCHAR(64),
+            bom_com_criancas BOOLEAN,
+            cidade VARCHAR(255),
+            city VARCHAR(255),
+            disponivel BOOLEAN,
+            doador_id INT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            donor_name VARCHAR(255),
+            donor_whatsapp VARCHAR(64),
+            photo_url TEXT,
+            raca VARCHAR(255),
+            descricao TEXT,
+            status VARCHAR(64),
+            adotado_em TIMESTAMP NULL
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS perfil_adotante (
+            usuario_id INT PRIMARY KEY,
+            tipo_moradia VARCHAR(64),
+            tem_criancas BOOLEAN,
+            tempo_disponivel_horas_semana INT,
+            estilo_vida VARCHAR(64),
+            atualizado_em TIMESTAMP NULL,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS adocoes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            usuario_id INT NOT NULL,
+            animal_id INT NOT NULL,
+            status VARCHAR(64),
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id),
+            FOREIGN KEY (animal_id) REFERENCES animais(id)
+        )""",
+    ],
+}
+
+# colunas que os schemas antigos (init_sqlite_schema.py / conftest) não tinham
+_MISSING_COLUMNS = [
+    add_column("usuarios", "google_id", {"*": "TEXT", "mysql": "VARCHAR(255)"}),
+    add_column("usuarios", "criado_em", {"*": "TIMESTAMP", "sqlite": "TEXT"}),
+    add_column("animais", "usuario_id", {"*": "INTEGER"}),
+    add_column("animais", "city", {"*": "TEXT", "mysql": "VARCHAR(255)"}),
+    add_column("animais", "disponivel", {"*": "BOOLEAN", "sqlite": "INTEGER"}),
+    add_column("animais", "status", {"*": "TEXT", "mysql": "VARCHAR(64)"}),
+    add_column("perfil_adotante", "atualizado_em", {"*": "TIMESTAMP", "sqlite": "TEXT"}),
+]
+
+# índices das consultas quentes (api.py / recommendation.scoring)
+_PERFORMANCE_INDEXES = [
+    # /animais: ORDER BY criado_em DESC LIMIT 200, com ou sem filtro de espécie
+    create_index("idx_animais_criado_em", "animais", "criado_em"),
+    create_index("idx_animais_especie_criado_em", "animais", "especie, criado_em"),
+    # /animais/mine: WHERE doador_id = ? ORDER BY criado_em DESC
+    create_index("idx_animais_doador_criado_em", "animais", "doador_id, criado_em"),
+    # catálogo do recomendador e ranking SQL: só animais disponíveis
+    create_index(
+        "idx_animais_disponiveis", "animais", "id", where="adotado_em IS NULL",
+        mysql_columns="adotado_em, id",
+    ),
+    # métricas de adoção: faixa de adotado_em (só adotados no Postgres/SQLite)
+    create_index("idx_animais_adotado_em", "animais", "adotado_em", where="adotado_em IS NOT NULL"),
+    # filtros de porte / cidade (igualdade e prefixo; LIKE '%x%' continua varrendo)
+    create_index("idx_animais_porte", "animais", "porte"),
+    create_index("idx_animais_cidade", "animais", "cidade"),
+    create_index("idx_usuarios_google_sub", "usuarios", "google_sub"),
+    create_index("idx_adocoes_animal", "adocoes", "animal_id"),
+    create_index("idx_adocoes_usuario", "adocoes", "usuario_id"),
+]
+
+# versão do catálogo compartilhada entre processos (ver extensions.catalog):
+# uma linha só, incrementada na transação de cada escrita em `animais`
+_CATALOG_VERSION = {
+    "postgres": [
+        "CREATE TABLE IF NOT EXISTS catalog_version (id INTEGER PRIMARY KEY, version BIGINT NOT NULL DEFAULT 0)",
+        "INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING",
+    ],
+    "sqlite": [
+        "CREATE TABLE IF NOT EXISTS catalog_version (id INTEGER PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)",
+        "INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)",
+    ],
+    "mysql": [
+        "CREATE TABLE IF NOT EXISTS catalog_version (id INT PRIMARY KEY, version BIGINT NOT NULL DEFAULT 0)",
+        "INSERT IGNORE INTO catalog_version (id, version) VALUES (1, 0)",
+    ],
+}
+
+# vetor de 4 dimensões da recomendação, gravado no cadastro/edição de animais
+# (api._save_animal_features); os animais já existentes são preenchidos por
+# `flask backfill-animal-features`, que não mexe no schema
+_ANIMAL_FEATURES = {
+    "postgres": [
+        """
+        CREATE TABLE IF NOT EXISTS animal_features (
+            animal_id INTEGER PRIMARY KEY REFERENCES animais(id) ON DELETE CASCADE,
+            vec_porte REAL,
+            vec_criancas REAL,
+            vec_tempo REAL,
+            vec_atividade REAL
+        )""",
+    ],
+    "sqlite": [
+        """
+        CREATE TABLE IF NOT EXISTS animal_features (
+            animal_id INTEGER PRIMARY KEY REFERENCES animais(id) ON DELETE CASCADE,
+            vec_porte REAL,
+            vec_criancas REAL,
+            vec_tempo REAL,
+            vec_atividade REAL
+        )""",
+    ],
+    "mysql": [
+        """
+        CREATE TABLE IF NOT EXISTS animal_features (
+            animal_id INT PRIMARY KEY,
+            vec_porte DOUBLE,
+            vec_criancas DOUBLE,
+            vec_tempo DOUBLE,
+            vec_atividade DOUBLE,
+            FOREIGN KEY (animal_id) REFERENCES animais(id) ON DELETE CASCADE
+        )""",
+    ],
+}
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "base_schema", _BASE_SCHEMA),
+    Migration(2, "missing_columns", {"*": _MISSING_COLUMNS}),
+    Migration(3, "performance_indexes", {"*": _PERFORMANCE_INDEXES}),
+    Migration(4, "catalog_version", _CATALOG_VERSION),
+    # versão do perfil de adotante (ETag das recomendações, ver extensions.catalog)
+    Migration(5, "perfil_versao", {"*": [
+        add_column("perfil_adotante", "versao", {"*": "INTEGER NOT NULL DEFAULT 0"}),
+    ]}),
+    Migration(6, "animal_features", _ANIMAL_FEATURES),
+]
+
+
+# -------------------------
+# runner
+# -------------------------
+_VERSIONS_TABLE = {
+    "postgres": "CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+    "sqlite": "CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT DEFAULT CURRENT_TIMESTAMP)",
+    "mysql": "CREATE TABLE IF NOT EXISTS schema_migrations (version INT PRIMARY KEY, name VARCHAR(255) NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+}
+# pg_advisory_lock: workers subindo juntos (DB_AUTO_MIGRATE=1) esperam um ao
+# outro desde o CREATE TABLE de schema_migrations (no Postgres, dois CREATE
+# TABLE IF NOT EXISTS simultâneos colidem em pg_type) até a última migração
+_PG_LOCK_KEY = 7_301_946
+
+
+def _read_versions(cur, dialect: str) -> List[int]:
+    cur.execute(_VERSIONS_TABLE[dialect])
+    cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [int(r[0]) for r in cur.fetchall()]
+
+
+def applied_versions() -> List[int]:
+    dialect = current_dialect()
+    with db_ext.db(readonly=False) as conn:
+        cur = conn.cursor()
+        try:
+            return _read_versions(cur, dialect)
+        finally:
+            cur.close()
+
+
+def _pending(migrations: Optional[List[Migration]], done: List[int]) -> List[Migration]:
+    return [m for m in sorted(migrations or MIGRATIONS, key=lambda m: m.version) if m.version not in set(done)]
+
+
+def pending(migrations: Optional[List[Migration]] = None) -> List[Migration]:
+    return _pending(migrations, applied_versions())
+
+
+def _apply(cur, migration: Migration, dialect: str) -> None:
+    for step in migration.steps_for(dialect):
+        if callable(step):
+            step(cur, dialect)
+        else:
+            cur.execute(step)
+    cur.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+        (migration.version, migration.name),
+    )
+
+
+def migrate(migrations: Optional[List[Migration]] = None, target: Optional[int] = None) -> List[Tuple[int, str]]:
+    """
+    Aplica, em ordem, as migrações ainda não registradas (até `target`, se
+    informado) no banco configurado em extensions.db, uma transação por
+    migração. No Postgres, tudo (tabela de versões, leitura e aplicação)
+    acontece com o advisory lock na mão. Devolve (versão, nome) das aplicadas.
+    """
+    dialect = current_dialect()
+    applied = []
+    with db_ext.db(readonly=False) as conn:
+        cur = conn.cursor()
+        try:
+            if dialect == "postgres":
+                cur.execute("SELECT pg_advisory_lock(%s)", (_PG_LOCK_KEY,))
+            try:
+                done = _read_versions(cur, dialect)
+                conn.commit()
+                for migration in _pending(migrations, done):
+                    if target is not None and migration.version > target:
+                        break
+                    _apply(cur, migration, dialect)
+                    conn.commit()
+                    logger.info("migração %s_%s aplicada (%s)", migration.version, migration.name, dialect)
+                    applied.append((migration.version, migration.name))
+            finally:
+                if dialect == "postgres":
+                    conn.rollback()  # transação com erro não aceitaria o unlock
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (_PG_LOCK_KEY,))
+                    conn.commit()
+        finally:
+            cur.close()
+    return applied
+
+
+# --- comando CLI: flask db-migrate
+def _cli():
+    import click
+
+    @click.command("db-migrate")
+    @click.option("--target", type=int, default=None, help="Aplica só até esta versão.")
+    @click.option("--status", is_flag=True, help="Lista as versões aplicadas e pendentes sem aplicar nada.")
+    def migrate_command(target, status):
+        """Aplica as migrações de schema pendentes."""
+        if status:
+            click.echo(f"aplicadas: {applied_versions()}")
+            click.echo(f"pendentes: {[m.version for m in pending()]}")
+            return
+        applied = migrate(target=target)
+        for version, name in applied:
+            click.echo(f"aplicada {version}_{name}")
+        click.echo(f"{len(applied)} migração(ões) aplicada(s)")
+
+    return migrate_command
+
+
+migrate_command = _cli()
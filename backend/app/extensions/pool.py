@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+class PoolTimeoutError(RuntimeError):
+    """Nenhuma conexão liberada dentro do timeout de checkout."""
+
+
+class _Waiter:
+    """
+    Thread na fila de espera. Ao ser acordada recebe uma conexão (`conn`) ou,
+    com `conn` None, uma vaga para abrir uma conexão nova.
+    """
+
+    __slots__ = ("event", "conn")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn: Any = None
+
+
+def _is_closed(conn: Any) -> bool:
+    try:
+        return bool(getattr(conn, "closed", False))
+    except Exception:
+        return True
+
+
+class BlockingPool:
+    """
+    Pool de conexões limitado que espera por uma conexão livre em vez de falhar
+    na hora (o ThreadedConnectionPool do psycopg2 levanta PoolError quando todas
+    estão em uso).
+
+    - fila FIFO: uma conexão devolvida vai direto para quem espera há mais tempo;
+    - `timeout` de checkout -> PoolTimeoutError;
+    - `minconn` conexões abertas já na criação (prewarm) e mantidas ociosas;
+    - reciclagem: ociosas há mais de `idle_timeout` s (acima do mínimo) e
+      conexões com mais de `max_lifetime` s são fechadas e reabertas sob demanda;
+    - conexões fechadas por quem as pegou (ex.: `get_conn().close()`) são
+      recuperadas quando o pool está cheio.
+
+    Mesma interface do pool do psycopg2: getconn / putconn / closeall.
+    """
+
+    # limites (ms) do histograma de espera no checkout
+    WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        maxconn: int,
+        minconn: int = 0,
+        timeout: float = 10.0,
+        idle_timeout: float = 300.0,
+        max_lifetime: float = 1800.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._connect = connect
+        self.maxconn = max(1, int(maxconn))
+        self.minconn = max(0, min(int(minconn), self.maxconn))
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        # ociosas: (conn, criada_em, ociosa_desde); uso: id(conn) -> (conn, criada_em)
+        self._idle: Deque[Tuple[Any, float, float]] = deque()
+        self._in_use: Dict[int, Tuple[Any, float]] = {}
+        self._waiters: Deque[_Waiter] = deque()
+        self._opening = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "reclaimed": 0,
+            "wait_seconds": 0.0,
+        }
+        self._wait_hist = [0] * (len(self.WAIT_BUCKETS_MS) + 1)
+
+        now = self._clock()
+        for _ in range(self.minconn):
+            self._idle.append((self._open(), now, now))
+
+    # -------------------------
+    # internos (chamados com _lock, exceto _open/_close, que fazem I/O)
+    # -------------------------
+    def _open(self) -> Any:
+        conn = self._connect()
+        with self._lock:
+            self._stats["created"] += 1
+        return conn
+
+    @staticmethod
+    def _close(conns: List[Any]) -> None:
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.max_lifetime) and now - created >= self.max_lifetime
+
+    def _prune(self, now: float) -> List[Any]:
+        """Tira do pool as ociosas vencidas; devolve as conexões a fechar."""
+        out = []
+        keep: Deque[Tuple[Any, float, float]] = deque()
+        for conn, created, since in self._idle:
+            idle_too_long = self.idle_timeout and now - since >= self.idle_timeout
+            if self._expired(created, now) or _is_closed(conn) or (
+                idle_too_long and len(keep) + len(self._in_use) >= self.minconn
+            ):
+                out.append(conn)
+                self._stats["recycled"] += 1
+            else:
+                keep.append((conn, created, since))
+        self._idle = keep
+        return out
+
+    def _reclaim(self) -> None:
+        """Libera as vagas de conexões em uso que já foram fechadas por quem as pegou."""
+        for key, (conn, _created) in list(self._in_use.items()):
+            if _is_closed(conn):
+                del self._in_use[key]
+                self._stats["reclaimed"] += 1
+
+    def _grant_slot(self) -> None:
+        """Uma vaga abriu: o primeiro da fila passa a poder abrir uma conexão."""
+        if self._waiters and self._size() < self.maxconn:
+            w = self._waiters.popleft()
+            self._opening += 1
+            w.event.set()
+
+    def _record_wait(self, seconds: float) -> None:
+        self._stats["checkouts"] += 1
+        self._stats["wait_seconds"] += seconds
+        ms = seconds * 1000.0
+        for i, limit in enumerate(self.WAIT_BUCKETS_MS):
+            if ms <= limit:
+                self._wait_hist[i] += 1
+                return
+        self._wait_hist[-1] += 1
+
+    # -------------------------
+    # API
+    # -------------------------
+    def getconn(self, timeout: Optional[float] = None) -> Any:
+        timeout = self.timeout if timeout is None else timeout
+        t0 = self._clock()
+        waiter = conn = None
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("pool fechado")
+            to_close = self._prune(t0)
+            if self._idle and not self._waiters:
+                conn, created, _since = self._idle.pop()  # LIFO: as frias acabam reciclando
+                self._in_use[id(conn)] = (conn, created)
+                self._record_wait(self._clock() - t0)
+            else:
+                if self._size() >= self.maxconn:
+                    self._reclaim()
+                    while self._waiters and self._size() < self.maxconn:
+                        self._grant_slot()
+                if self._size() < self.maxconn and not self._waiters:
+                    self._opening += 1
+                else:
+                    waiter = _Waiter()
+                    self._waiters.append(waiter)
+        self._close(to_close)
+        if conn is not None:
+            return conn
+
+        if waiter is not None and not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.event.is_set():
+                    self._waiters.remove(waiter)
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"nenhuma conexão livre em {timeout:.1f}s (pool com {self.maxconn})"
+                    )
+        if waiter is not None and waiter.conn is not None:
+            with self._lock:
+                self._record_wait(self._clock() - t0)
+            return waiter.conn
+
+        # vaga própria (pool abaixo do máximo ou cedida por quem esperava)
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._opening -= 1
+                self._grant_slot()
+            raise
+        with self._lock:
+            self._opening -= 1
+            self._stats["created"] += 1
+            self._in_use[id(conn)] = (conn, self._clock())
+            self._record_wait(self._clock() - t0)
+        return conn
+
+    def putconn(self, conn: Any, close: bool = False) -> None:
+        discard = close or _is_closed(conn)
+        if not discard:
+            try:
+                conn.rollback()  # não deixa transação aberta para o próximo
+            except Exception:
+                discard = True
+        now = self._clock()
+        with self._lock:
+            entry = self._in_use.pop(id(conn), None)
+            if entry is None or entry[0] is not conn:
+                discard = True
+            elif self._closed or self._expired(entry[1], now):
+                if not self._closed:
+                    self._stats["recycled"] += 1
+                discard = True
+            if discard:
+                self._grant_slot()
+            elif self._waiters:
+                w = self._waiters.popleft()
+                w.conn = conn
+                self._in_use[id(conn)] = entry
+                w.event.set()
+            else:
+                self._idle.append((conn, entry[1], now))
+        if discard:
+            self._close([conn])
+
+    def closeall(self) -> None:
+        with self._lock:
+            self._closed = True
+            conns = [c for c, _, _ in self._idle] + [c for c, _ in self._in_use.values()]
+            self._idle.clear()
+            self._in_use.clear()
+        self._close(conns)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out.update(
+                max=self.maxconn,
+                min=self.minconn,
+                in_use=len(self._in_use),
+                idle=len(self._idle),
+                waiting=len(self._waiters),
+            )
+            labels = [f"<={b}ms" for b in self.WAIT_BUCKETS_MS] + [f">{self.WAIT_BUCKETS_MS[-1]}ms"]
+            out["wait_histogram"] = dict(zip(labels, self._wait_hist))
+            return out
+
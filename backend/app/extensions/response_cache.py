@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import functools
+import os
+from typing import Any, Callable, Hashable, Iterable, Optional, Tuple
+
+from flask import current_app, request
+
+from . import catalog
+from . import db as db_ext
+from .cache import CacheBackend, make_backend
+from .singleflight import flight
+
+# =========================
+# Cache de respostas das rotas públicas
+# =========================
+# GET /api/animais, /api/animais/<id> e o fallback anônimo de /api/recomendacoes
+# devolvem o mesmo JSON até alguém escrever em `animais`. O corpo pronto fica
+# no backend de cache configurado (extensions.cache: LRU do processo, com
+# RESPONSE_CACHE_SIZE entradas, ou Redis) com TTL (RESPONSE_CACHE_TTL s, rede
+# de segurança para escritas fora da API).
+#
+# Invalidação pelas escritas: cada entrada tem tags ("animais" para listas,
+# "animal:<id>" para um animal) e o ouvinte do catálogo derruba só as tags
+# afetadas. Uma resposta calculada enquanto a versão do catálogo mudou não é
+# guardada (poderia ter lido o estado anterior à escrita), nem uma lida de
+# réplica (pode estar atrás da versão, que vem do primário); as rotas
+# cacheadas leem do primário (`readonly_route(replica=False)`).
+#
+# GET condicional (`conditional_get`): a ETag sai só de versões em memória
+# (catálogo, perfil), então um `If-None-Match` que bate vira 304 antes de
+# qualquer consulta, ranking ou serialização.
+#
+# Miss concorrente (logo depois de uma escrita, todo mundo erra junto): a view
+# roda uma vez por chave (`singleflight.flight`) e as outras requisições
+# recebem a mesma resposta; com cache compartilhado, também uma vez entre os
+# workers da máquina.
+
+
+def enabled() -> bool:
+    return (os.getenv("RESPONSE_CACHE") or "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+response_cache: CacheBackend = make_backend(
+    "resp:",
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE") or 512),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL") or 60),
+)
+
+
+def on_catalog_change(event: Optional[str], animal_id: Any, row: Any, version: int) -> None:
+    """Ouvinte do catálogo: listas sempre caem; páginas de animal só a do id alterado."""
+    if event == catalog.REMOTE and response_cache.shared:
+        return  # quem escreveu já invalidou as tags no cache compartilhado
+    if event is None or animal_id is None:
+        response_cache.clear()
+    else:
+        response_cache.invalidate("animais", f"animal:{animal_id}")
+
+
+catalog.subscribe(on_catalog_change)
+
+
+def query_key(*names: str, lower: Iterable[str] = ()) -> Tuple[Tuple[str, str], ...]:
+    """
+    Args da query string que mudam a resposta, normalizados: só `names`, na
+    ordem dada, sem os vazios e em minúsculas os de `lower` (a rota já os
+    compara assim): `?cidade=Recife&_=123` e `?cidade=recife` dão a mesma chave.
+    """
+    lower = set(lower)
+    out = []
+    for name in names:
+        value = request.args.get(name) or ""
+        if not value:
+            continue
+        out.append((name, value.lower() if name in lower else value))
+    return tuple(out)
+
+
+def cached_response(
+    key: Callable[..., Optional[Hashable]],
+    tags: Callable[..., Iterable[str]] = lambda **_kw: ("animais",),
+    ttl: Optional[float] = None,
+):
+    """
+    Decorator de rota GET: `key(**view_args)` devolve a chave da resposta (ou
+    None para não usar o cache nessa requisição) e `tags(**view_args)` as tags
+    de invalidação. Só respostas 200 são guardadas.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            if not enabled():
+                return view(**view_args)
+            k = key(**view_args)
+            if k is None:
+                return view(**view_args)
+            k = f"{view.__name__}:{k!r}"
+            hit = response_cache.get(k)
+            if hit is not None:
+                body, mimetype = hit
+                resp = current_app.response_class(body, status=200, mimetype=mimetype)
+                resp.headers["X-Cache"] = "HIT"
+                return resp
+
+            def compute():
+                version = catalog.current_version()
+                resp = current_app.make_response(view(**view_args))
+                fresh = catalog.current_version() == version
+                if fresh and response_cache.shared:
+                    # outro processo pode ter escrito sem este ainda saber: só guarda
+                    # no cache compartilhado se a versão do banco não mudou
+                    fresh = catalog.shared_version_unchanged()
+                if db_ext.used_replica():
+                    fresh = False  # réplica atrasada: corpo anterior à versão atual
+                body = resp.get_data()
+                if resp.status_code == 200 and fresh:
+                    response_cache.set(k, (body, resp.mimetype), tags(**view_args), ttl=ttl)
+                return body, resp.status_code, list(resp.headers.items())
+
+            def recheck():
+                # outro worker calculou enquanto este esperava o lock
+                hit = response_cache.get(k)
+                return None if hit is None else (hit[0], 200, [("Content-Type", hit[1])])
+
+            # a versão na chave: quem chega depois de uma escrita não pega carona
+            # num cálculo que começou antes dela
+            flight_key = f"{k}@{catalog.current_version()}"
+            body, status, headers = flight.do(flight_key, compute, recheck=recheck if response_cache.shared else None)
+            # cada requisição coalescida monta a própria Response (headers mudam depois)
+            resp = current_app.response_class(body, status=status, headers=headers)
+            resp.headers["X-Cache"] = "MISS"
+            return resp
+
+        return wrapper
+
+    return decorator
+
+
+def conditional_get(etag: Callable[..., Optional[str]], private: bool = False):
+    """
+    Decorator de rota GET: `etag(**view_args)` devolve a ETag forte da
+    resposta atual (ou None para seguir sem ETag, ex.: 401). Se o cliente já
+    tem essa versão (`If-None-Match`), responde 304 sem chamar a view.
+    `private` para respostas por usuário (não ficam em caches compartilhados).
+    """
+    cache_control = "private, no-cache" if private else "no-cache"
+
+    def _headers(resp):
+        resp.headers["Cache-Control"] = cache_control
+        if private:
+            resp.vary.add("Authorization")
+        return resp
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            tag = etag(**view_args)
+            if tag is None:
+                return view(**view_args)
+            if request.if_none_match.contains_weak(tag):
+                resp = current_app.response_class(status=304)
+                resp.set_etag(tag)
+                return _headers(resp)
+            resp = current_app.make_response(view(**view_args))
+            if resp.status_code == 200:
+                resp.set_etag(tag)
+                _headers(resp)
+            return resp
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: só coalescência entre threads
+    fcntl = None
+
+# =========================
+# Single-flight
+# =========================
+# Quando a versão do catálogo muda, todas as requisições concorrentes erram o
+# cache juntas e recalculam a mesma coisa (snapshot do recomendador, a mesma
+# listagem). `SingleFlight.do(chave, fn)` coalesce essas chamadas:
+# - entre threads: a primeira chamada executa `fn`; as outras com a mesma
+#   chave esperam e recebem o mesmo resultado (ou a mesma exceção);
+# - entre processos (workers do gunicorn na mesma máquina): com `recheck`
+#   (busca num cache compartilhado, ex. Redis), quem executa segura um file
+#   lock da chave; os outros workers esperam o lock e, com ele, encontram o
+#   valor no cache em vez de recalcular. Sem onde buscar o resultado do outro
+#   processo (backend local), o lock só enfileiraria os workers, então não é
+#   usado.
+# Passado o `timeout`, quem espera desiste e calcula por conta própria.
+
+logger = logging.getLogger("app.singleflight")
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class FileLocks:
+    """
+    Locks entre processos por chave: um arquivo por chave em `directory`
+    (nome pelo hash da chave), com flock não bloqueante + espera. Quem segura
+    o lock apaga o arquivo ao soltar, para as chaves versionadas não
+    acumularem arquivos; quem esperava no arquivo apagado abre o novo.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"flight-{hashlib.sha1(key.encode()).hexdigest()}.lock")
+
+    @staticmethod
+    def _current(fd: int, path: str) -> bool:
+        """O arquivo travado ainda é o do caminho (não foi apagado por quem soltou)."""
+        try:
+            return os.fstat(fd).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def hold(self, key: str, timeout: float) -> Iterator[bool]:
+        """Segura o lock da chave; produz False se não conseguiu em `timeout` s."""
+        path = self._path(key)
+        deadline = time.monotonic() + timeout
+        delay = 0.002
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        acquired = False
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if self._current(fd, path):
+                        acquired = True
+                        break
+                    # travou um arquivo já apagado: tenta no atual
+                    stale, fd = fd, os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+                    os.close(stale)
+                    continue
+                except BlockingIOError:
+                    pass
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class SingleFlight:
+    def __init__(self, timeout: float = 10.0, locks: Optional[FileLocks] = None):
+        self.timeout = timeout
+        self.locks = locks
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {"calls": 0, "leaders": 0, "shared": 0, "timeouts": 0, "lock_waits": 0, "rechecks": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        timeout: Optional[float] = None,
+        recheck: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        """
+        Resultado de `fn()` para `key`, executando no máximo uma vez por vez.
+        `recheck()`: consultado com o lock entre processos na mão; um valor
+        diferente de None (guardado por `fn` de outro worker) dispensa `fn`.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+
+        if not leader:
+            if call.event.wait(timeout):
+                self._count("shared")
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            self._count("timeouts")
+            logger.warning("single-flight: %.1fs esperando %s; calculando aqui", timeout, key)
+            return fn()
+
+        try:
+            call.result = self._lead(key, fn, timeout, recheck)
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _lead(self, key: str, fn: Callable[[], Any], timeout: float, recheck: Optional[Callable[[], Any]]) -> Any:
+        if self.locks is None or recheck is None:
+            return fn()
+        t0 = time.monotonic()
+        with self.locks.hold(key, timeout) as acquired:
+            if time.monotonic() - t0 > 0.001:
+                self._count("lock_waits")
+            if not acquired:
+                self._count("timeouts")
+            else:
+                hit = recheck()
+                if hit is not None:
+                    self._count("rechecks")
+                    return hit
+            return fn()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["in_flight"] = len(self._calls)
+            return out
+
+
+def _default_locks() -> Optional[FileLocks]:
+    if fcntl is None or (os.getenv("SINGLEFLIGHT_PROCESS") or "1").strip().lower() in ("0", "false", "no", "off"):
+        return None
+    directory = os.getenv("SINGLEFLIGHT_LOCK_DIR") or os.path.join(tempfile.gettempdir(), "adoptme-singleflight")
+    try:
+        return FileLocks(directory)
+    except OSError as exc:
+        logger.warning("single-flight sem lock entre processos (%s): %s", directory, exc)
+        return None
+
+
+flight = SingleFlight(
+    timeout=float(os.getenv("SINGLEFLIGHT_TIMEOUT") or 10),
+    locks=_default_locks(),
+)
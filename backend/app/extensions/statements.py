@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import re
+import threading
+from typing import Dict
+
+# =========================
+# Registro de statements quentes
+# =========================
+# Um `Statement` é o próprio texto SQL (subclasse de str, com placeholders %s)
+# com um nome: continua funcionando em qualquer `cur.execute(...)`, mas os
+# cursores de extensions.db o reconhecem para
+# - traduzir os placeholders uma vez por dialeto (`?` no SQLite, `$n` no Postgres);
+# - usar prepared statements no servidor (PREPARE/EXECUTE no Postgres,
+#   `cursor(prepared=True)` no MySQL);
+# - contar execuções e tempo acumulado por statement.
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+class Statement(str):
+    """SQL nomeado do registro (ver `prepared`)."""
+
+    name: str
+
+    def __new__(cls, name: str, sql: str) -> "Statement":
+        obj = super().__new__(cls, sql)
+        obj.name = name
+        obj._dialects = {}
+        return obj
+
+    @property
+    def param_count(self) -> int:
+        return len(_PLACEHOLDER.findall(self))
+
+    @property
+    def pg_name(self) -> str:
+        return f"stmt_{self.name}"
+
+    def for_sqlite(self) -> str:
+        sql = self._dialects.get("sqlite")
+        if sql is None:
+            sql = self._dialects["sqlite"] = str(self).replace("%s", "?")
+        return sql
+
+    def pg_prepare(self) -> str:
+        """`PREPARE stmt_nome AS ...` com os %s trocados por $1..$n."""
+        sql = self._dialects.get("pg_prepare")
+        if sql is None:
+            counter = iter(range(1, self.param_count + 1))
+            body = _PLACEHOLDER.sub(lambda _m: f"${next(counter)}", str(self))
+            sql = self._dialects["pg_prepare"] = f"PREPARE {self.pg_name} AS {body}"
+        return sql
+
+    def pg_execute(self) -> str:
+        """`EXECUTE stmt_nome (%s, ...)`, executado com os mesmos parâmetros."""
+        sql = self._dialects.get("pg_execute")
+        if sql is None:
+            args = ", ".join(["%s"] * self.param_count)
+            sql = self._dialects["pg_execute"] = (
+                f"EXECUTE {self.pg_name} ({args})" if args else f"EXECUTE {self.pg_name}"
+            )
+        return sql
+
+    def __reduce__(self):
+        return (Statement, (self.name, str(self)))
+
+
+_REGISTRY: Dict[str, Statement] = {}
+_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, float]] = {}
+
+
+def prepared(name: str, sql: str) -> Statement:
+    """Registra (ou devolve o já registrado) o statement `name`."""
+    if not re.fullmatch(r"[a-z][a-z0-9_]*", name):
+        raise ValueError(f"nome de statement inválido: {name!r}")
+    with _lock:
+        current = _REGISTRY.get(name)
+        if current is not None:
+            if str(current) != sql:
+                raise ValueError(f"statement {name!r} já registrado com outro SQL")
+            return current
+        stmt = _REGISTRY[name] = Statement(name, sql)
+        return stmt
+
+
+def registered() -> Dict[str, Statement]:
+    return dict(_REGISTRY)
+
+
+def record(stmt: Statement, seconds: float, prepared_now: bool = False) -> None:
+    with _lock:
+        m = _metrics.setdefault(stmt.name, {"executions": 0, "seconds": 0.0, "prepares": 0})
+        m["executions"] += 1
+        m["seconds"] += seconds
+        if prepared_now:
+            m["prepares"] += 1
+
+
+def statement_metrics() -> Dict[str, Dict[str, float]]:
+    """Execuções, tempo acumulado (s) e PREPAREs feitos, por statement."""
+    with _lock:
+        return {name: dict(m) for name, m in _metrics.items()}
+
+
+def reset_statement_metrics() -> None:
+    with _lock:
+        _metrics.clear()
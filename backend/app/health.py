@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify
-from .extensions.db import get_conn 
+from .extensions.db import DatabaseUnavailable, breaker_state, get_conn, pool_metrics, statement_metrics
+from .extensions.response_cache import response_cache
+from .extensions.singleflight import flight
 
 health_bp = Blueprint("health", __name__)
 
@@ -14,8 +16,18 @@ def db_health():
         cur.execute("SELECT 1")
         cur.fetchone()
         
-        return jsonify({"ok": True}), 200
-        
+        return jsonify({
+            "ok": True,
+            "pool": pool_metrics(),
+            "statements": statement_metrics(),
+            "breaker": breaker_state(),
+            "response_cache": response_cache.metrics(),
+            "singleflight": flight.metrics(),
+        }), 200
+
+    except DatabaseUnavailable as e:
+        return jsonify({"ok": False, "erro": str(e), "breaker": breaker_state()}), 503
+
     except Exception as e:
         # Garante o status 500
         return jsonify({"ok": False, "erro": str(e)}), 500
@@ -1,10 +1,9 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Tuple
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import OneHotEncoder, MinMaxScaler
-from sklearn.neighbors import NearestNeighbors
 
 # =========================
 # Pesos por atributo
@@ -64,194 +63,471 @@ def _energia_por_tempo_estilo(horas_semana: int | None, estilo_vida: str | None)
 
 
 # -------------------------
-# Seleção de colunas
+# Vetorização rápida (NumPy puro, sem pandas/sklearn)
 # -------------------------
-def _split_columns(df: pd.DataFrame) -> Tuple[List[str], List[str], List[str]]:
-    cat_cols: List[str] = []
-    num_cols: List[str] = []
-    passthrough_cols: List[str] = []
-
-    # Categóricas principais
-    if "porte" in df.columns:
-        cat_cols.append("porte")
-    if "energia" in df.columns:
-        cat_cols.append("energia")
-    # Opcional (neutro no score no momento)
-    if "especie" in df.columns:
-        cat_cols.append("especie")
-
-    # Numéricas
-    if "bom_com_criancas" in df.columns:
-        num_cols.append("bom_com_criancas")  # 0/1
-    if "idade" in df.columns:
-        num_cols.append("idade")
-
-    for c in ("id", "nome"):
-        if c in df.columns:
-            passthrough_cols.append(c)
-
-    return cat_cols, num_cols, passthrough_cols
+# Mesmo espaço da implementação de referência com pandas + OneHotEncoder /
+# MinMaxScaler (tests/reference_engine.py, usada nos testes de paridade e no
+# bench_recommendation.py): uma coluna por categoria presente no catálogo, em
+# ordem ordenada como no OneHotEncoder, seguida das numéricas em min-max.
+_CAT_WEIGHT_KEYS = {"porte": "porte", "energia": "energia", "especie": "especie"}
+_NUM_WEIGHT_KEYS = {"bom_com_criancas": "criancas", "idade": "idade"}
+
+
+def _as_float(v: Any) -> float:
+    if v is None:
+        return np.nan
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _category_key(v: Any) -> Tuple[bool, str]:
+    # OneHotEncoder ordena as strings e deixa o ausente (None) por último
+    return (v is None, "" if v is None else str(v))
+
+
+class FeatureLayout:
+    """Layout de colunas do espaço de features, ajustado uma vez sobre o catálogo."""
+
+    def __init__(self, animals: List[Dict[str, Any]]):
+        present = set()
+        for a in animals:
+            present.update(a.keys())
+
+        self.cat_cols: List[str] = [c for c in _CAT_WEIGHT_KEYS if c in present]
+        self.num_cols: List[str] = [c for c in _NUM_WEIGHT_KEYS if c in present]
+
+        # vocabulário categórico -> posição da coluna
+        self.categories: Dict[str, List[Any]] = {}
+        self.positions: Dict[str, Dict[Any, int]] = {}
+        weights: List[float] = []
+        offset = 0
+        for c in self.cat_cols:
+            cats = sorted({a.get(c) for a in animals}, key=_category_key)
+            self.categories[c] = cats
+            self.positions[c] = {v: offset + j for j, v in enumerate(cats)}
+            weights.extend([WEIGHTS[_CAT_WEIGHT_KEYS[c]]] * len(cats))
+            offset += len(cats)
+        self.n_cat = offset
+
+        # escala min-max (range zero vira 1, como no MinMaxScaler)
+        if self.num_cols:
+            raw = np.array(
+                [[_as_float(a.get(c)) for c in self.num_cols] for a in animals],
+                dtype=np.float64,
+            ).reshape(len(animals), len(self.num_cols))
+            with np.errstate(all="ignore"):
+                mins = np.nanmin(raw, axis=0) if len(animals) else np.zeros(len(self.num_cols))
+                maxs = np.nanmax(raw, axis=0) if len(animals) else np.zeros(len(self.num_cols))
+            mins, maxs = np.nan_to_num(mins), np.nan_to_num(maxs)
+            rng = maxs - mins
+            rng[rng == 0] = 1.0
+            self.num_min, self.num_max, self.num_range = mins, maxs, rng
+        else:
+            self.num_min, self.num_max, self.num_range = np.zeros(0), np.zeros(0), np.ones(0)
+        weights.extend(WEIGHTS[_NUM_WEIGHT_KEYS[c]] for c in self.num_cols)
+
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.n_features = self.n_cat + len(self.num_cols)
+
+        # contagem de valores por coluna (manutenção incremental, ver `track`)
+        self._counts = {c: Counter() for c in self.cat_cols + self.num_cols}
+        for a in animals:
+            self.track(a, +1)
+
+    def track(self, row: Dict[str, Any], delta: int) -> bool:
+        """
+        Atualiza a contagem de valores por coluna ao incluir (+1) ou retirar (-1)
+        um animal. Devolve False quando o layout deixa de valer (categoria nova
+        ou extinta, faixa min-max alterada, coluna nova) e precisa ser reajustado.
+        """
+        ok = all(c in self._counts for c in (*_CAT_WEIGHT_KEYS, *_NUM_WEIGHT_KEYS) if c in row)
+        for c in self.cat_cols:
+            v = row.get(c)
+            cnt = self._counts[c]
+            cnt[v] += delta
+            if cnt[v] <= 0:
+                del cnt[v]
+                ok = False
+            elif delta > 0 and v not in self.positions[c]:
+                ok = False
+        for k, c in enumerate(self.num_cols):
+            v = _as_float(row.get(c))
+            if np.isnan(v):
+                continue
+            lo, hi = self.num_min[k], self.num_max[k]
+            cnt = self._counts[c]
+            cnt[v] += delta
+            if cnt[v] <= 0:
+                del cnt[v]
+                ok = ok and v not in (lo, hi)
+            elif delta > 0 and not lo <= v <= hi:
+                ok = False
+        return ok
+
+    def transform(self, animals: List[Dict[str, Any]]) -> np.ndarray:
+        """Matriz ponderada dos animais (n_animais x n_features)."""
+        n = len(animals)
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+        rows = np.arange(n)
+        for c in self.cat_cols:
+            pos = self.positions[c]
+            cols = np.fromiter((pos.get(a.get(c), -1) for a in animals), dtype=np.intp, count=n)
+            known = cols >= 0  # categoria fora do vocabulário: linha zerada (handle_unknown="ignore")
+            X[rows[known], cols[known]] = 1.0
+        if self.num_cols:
+            raw = np.array(
+                [[_as_float(a.get(c)) for c in self.num_cols] for a in animals],
+                dtype=np.float64,
+            ).reshape(n, len(self.num_cols))
+            X[:, self.n_cat:] = np.nan_to_num((raw - self.num_min) / self.num_range)
+        return X * self.weights
+
+    def user_vector(self, prefs: Dict[str, Any]) -> np.ndarray:
+        """Vetor ponderado do usuário (1 x n_features) no mesmo espaço."""
+        x = np.zeros(self.n_features, dtype=np.float64)
+        if "porte" in self.positions:
+            pref_porte = _preferencias_porte(prefs.get("tipo_moradia"))
+            for v, j in self.positions["porte"].items():
+                x[j] = pref_porte.get(v, 0.0)
+        if "energia" in self.positions:
+            pref_energia = _energia_por_tempo_estilo(
+                prefs.get("tempo_disponivel_horas_semana"),
+                prefs.get("estilo_vida"),
+            )
+            for v, j in self.positions["energia"].items():
+                x[j] = pref_energia.get(v, 0.0)
+        if "especie" in self.positions:
+            especie_pref = prefs.get("especie_pref")
+            if especie_pref and especie_pref in self.positions["especie"]:
+                x[self.positions["especie"][especie_pref]] = 1.0
+
+        if self.num_cols:
+            raw = np.empty(len(self.num_cols), dtype=np.float64)
+            for k, c in enumerate(self.num_cols):
+                if c == "bom_com_criancas":
+                    # Se tem crianças, preferência forte por 1.0. Sem crianças: 0.5 (neutro).
+                    raw[k] = 1.0 if int(prefs.get("tem_criancas") or 0) == 1 else 0.5
+                else:
+                    # idade: neutro ~ meio da escala (sem efeito no score por WEIGHTS)
+                    raw[k] = 5
+            x[self.n_cat:] = (raw - self.num_min) / self.num_range
+
+        return (x * self.weights)[None, :]
 
 
 # -------------------------
-# Construção da matriz dos ANIMAIS (fit)
+# Kernel top-k (float32 + argpartition)
 # -------------------------
-def _build_feature_matrix(df_anim: pd.DataFrame):
-    cat_cols, num_cols, _ = _split_columns(df_anim)
-
-    enc = OneHotEncoder(handle_unknown="ignore", sparse_output=False)
-    X_cat = enc.fit_transform(df_anim[cat_cols]) if cat_cols else np.zeros((len(df_anim), 0))
-
-    scaler = MinMaxScaler()
-    X_num = scaler.fit_transform(df_anim[num_cols]) if num_cols else np.zeros((len(df_anim), 0))
-
-    # Aplica pesos por atributo
-    blocks: List[np.ndarray] = []
-    if X_cat.shape[1] > 0:
-        cat_names = enc.get_feature_names_out(cat_cols)
-        Xc = X_cat.copy()
-        for j, name in enumerate(cat_names):
-            if name.startswith("porte_"):
-                Xc[:, j] *= WEIGHTS["porte"]
-            elif name.startswith("energia_"):
-                Xc[:, j] *= WEIGHTS["energia"]
-            elif name.startswith("especie_"):
-                Xc[:, j] *= WEIGHTS["especie"]
-        blocks.append(Xc)
-
-    if X_num.shape[1] > 0:
-        Xn = X_num.copy()
-        for k, col in enumerate(num_cols):
-            if col == "bom_com_criancas":
-                Xn[:, k] *= WEIGHTS["criancas"]
-            elif col == "idade":
-                Xn[:, k] *= WEIGHTS["idade"]
-        blocks.append(Xn)
-
-    X_anim = np.concatenate(blocks, axis=1) if blocks else np.zeros((len(df_anim), 0))
-
-    meta = {
-        "id": df_anim["id"].to_numpy() if "id" in df_anim else np.arange(len(df_anim)),
-        "nome": df_anim["nome"].to_numpy() if "nome" in df_anim else np.array([""] * len(df_anim)),
-    }
-    return X_anim, meta, enc, scaler, cat_cols, num_cols
+def as_float32_matrix(M: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Matriz float32 contígua e as normas ao quadrado de suas linhas (pré-cálculo do kernel)."""
+    M32 = np.ascontiguousarray(M, dtype=np.float32)
+    return M32, np.einsum("ij,ij->i", M32, M32)
+
+
+def topk_sq_distances(
+    M32: np.ndarray,
+    norms: np.ndarray,
+    X: np.ndarray,
+    k: int,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Para cada linha de X, as k linhas de M32 mais próximas (distância euclidiana
+    ao quadrado, features já ponderadas) mais as empatadas com a k-ésima.
+    Calcula ||m||² - 2 m·x + ||x||² numa única multiplicação de matrizes, usa
+    argpartition por linha e ordena só os vencedores.
+    Devolve [(índices, dist²)] por linha de X, em ordem crescente de distância.
+    """
+    n = M32.shape[0]
+    X32 = np.ascontiguousarray(np.atleast_2d(X), dtype=np.float32)
+    if n == 0 or k <= 0:
+        return [(np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)) for _ in range(len(X32))]
+
+    sqd = X32 @ M32.T
+    sqd *= -2.0
+    sqd += norms[None, :]
+    sqd += np.einsum("ij,ij->i", X32, X32)[:, None]
+    np.maximum(sqd, 0.0, out=sqd)
+
+    kth = min(k, n) - 1
+    part = np.argpartition(sqd, kth, axis=1)[:, : kth + 1]
+    limits = np.take_along_axis(sqd, part, axis=1).max(axis=1)
+
+    out: List[Tuple[np.ndarray, np.ndarray]] = []
+    for row, limit in zip(sqd, limits):
+        # tolerância do float32: empates com a k-ésima também entram
+        cand = np.flatnonzero(row <= limit + 1e-5 * (1.0 + limit))
+        cand = cand[np.argsort(row[cand], kind="stable")]
+        out.append((cand, row[cand]))
+    return out
 
 
 # -------------------------
-# Vetor do USUÁRIO (mesmo espaço das features dos animais)
+# Índice do catálogo (ajustado uma vez, reutilizado entre chamadas)
 # -------------------------
-def _build_user_vector(
-    prefs: Dict[str, Any],
-    enc: OneHotEncoder,
-    scaler: MinMaxScaler,
-    cat_cols: List[str],
-    num_cols: List[str],
-) -> np.ndarray:
-    # Preferências distribuídas (categorias)
-    pref_porte = _preferencias_porte(prefs.get("tipo_moradia")) if "porte" in cat_cols else {}
-    pref_energia = _energia_por_tempo_estilo(
-        prefs.get("tempo_disponivel_horas_semana"),
-        prefs.get("estilo_vida"),
-    ) if "energia" in cat_cols else {}
-    especie_pref = prefs.get("especie_pref") if "especie" in cat_cols else None
-
-    # Linha nominal para o encoder
-    row_cat: Dict[str, Any] = {}
-    if "porte" in cat_cols:
-        row_cat["porte"] = next(iter(pref_porte)) if pref_porte else None
-    if "energia" in cat_cols:
-        row_cat["energia"] = next(iter(pref_energia)) if pref_energia else None
-    if "especie" in cat_cols:
-        row_cat["especie"] = especie_pref
-
-    # Numéricas
-    row_num: Dict[str, Any] = {}
-    if "bom_com_criancas" in num_cols:
-        # Se tem crianças, preferência forte por 1.0. Sem crianças: 0.5 (neutro).
-        row_num["bom_com_criancas"] = 1.0 if int(prefs.get("tem_criancas", 0)) == 1 else 0.5
-    if "idade" in num_cols:
-        # neutro ~ meio da escala (sem efeito no score por WEIGHTS)
-        row_num["idade"] = 5
-
-    df_u_cat = pd.DataFrame([row_cat]) if row_cat else pd.DataFrame([{}])
-    df_u_num = pd.DataFrame([row_num]) if row_num else pd.DataFrame([{}])
-
-    # Transformações
-    if cat_cols:
-        for c in cat_cols:
-            if c not in df_u_cat.columns:
-                df_u_cat[c] = None
-        X_cat_u = enc.transform(df_u_cat[cat_cols])
-        cat_names = enc.get_feature_names_out(cat_cols)
-
-        # Zera todas as categorias de energia/porte/especie antes de setar (segurança)
-        for j, name in enumerate(cat_names):
-            if name.startswith("porte_") or name.startswith("energia_") or name.startswith("especie_"):
-                X_cat_u[0, j] = 0.0
-
-        # Injetar distribuição de preferências diretamente nos one-hot (com pesos)
-        for j, name in enumerate(cat_names):
-            if name.startswith("porte_"):
-                k = name.split("porte_")[1]
-                X_cat_u[0, j] = pref_porte.get(k, 0.0) * WEIGHTS["porte"]
-            elif name.startswith("energia_"):
-                k = name.split("energia_")[1]
-                X_cat_u[0, j] = pref_energia.get(k, 0.0) * WEIGHTS["energia"]
-            elif name.startswith("especie_"):
-                k = name.split("especie_")[1]
-                X_cat_u[0, j] = (1.0 * WEIGHTS["especie"]) if (especie_pref and k == especie_pref) else 0.0
-    else:
-        X_cat_u = np.zeros((1, 0))
-
-    if num_cols:
-        for c in num_cols:
-            if c not in df_u_num.columns:
-                df_u_num[c] = 0
-        X_num_u = scaler.transform(df_u_num[num_cols])
-        for k, col in enumerate(num_cols):
-            if col == "bom_com_criancas":
-                X_num_u[:, k] *= WEIGHTS["criancas"]
-            elif col == "idade":
-                X_num_u[:, k] *= WEIGHTS["idade"]
-    else:
-        X_num_u = np.zeros((1, 0))
+def knn_score(dist: float) -> Dict[str, Any]:
+    """Converte distância -> similaridade [0, 1]: score = 1 / (1 + distância)."""
+    return {"_score": round(1.0 / (1.0 + dist), 4)}
+
 
-    return np.concatenate([X_cat_u, X_num_u], axis=1)
+class FeatureIndex:
+    """
+    Espaço de features ajustado sobre o catálogo de animais: matriz ponderada,
+    layout (vocabulário categórico e escala numérica) e arrays de id/nome.
+    Cada consulta só monta o vetor do usuário e faz uma busca top-k.
+
+    As features têm cardinalidade baixa (porte x energia x especie x crianças),
+    então os animais são agrupados por assinatura (vetor ponderado idêntico):
+    a distância é calculada uma vez por bucket e depois expandida para os
+    animais, do mais recente para o mais antigo em caso de empate.
+
+    `space` monta o layout do espaço de features a partir das linhas (padrão:
+    one-hot ponderado de `FeatureLayout`) e `score` converte a distância nos
+    campos de score de cada resultado (padrão: `knn_score`).
+    """
+
+    # compacta quando os tombstones passam de max(MIN, RATIO * linhas)
+    COMPACT_MIN = 64
+    COMPACT_RATIO = 0.25
+
+    def __init__(
+        self,
+        animals: List[Dict[str, Any]],
+        version: int = 0,
+        space: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+        score: Optional[Callable[[float], Dict[str, Any]]] = None,
+    ):
+        self.version = version
+        self._space = space or FeatureLayout
+        self._score = score or knn_score
+        self._lock = threading.RLock()
+        self._fit(list(animals))
+
+    def _fit(self, rows: List[Dict[str, Any]]) -> None:
+        """(Re)ajusta layout e buckets sobre `rows`, descartando tombstones."""
+        self.rows: List[Dict[str, Any]] = rows
+        self.layout = self._space(rows)
+        self._alive = np.ones(len(rows), dtype=bool)
+        self._pos: Dict[Any, int] = {r.get("id"): i for i, r in enumerate(rows) if r.get("id") is not None}
+        self._n_alive = len(rows)
+        self._tombstones = 0
+        self._build_buckets(self.layout.transform(rows))
+
+    def _build_buckets(self, X: np.ndarray) -> None:
+        n = len(self.rows)
+        # recência: id maior = anúncio mais novo (sem id, vale a posição)
+        recency = np.array([_as_float(a.get("id")) for a in self.rows], dtype=np.float64)
+        self._recency = np.where(np.isnan(recency), np.arange(n, dtype=np.float64), recency)
+
+        if X.shape[1] == 0:
+            self.signatures = np.zeros((1 if n else 0, 0))
+            inverse = np.zeros(n, dtype=np.intp)
+        else:
+            self.signatures, inverse = np.unique(X, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        self._row_bucket = inverse.astype(np.intp)
+        self._sig_lookup: Dict[bytes, int] = {sig.tobytes(): b for b, sig in enumerate(self.signatures)}
+
+        # membros de cada bucket, do mais novo para o mais antigo
+        order = np.lexsort((-self._recency, inverse))
+        bounds = np.flatnonzero(np.diff(inverse[order])) + 1
+        self._bucket_members: List[np.ndarray] = np.split(order, bounds) if n else []
+        self._bucket_sizes = np.array([len(m) for m in self._bucket_members], dtype=np.intp)
+
+        self._sig32, self._sig_norms = as_float32_matrix(self.signatures)
+
+    def __len__(self) -> int:
+        return self._n_alive
+
+    @property
+    def n_buckets(self) -> int:
+        return int(np.count_nonzero(self._bucket_sizes))
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Matriz ponderada dos animais ativos."""
+        return self.signatures[self._row_bucket[self._alive]]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return np.array([r.get("id") for r, ok in zip(self.rows, self._alive) if ok])
+
+    @property
+    def nomes(self) -> np.ndarray:
+        return np.array([r.get("nome") or "" for r, ok in zip(self.rows, self._alive) if ok])
+
+    # -------------------------
+    # Manutenção incremental (hooks de escrita em `animais`)
+    # -------------------------
+    def _refit_alive(self, extra: Optional[Dict[str, Any]] = None, skip: Optional[int] = None) -> None:
+        rows = [r for i, r in enumerate(self.rows) if self._alive[i] and i != skip]
+        if extra is not None:
+            rows.append(extra)
+        self._fit(rows)
+
+    def _bucket_for(self, vec: np.ndarray) -> int:
+        key = vec.tobytes()
+        b = self._sig_lookup.get(key)
+        if b is None:
+            b = len(self._bucket_members)
+            self._sig_lookup[key] = b
+            self.signatures = np.vstack([self.signatures, vec[None, :]])
+            v32, norm = as_float32_matrix(vec[None, :])
+            self._sig32 = np.vstack([self._sig32, v32])
+            self._sig_norms = np.append(self._sig_norms, np.inf)
+            self._bucket_members.append(np.zeros(0, dtype=np.intp))
+            self._bucket_sizes = np.append(self._bucket_sizes, 0)
+        return b
+
+    def _attach(self, i: int, b: int) -> None:
+        members = self._bucket_members[b]
+        at = np.searchsorted(-self._recency[members], -self._recency[i])
+        self._bucket_members[b] = np.insert(members, at, i)
+        self._bucket_sizes[b] += 1
+        if self._bucket_sizes[b] == 1:
+            self._sig_norms[b] = np.dot(self._sig32[b], self._sig32[b])
+
+    def _detach(self, i: int, b: int) -> None:
+        members = self._bucket_members[b]
+        self._bucket_members[b] = members[members != i]
+        self._bucket_sizes[b] -= 1
+        if self._bucket_sizes[b] == 0:
+            # bucket vazio nunca é selecionado pelo kernel
+            self._sig_norms[b] = np.inf
+
+    def upsert(self, row: Dict[str, Any]) -> None:
+        """Insere (append) ou sobrescreve o animal `row["id"]`."""
+        key = row.get("id")
+        if key is None:
+            raise ValueError("upsert exige id")
+        with self._lock:
+            i = self._pos.get(key)
+            ok = self.layout.track(row, +1)
+            if i is not None:
+                ok = self.layout.track(self.rows[i], -1) and ok
+            if not ok:
+                self._refit_alive(extra=row, skip=i)
+                return
+
+            b = self._bucket_for(self.layout.transform([row])[0])
+            if i is None:
+                i = len(self.rows)
+                self.rows.append(row)
+                self._pos[key] = i
+                rec = _as_float(key)
+                self._recency = np.append(self._recency, i if np.isnan(rec) else rec)
+                self._alive = np.append(self._alive, True)
+                self._row_bucket = np.append(self._row_bucket, b)
+                self._n_alive += 1
+            else:
+                self.rows[i] = row
+                if self._row_bucket[i] == b:
+                    return
+                self._detach(i, self._row_bucket[i])
+                self._row_bucket[i] = b
+            self._attach(i, b)
+
+    def remove(self, key: Any) -> None:
+        """Marca o animal `key` como removido (tombstone); compacta periodicamente."""
+        with self._lock:
+            i = self._pos.pop(key, None)
+            if i is None:
+                return
+            ok = self.layout.track(self.rows[i], -1)
+            self._alive[i] = False
+            self._detach(i, self._row_bucket[i])
+            self._n_alive -= 1
+            self._tombstones += 1
+            if not ok or self._tombstones > max(self.COMPACT_MIN, self.COMPACT_RATIO * len(self.rows)):
+                self._refit_alive()
+
+    def user_vector(self, prefs: Dict[str, Any]) -> np.ndarray:
+        return self.layout.user_vector(prefs)
+
+    def _nearest_buckets(self, X_users: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Para cada usuário, os buckets candidatos ao top-k em ordem de distância.
+        Os k buckets mais próximos têm >= k animais; a seleção é feita em float32
+        e só os candidatos têm a distância euclidiana recalculada em float64.
+        """
+        # Euclidiana penaliza descasamentos (ex.: energia Media quando o usuário quer Baixa)
+        out = []
+        for x, (cand, _sqd32) in zip(X_users, topk_sq_distances(self._sig32, self._sig_norms, X_users, k)):
+            cand = cand[self._bucket_sizes[cand] > 0]
+            dists = np.sqrt(((self.signatures[cand] - x) ** 2).sum(axis=1))
+            order = np.argsort(dists, kind="stable")
+            out.append((cand[order], dists[order]))
+        return out
+
+    def _expand(self, buckets: np.ndarray, dists: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Expande os buckets mais próximos nos k melhores animais (linhas, distâncias)."""
+        # buckets suficientes para k animais, mais os empatados com o último
+        needed = int(np.searchsorted(np.cumsum(self._bucket_sizes[buckets]), k)) + 1
+        needed = min(needed, len(buckets))
+        while needed < len(buckets) and np.isclose(dists[needed], dists[needed - 1]):
+            needed += 1
+
+        # membros já estão do mais novo para o mais antigo: bastam os k primeiros de cada
+        members = [self._bucket_members[b][:k] for b in buckets[:needed]]
+        rows = np.concatenate(members)
+        row_dists = np.repeat(dists[:needed], [len(m) for m in members])
+        # distância crescente; empate -> mais recente primeiro
+        order = np.lexsort((-self._recency[rows], np.round(row_dists, 9)))[:k]
+        return rows[order], row_dists[order]
+
+    def _results(self, rows: np.ndarray, row_dists: np.ndarray) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = []
+        for rank, (i, dist) in enumerate(zip(rows, row_dists), start=1):
+            item = dict(self.rows[i])
+            item["_rank"] = rank
+            item.update(self._score(float(dist)))
+            results.append(item)
+        return results
+
+    def query(self, prefs: Dict[str, Any], top_n: int = 10) -> List[Dict[str, Any]]:
+        return self.query_batch([prefs], top_n=top_n)[0]
+
+    def query_batch(self, prefs_list: List[Dict[str, Any]], top_n: int = 10) -> List[List[Dict[str, Any]]]:
+        """
+        Top-N para vários adotantes de uma vez: uma única matriz de distâncias
+        (usuários x buckets) e um argpartition por linha.
+        """
+        with self._lock:
+            k = min(top_n, len(self))
+            if k <= 0 or not prefs_list:
+                return [[] for _ in prefs_list]
+
+            X_users = np.vstack([self.user_vector(p) for p in prefs_list])
+            return [
+                self._results(*self._expand(buckets, dists, k))
+                for buckets, dists in self._nearest_buckets(X_users, k)
+            ]
 
 
 # -------------------------
 # KNN principal (métrica EUCLIDEANA)
 # -------------------------
-def knn_rank(animals: List[Dict[str, Any]], prefs: Dict[str, Any], top_n: int = 10) -> List[Dict[str, Any]]:
+def knn_rank(animals: List[Dict[str, Any]] | FeatureIndex, prefs: Dict[str, Any], top_n: int = 10) -> List[Dict[str, Any]]:
     """
-    Recebe lista de animais (dicts do DB) e preferências do adotante.
+    Recebe lista de animais (dicts do DB) ou um FeatureIndex já ajustado e as
+    preferências do adotante.
     Usa kNN com distância Euclidiana sobre features ponderadas.
     Converte para score de similaridade: score = 1 / (1 + distância).
     """
-    if not animals:
-        return []
-
-    df_anim = pd.DataFrame(animals).copy()
-
-    X_anim, meta, enc, scaler, cat_cols, num_cols = _build_feature_matrix(df_anim)
-    x_user = _build_user_vector(prefs, enc, scaler, cat_cols, num_cols)
+    index = animals if isinstance(animals, FeatureIndex) else FeatureIndex(animals)
+    return index.query(prefs, top_n=top_n)
 
-    # Euclidiana penaliza descasamentos (ex.: energia Media quando o usuário quer Baixa)
-    nbrs = NearestNeighbors(metric="euclidean", algorithm="brute")
-    nbrs.fit(X_anim)
 
-    k = min(top_n, len(df_anim))
-    distances, indices = nbrs.kneighbors(x_user, n_neighbors=k)
-    idx = indices[0]
-    dists = distances[0]
-
-    # Converte distância -> similaridade [0, 1]
-    sims = 1.0 / (1.0 + dists)
-
-    results: List[Dict[str, Any]] = []
-    for rank, (i, sim) in enumerate(zip(idx, sims), start=1):
-        item = df_anim.iloc[i].to_dict()
-        item["_rank"] = rank
-        item["_score"] = round(float(sim), 4)
-        results.append(item)
-    return results
+def knn_rank_batch(
+    animals_index: List[Dict[str, Any]] | FeatureIndex,
+    prefs_list: List[Dict[str, Any]],
+    top_n: int = 10,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Versão em lote de `knn_rank`: devolve uma lista de recomendações por
+    perfil de `prefs_list`, na mesma ordem, calculando as distâncias de todos
+    os perfis numa única operação vetorizada.
+    """
+    index = animals_index if isinstance(animals_index, FeatureIndex) else FeatureIndex(animals_index)
+    return index.query_batch(prefs_list, top_n=top_n)
@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from ..constants import SCORING_COLUMNS, SQL_SELECT_ANIMAL_ROW, SQL_SELECT_SCORING_ROWS
+from ..extensions import catalog
+from ..extensions import db as db_ext
+from ..extensions.cache import CacheBackend, make_backend
+from ..extensions.singleflight import flight
+from .engine import FeatureIndex, FeatureLayout, knn_score
+
+# =========================
+# Motor de recomendação unificado
+# =========================
+# Todos os caminhos de recomendação (rota /recomendacoes e recommendation_service)
+# passam por aqui: um snapshot do catálogo carregado uma vez por versão, um
+# índice por scorer nomeado (buckets + kernel top-k de engine.FeatureIndex)
+# e métricas comuns.
+#
+# Busca em duas fases: o snapshot guarda só id + SCORING_COLUMNS (fase 1) e,
+# depois do ranking, as linhas completas dos vencedores são buscadas numa única
+# consulta `WHERE id IN (...)` (fase 2), mantendo a ordem do ranking.
+#
+# Recarga do snapshot: com cache compartilhado (CACHE_BACKEND=redis), as linhas
+# da fase 1 ficam lá por versão global do catálogo e a carga passa pelo
+# single-flight, então depois de um novo anúncio só um worker da máquina
+# consulta o banco; os outros leem as linhas do cache.
+
+
+class Scorer:
+    """
+    Scorer nomeado: `space(rows)` devolve o layout do espaço de features
+    (transform / user_vector / track) e `score(distância)` os campos de score.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        space: Callable[[List[Dict[str, Any]]], Any],
+        score: Callable[[float], Dict[str, Any]],
+    ):
+        self.name = name
+        self.space = space
+        self.score = score
+
+    def build(self, rows: List[Dict[str, Any]], version: int) -> FeatureIndex:
+        return FeatureIndex(rows, version=version, space=self.space, score=self.score)
+
+
+_SCORERS: Dict[str, Scorer] = {}
+
+
+def register_scorer(scorer: Scorer) -> None:
+    _SCORERS[scorer.name] = scorer
+
+
+def get_scorer(name: str) -> Scorer:
+    try:
+        return _SCORERS[name]
+    except KeyError:
+        raise KeyError(f"scorer desconhecido: {name}") from None
+
+
+def scorer_names() -> List[str]:
+    return sorted(_SCORERS)
+
+
+# kNN one-hot ponderado (engine.WEIGHTS), score = 1 / (1 + distância)
+register_scorer(Scorer("weighted_onehot_knn", FeatureLayout, knn_score))
+
+
+_CATALOG_KEYS = frozenset(("id", *SCORING_COLUMNS))
+
+
+def load_catalog() -> List[Dict[str, Any]]:
+    """Fase 1: catálogo disponível (animais não adotados), só id + colunas de ranking."""
+    # primário: o snapshot fica em cache com a versão atual, não pode vir atrasado de uma réplica
+    with db_ext.db(readonly=True, replica=False) as conn:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute(SQL_SELECT_SCORING_ROWS)
+            return cur.fetchall() or []
+
+
+def hydrate_rows(ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+    """Fase 2: linhas completas dos animais `ids`, numa única consulta."""
+    if not ids:
+        return {}
+    placeholders = ",".join(["%s"] * len(ids))
+    # mesma origem do snapshot (primário): numa réplica atrasada um animal
+    # recém-criado ainda não existe
+    with db_ext.db(readonly=True, replica=False) as conn:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute(SQL_SELECT_ANIMAL_ROW + f"\n                 WHERE id IN ({placeholders})", tuple(ids))
+            return {r.get("id"): r for r in cur.fetchall() or []}
+
+
+# só usado quando compartilhado: no backend local seria uma segunda cópia do snapshot
+_shared_rows: CacheBackend = make_backend("snapshot:", max_entries=4, ttl=float(os.getenv("SNAPSHOT_SHARE_TTL") or 60))
+
+
+def load_catalog_shared() -> List[Dict[str, Any]]:
+    """
+    `load_catalog` coalescido entre threads e workers: as linhas da versão
+    global atual vêm do cache compartilhado se outro worker já as carregou.
+    """
+    tag = catalog.version_tag()
+    if not _shared_rows.shared or not tag.startswith("g"):
+        return load_catalog()  # versão só deste processo: nada para compartilhar
+    key = f"catalog_rows:{tag}"
+
+    def load():
+        rows = load_catalog()
+        _shared_rows.set(key, rows)
+        return rows
+
+    return flight.do(key, load, recheck=lambda: _shared_rows.get(key))
+
+
+class CatalogSnapshot:
+    """Linhas do catálogo numa versão, indexadas por id."""
+
+    def __init__(self, rows: List[Dict[str, Any]], version: int):
+        self.version = version
+        self.rows_by_id: Dict[Any, Dict[str, Any]] = {r.get("id"): r for r in rows}
+
+    @property
+    def rows(self) -> List[Dict[str, Any]]:
+        return list(self.rows_by_id.values())
+
+
+def _new_scorer_metrics() -> Dict[str, float]:
+    return {"queries": 0, "users": 0, "query_seconds": 0.0, "builds": 0, "build_seconds": 0.0}
+
+
+def _available(row: Dict[str, Any]) -> bool:
+    """Mesmo filtro de SQL_SELECT_SCORING_ROWS: não adotado e `disponivel` não falso."""
+    return row.get("adotado_em") is None and row.get("disponivel") not in (0, False)
+
+
+class ScoringEngine:
+    """
+    Snapshot do catálogo compartilhado pelos scorers, índices por scorer e
+    métricas. O snapshot é recarregado quando a versão do catálogo muda sem
+    aviso; escritas notificadas via `catalog.animal_changed` são aplicadas
+    incrementalmente no snapshot e em todos os índices já construídos.
+    """
+
+    def __init__(
+        self,
+        loader: Optional[Callable[[], List[Dict[str, Any]]]] = None,
+        hydrator: Optional[Callable[[List[Any]], Dict[Any, Dict[str, Any]]]] = None,
+    ):
+        # sem loader/hydrator: `load_catalog_shared`/`hydrate_rows` do módulo (resolvidos a cada uso)
+        self._loader = loader
+        self._hydrator = hydrator
+        self._lock = threading.RLock()
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._indexes: Dict[str, FeatureIndex] = {}
+        self._metrics: Dict[str, Any] = {}
+        self._reset_metrics()
+
+    def _reset_metrics(self) -> None:
+        self._metrics = {
+            "snapshot_loads": 0,
+            "snapshot_seconds": 0.0,
+            "incremental_updates": 0,
+            "hydrations": 0,
+            "hydrated_rows": 0,
+            "hydrate_dropped": 0,
+            "hydrate_seconds": 0.0,
+            "scorers": {},
+        }
+
+    def _scorer_metrics(self, name: str) -> Dict[str, float]:
+        return self._metrics["scorers"].setdefault(name, _new_scorer_metrics())
+
+    def reset(self) -> None:
+        """Descarta snapshot, índices e métricas (o próximo acesso recarrega)."""
+        with self._lock:
+            self._snapshot = None
+            self._indexes = {}
+            self._reset_metrics()
+
+    def snapshot(self) -> CatalogSnapshot:
+        version = catalog.current_version()
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                t0 = time.perf_counter()
+                rows = (self._loader or load_catalog_shared)()
+                self._snapshot = CatalogSnapshot(rows, version)
+                self._indexes = {}
+                self._metrics["snapshot_loads"] += 1
+                self._metrics["snapshot_seconds"] += time.perf_counter() - t0
+            return self._snapshot
+
+    def index(self, name: str) -> FeatureIndex:
+        scorer = get_scorer(name)
+        with self._lock:
+            snap = self.snapshot()
+            index = self._indexes.get(name)
+            if index is None:
+                t0 = time.perf_counter()
+                index = scorer.build(snap.rows, snap.version)
+                self._indexes[name] = index
+                m = self._scorer_metrics(name)
+                m["builds"] += 1
+                m["build_seconds"] += time.perf_counter() - t0
+            return index
+
+    def hydrate(self, ranked: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+        """
+        Troca as linhas estreitas do ranking pelas linhas completas (uma consulta
+        para todos os ids), mantendo ordem e campos de score. Um id que sumiu
+        do banco entre as fases (apagado, adotado) sai do resultado, sem nome
+        nem foto não há o que mostrar; `_rank` é renumerado.
+        """
+        ids = list(dict.fromkeys(r.get("id") for results in ranked for r in results))
+        if not ids:
+            return ranked
+        t0 = time.perf_counter()
+        full = (self._hydrator or hydrate_rows)(ids)
+        out, dropped = [], 0
+        for results in ranked:
+            hydrated = []
+            for r in results:
+                row = full.get(r.get("id"))
+                if row is None:
+                    dropped += 1
+                    continue
+                item = dict(row)
+                item.update((k, v) for k, v in r.items() if k not in _CATALOG_KEYS)
+                if "_rank" in item:
+                    item["_rank"] = len(hydrated) + 1
+                hydrated.append(item)
+            out.append(hydrated)
+        with self._lock:
+            self._metrics["hydrations"] += 1
+            self._metrics["hydrated_rows"] += len(ids)
+            self._metrics["hydrate_dropped"] += dropped
+            self._metrics["hydrate_seconds"] += time.perf_counter() - t0
+        return out
+
+    def rank_batch(
+        self,
+        name: str,
+        prefs_list: List[Dict[str, Any]],
+        top_n: int = 10,
+        hydrate: bool = True,
+    ) -> List[List[Dict[str, Any]]]:
+        index = self.index(name)
+        t0 = time.perf_counter()
+        results = index.query_batch(prefs_list, top_n=top_n)
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            m = self._scorer_metrics(name)
+            m["queries"] += 1
+            m["users"] += len(prefs_list)
+            m["query_seconds"] += elapsed
+        return self.hydrate(results) if hydrate else results
+
+    def rank(self, name: str, prefs: Dict[str, Any], top_n: int = 10, hydrate: bool = True) -> List[Dict[str, Any]]:
+        return self.rank_batch(name, [prefs], top_n=top_n, hydrate=hydrate)[0]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._metrics)
+            out["scorers"] = {k: dict(v) for k, v in self._metrics["scorers"].items()}
+            snap = self._snapshot
+            out["version"] = snap.version if snap else None
+            out["rows"] = len(snap.rows_by_id) if snap else 0
+            out["indexes"] = sorted(self._indexes)
+            return out
+
+    def on_catalog_change(self, event: Optional[str], animal_id: Any, row: Optional[Dict[str, Any]], version: int) -> None:
+        """
+        Hook de escrita em `animais`: append/sobrescrita no insert/update,
+        tombstone no delete/adoção. Se alguma versão intermediária foi perdida,
+        ou a alteração veio sem detalhes, tudo é descartado e recarregado depois.
+        """
+        with self._lock:
+            snap = self._snapshot
+            if snap is None:
+                return
+            if event is None or animal_id is None or snap.version != version - 1:
+                self._snapshot, self._indexes = None, {}
+                return
+            try:
+                if event in ("delete", "adopt") or row is None or not _available(row):
+                    snap.rows_by_id.pop(animal_id, None)
+                    for index in self._indexes.values():
+                        index.remove(animal_id)
+                else:
+                    # o snapshot guarda só as colunas de ranking (fase 1)
+                    narrow = {k: v for k, v in row.items() if k in _CATALOG_KEYS}
+                    merged = {**snap.rows_by_id.get(animal_id, {}), **narrow, "id": animal_id}
+                    snap.rows_by_id[animal_id] = merged
+                    for index in self._indexes.values():
+                        index.upsert(merged)
+                snap.version = version
+                for index in self._indexes.values():
+                    index.version = version
+                self._metrics["incremental_updates"] += 1
+            except Exception:
+                self._snapshot, self._indexes = None, {}
+                raise
+
+
+default_engine = ScoringEngine()
+catalog.subscribe(default_engine.on_catalog_change)
+
+
+def rank(name: str, prefs: Dict[str, Any], top_n: int = 10, hydrate: bool = True) -> List[Dict[str, Any]]:
+    """Top-N do scorer `name` para um perfil, no motor padrão."""
+    return default_engine.rank(name, prefs, top_n=top_n, hydrate=hydrate)
+
+
+def rank_batch(
+    name: str,
+    prefs_list: List[Dict[str, Any]],
+    top_n: int = 10,
+    hydrate: bool = True,
+) -> List[List[Dict[str, Any]]]:
+    """Top-N do scorer `name` para vários perfis, no motor padrão."""
+    return default_engine.rank_batch(name, prefs_list, top_n=top_n, hydrate=hydrate)
+
+
+def metrics() -> Dict[str, Any]:
+    return default_engine.metrics()
+
+
+def reset() -> None:
+    default_engine.reset()
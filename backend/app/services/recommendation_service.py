@@ -1,8 +1,12 @@
 from __future__ import annotations
 
 from typing import Any, Dict, List, Optional
+from ..constants import SQL_SELECT_PERFIL_PREFS
 from ..extensions.db import get_conn
-from ..recommendation.engine import knn_rank
+from ..recommendation import scoring
+
+# scorer do motor de recomendação usado pelo serviço (kNN one-hot ponderado)
+SCORER = "weighted_onehot_knn"
 
 
 def _carregar_prefs(usuario_id: Optional[int], params: Dict[str, Any]) -> Dict[str, Any]:
@@ -26,14 +30,7 @@ def _carregar_prefs(usuario_id: Optional[int], params: Dict[str, Any]) -> Dict[s
         try:
             conn = get_conn()
             cur = conn.cursor(dictionary=True)
-            cur.execute(
-                """
-                SELECT tipo_moradia, tem_criancas, tempo_disponivel_horas_semana, estilo_vida
-                FROM perfil_adotante
-                WHERE usuario_id = %s
-                """,
-                (usuario_id,),
-            )
+            cur.execute(SQL_SELECT_PERFIL_PREFS, (usuario_id,))
             row = cur.fetchone()
             cur.close()
             conn.close()
@@ -44,27 +41,30 @@ def _carregar_prefs(usuario_id: Optional[int], params: Dict[str, Any]) -> Dict[s
         except Exception:
             pass
 
-    if prefs["tipo_moradia"] is None:
+    return _aplicar_padroes(prefs)
+
+
+def _aplicar_padroes(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """Completa campos ausentes do perfil com os valores padrão."""
+    if prefs.get("tipo_moradia") is None:
         prefs["tipo_moradia"] = "Apartamento"
-    if prefs["tem_criancas"] is None:
+    if prefs.get("tem_criancas") is None:
         prefs["tem_criancas"] = 0
-    if prefs["tempo_disponivel_horas_semana"] is None:
+    if prefs.get("tempo_disponivel_horas_semana") is None:
         prefs["tempo_disponivel_horas_semana"] = 7
-    if prefs["estilo_vida"] is None:
+    if prefs.get("estilo_vida") is None:
         prefs["estilo_vida"] = "Moderado"
-
     return prefs
 
 
-def _carregar_animais() -> List[dict]:
-    """Traz animais disponíveis com colunas necessárias para o KNN."""
+def _carregar_perfis() -> List[dict]:
+    """Traz todos os perfis de adotante (para recomendações em lote)."""
     conn = get_conn()
     cur = conn.cursor(dictionary=True)
     cur.execute(
         """
-        SELECT id, nome, especie, idade, porte, energia, bom_com_criancas, cidade, disponivel
-        FROM animais
-        WHERE disponivel = 1
+        SELECT usuario_id, tipo_moradia, tem_criancas, tempo_disponivel_horas_semana, estilo_vida
+        FROM perfil_adotante
         """
     )
     rows = cur.fetchall()
@@ -75,5 +75,20 @@ def _carregar_animais() -> List[dict]:
 
 def recomendar(usuario_id: Optional[int], params: Dict[str, Any], top_n: int = 10) -> List[dict]:
     prefs = _carregar_prefs(usuario_id, params)
-    animals = _carregar_animais()
-    return knn_rank(animals, prefs, top_n=top_n)
+    # o catálogo só é relido/reajustado quando algum animal mudou
+    return scoring.rank(SCORER, prefs, top_n=top_n)
+
+
+def recomendar_todos(top_n: int = 10) -> Dict[int, List[dict]]:
+    """
+    Recomendações para todos os perfis de `perfil_adotante` de uma vez
+    (digest noturno / pré-cálculo). Devolve {usuario_id: [animais...]}.
+    """
+    perfis = _carregar_perfis()
+    if not perfis:
+        return {}
+    prefs_list = [
+        _aplicar_padroes({k: v for k, v in p.items() if k != "usuario_id"}) for p in perfis
+    ]
+    ranked = scoring.rank_batch(SCORER, prefs_list, top_n=top_n)
+    return {p["usuario_id"]: r for p, r in zip(perfis, ranked)}
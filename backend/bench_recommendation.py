@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark do recomendador kNN (app/recommendation/engine.py).
+Mede como a latência por consulta cresce com o tamanho do catálogo:
+  - legado:  pandas + OneHotEncoder/MinMaxScaler + NearestNeighbors a cada consulta
+  - kernel:  topk_sq_distances sobre a matriz float32 completa (sem buckets)
+  - índice:  FeatureIndex.query (vetor do usuário + top-k sobre as assinaturas)
+Execute: python bench_recommendation.py [tamanhos...]
+Ex.:     python bench_recommendation.py 1000 10000 100000 1000000
+"""
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import NearestNeighbors
+
+from app.recommendation.engine import (
+    FeatureIndex,
+    as_float32_matrix,
+    topk_sq_distances,
+)
+from tests.reference_engine import build_feature_matrix, build_user_vector
+
+SIZES = [int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000, 1_000_000]
+LEGACY_MAX = 100_000  # acima disso o caminho legado leva minutos
+TOP_N = 10
+PREFS = {"tipo_moradia": "Casa", "tem_criancas": 1, "tempo_disponivel_horas_semana": 12, "estilo_vida": "Ativo"}
+
+
+def catalogo(n):
+    rnd = random.Random(42)
+    return [
+        {
+            "id": i,
+            "nome": f"Animal {i}",
+            "especie": rnd.choice(["Cachorro", "Gato"]),
+            "porte": rnd.choice(["Pequeno", "Medio", "Grande"]),
+            "energia": rnd.choice(["Baixa", "Media", "Alta"]),
+            "bom_com_criancas": rnd.randint(0, 1),
+            "idade": rnd.randint(0, 15),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def cronometra(fn, repeticoes):
+    fn()  # aquecimento
+    t0 = time.perf_counter()
+    for _ in range(repeticoes):
+        fn()
+    return (time.perf_counter() - t0) / repeticoes * 1000.0
+
+
+def legado(animals):
+    df = pd.DataFrame(animals)
+    X, _meta, enc, scaler, cat_cols, num_cols = build_feature_matrix(df)
+    x = build_user_vector(PREFS, enc, scaler, cat_cols, num_cols)
+    nbrs = NearestNeighbors(metric="euclidean", algorithm="brute").fit(X)
+    nbrs.kneighbors(x, n_neighbors=TOP_N)
+
+
+print(f"{'animais':>10} {'buckets':>8} {'build(ms)':>10} {'legado(ms)':>11} {'kernel(ms)':>11} {'indice(ms)':>11}")
+for n in SIZES:
+    animals = catalogo(n)
+
+    t0 = time.perf_counter()
+    index = FeatureIndex(animals)
+    build_ms = (time.perf_counter() - t0) * 1000.0
+
+    M32, norms = as_float32_matrix(index.matrix)
+    x = index.user_vector(PREFS)
+    kernel_ms = cronometra(lambda: topk_sq_distances(M32, norms, x, TOP_N), 20)
+    indice_ms = cronometra(lambda: index.query(PREFS, top_n=TOP_N), 200)
+    legado_ms = cronometra(lambda: legado(animals), 3) if n <= LEGACY_MAX else float("nan")
+
+    print(f"{n:>10} {index.n_buckets:>8} {build_ms:>10.1f} {legado_ms:>11.2f} {kernel_ms:>11.3f} {indice_ms:>11.3f}")
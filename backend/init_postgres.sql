@@ -1,3 +1,8 @@
+-- Schema inicial (primeiro boot do container). Colunas novas, índices e as
+-- tabelas de apoio (catalog_version...) vêm das migrações versionadas
+-- (app/extensions/migrations.py), aplicadas no startup (DB_AUTO_MIGRATE=1 nos
+-- docker-compose) e no deploy (`flask db-migrate` em scripts/deploy-ec2.sh).
+
 CREATE TABLE IF NOT EXISTS usuarios (
     id SERIAL PRIMARY KEY,
     nome TEXT NOT NULL,
@@ -32,6 +37,14 @@ CREATE TABLE IF NOT EXISTS animais (
     adotado_em TIMESTAMP
 );
 
+CREATE TABLE IF NOT EXISTS animal_features (
+    animal_id INTEGER PRIMARY KEY REFERENCES animais(id) ON DELETE CASCADE,
+    vec_porte REAL,
+    vec_criancas REAL,
+    vec_tempo REAL,
+    vec_atividade REAL
+);
+
 CREATE TABLE IF NOT EXISTS perfil_adotante (
     usuario_id INTEGER PRIMARY KEY REFERENCES usuarios(id) ON DELETE CASCADE,
     tipo_moradia TEXT,
@@ -26,57 +26,13 @@ _tmp_db_path = os.path.join(_tmp_dir.name, "test_db.sqlite")
 
 
 def _ensure_schema(path):
-    """Garante as tabelas necessárias para os testes (compatível com api.py e SQLite)."""
-    con = sqlite3.connect(path)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT,
-            email TEXT UNIQUE,
-            password_hash TEXT,
-            google_sub TEXT,
-            avatar_url TEXT
-        )
-        """
-    )
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS animais (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT,
-            especie TEXT,
-            raca TEXT,
-            idade TEXT,
-            porte TEXT,
-            descricao TEXT,
-            cidade TEXT,
-            photo_url TEXT,
-            donor_name TEXT,
-            donor_whatsapp TEXT,
-            doador_id INTEGER,
-            criado_em TEXT,
-            adotado_em TEXT,
-            energia TEXT,
-            bom_com_criancas INTEGER
-        )
-        """
-    )
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS perfil_adotante (
-            usuario_id INTEGER PRIMARY KEY,
-            tipo_moradia TEXT,
-            tem_criancas INTEGER,
-            tempo_disponivel_horas_semana INTEGER,
-            estilo_vida TEXT
-        )
-        """
-    )
-    con.commit()
-    con.close()
+    """Cria o schema dos testes com as mesmas migrações da aplicação."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from app.extensions import db as db_ext
+    from app.extensions import migrations
+
+    db_ext.init_db()
+    migrations.migrate()
 
 
 @pytest.fixture(scope="session")
@@ -151,4 +107,16 @@ def isolate_fs_and_env(monkeypatch, tmp_db_path):
     monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_db_path}")
     monkeypatch.setenv("FLASK_ENV", "testing")
     monkeypatch.setenv("SECRET_KEY", "test-secret")
-    yield
\ No newline at end of file
+    yield
+
+@pytest.fixture(autouse=True)
+def reset_recommendation_index():
+    """Cada teste começa sem snapshot/índices do motor de recomendação em cache."""
+    from app.recommendation import scoring
+    from app.extensions.response_cache import response_cache
+
+    scoring.reset()
+    response_cache.reset()
+    yield
+    scoring.reset()
+    response_cache.reset()
@@ -11,3 +11,29 @@ def test_adopt_mark_unmark_requires_auth(client):
     r = client.patch("/api/animais/1/adopt", json={"action":"mark"})
     assert r.status_code in (401,404)
 
+
+
+def test_adoption_metrics_counts_days_in_range(client):
+    from datetime import datetime, timedelta, timezone
+
+    from app.extensions import db as db_ext
+
+    today = datetime.now(timezone.utc).date()
+    dias = [today, today, today - timedelta(days=2), today - timedelta(days=30)]
+    with db_ext.db() as conn:
+        with conn.cursor() as cur:
+            for i, d in enumerate(dias):
+                cur.execute(
+                    "INSERT INTO animais (nome, especie, adotado_em) VALUES (%s, %s, %s)",
+                    (f"Metrica {i}", "Gato", f"{d.isoformat()} 23:59:59"),
+                )
+    try:
+        j = client.get("/api/animais/metrics/adoptions?days=7").get_json()
+        counts = {d["day"]: d["count"] for d in j["days"]}
+        assert counts[today.isoformat()] >= 2
+        assert counts[(today - timedelta(days=2)).isoformat()] >= 1
+        assert (today - timedelta(days=30)).isoformat() not in counts
+    finally:
+        with db_ext.db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM animais WHERE nome LIKE %s", ("Metrica %",))
@@ -58,3 +58,36 @@ def test_recommendation_flow(client):
     
     top_animal = data["items"][0]
     assert "cachorro" in top_animal["especie"].lower()
+
+
+def test_recomendacoes_sql_scoring_matches_memory(client, monkeypatch):
+    """RECOMMENDATION_SCORING=sql devolve os mesmos animais/scores do motor em memória."""
+    import app.api as api_mod
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 77, raising=False)
+    client.post("/api/perfil_adotante", json={
+        "tipo_moradia": "apartamento", "tem_criancas": 0,
+        "tempo_disponivel_horas_semana": 5, "estilo_vida": "tranquilo",
+    })
+    for nome, especie, porte, idade in [
+        ("Sql Gato", "gato", "pequeno", "8"),
+        ("Sql Cao", "cachorro", "medio", "3"),
+        ("Sql Filhote", "cachorro", "pequeno", "1"),
+    ]:
+        client.post("/api/animais", json={
+            "nome": nome, "especie": especie, "porte": porte, "idade": idade,
+            "descricao": "x", "cidade": "SP", "bom_com_criancas": 0,
+        })
+    adotado = client.post("/api/animais", json={
+        "nome": "Sql Adotado", "especie": "gato", "porte": "pequeno", "idade": "8",
+        "descricao": "x", "cidade": "SP",
+    }).get_json()["id"]
+    client.put(f"/api/animais/{adotado}", json={"adotado_em": "2024-01-01T00:00:00"})
+
+    memoria = client.get("/api/recomendacoes?n=3").get_json()
+    monkeypatch.setenv("RECOMMENDATION_SCORING", "sql")
+    sql = client.get("/api/recomendacoes?n=3").get_json()
+
+    assert sql["ids"] == memoria["ids"]
+    assert adotado not in sql["ids"]
+    assert [a["compatibility_score"] for a in sql["items"]] == [a["compatibility_score"] for a in memoria["items"]]
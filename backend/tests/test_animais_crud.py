@@ -33,3 +33,54 @@ def test_criar_e_listar_animal(client, monkeypatch):
     items = lista["items"] if isinstance(lista, dict) and "items" in lista else lista
     assert any(a.get("nome") == "Bolt" for a in items), f"esperava 'Bolt' em items, body={lista}"
 
+
+
+def _features(animal_id):
+    from app.extensions.db import db
+
+    with db() as conn:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute(
+                "SELECT vec_porte, vec_criancas, vec_tempo, vec_atividade FROM animal_features WHERE animal_id=%s",
+                (animal_id,),
+            )
+            return cur.fetchone()
+
+
+def test_animal_features_gravadas_no_create_update_delete(client, monkeypatch):
+    import app.api as api_mod
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 3, raising=False)
+    novo = {"nome": "Mingau", "especie": "Gato", "idade": "5", "porte": "Pequeno",
+            "cidade": "Curitiba", "descricao": "Gato calmo", "bom_com_criancas": 0}
+    aid = client.post("/api/animais", json=novo).get_json()["id"]
+    assert _features(aid) == {"vec_porte": 0.0, "vec_criancas": 0.0, "vec_tempo": 0.0, "vec_atividade": 0.0}
+
+    r = client.put(f"/api/animais/{aid}", json={**novo, "especie": "Cachorro", "porte": "Grande", "bom_com_criancas": 1})
+    assert r.status_code == 200
+    assert _features(aid) == {"vec_porte": 1.0, "vec_criancas": 1.0, "vec_tempo": 1.0, "vec_atividade": 1.0}
+
+    assert client.delete(f"/api/animais/{aid}").status_code == 200
+    assert _features(aid) is None
+
+
+def test_backfill_animal_features(client):
+    from app.api import backfill_animal_features
+    from app.extensions.db import db
+
+    with db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO animais (nome, especie, idade, porte, bom_com_criancas) VALUES (%s,%s,%s,%s,%s)",
+                ("Antigo", "Cachorro", "9", "Medio", 1),
+            )
+            aid = cur.lastrowid
+
+    assert _features(aid) is None
+    assert backfill_animal_features() >= 1
+    assert _features(aid) == {"vec_porte": 0.5, "vec_criancas": 1.0, "vec_tempo": 1.0, "vec_atividade": 1.0}
+    assert backfill_animal_features() == 0
+
+    result = client.application.test_cli_runner().invoke(args=["backfill-animal-features", "--all"])
+    assert result.exit_code == 0
+    assert "animais gravados" in result.output
@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from app.extensions.breaker import CircuitBreaker, DatabaseUnavailable
+
+
+def test_opens_after_threshold_and_fails_fast():
+    gate = threading.Event()
+    br = CircuitBreaker(lambda: None, failure_threshold=2, sleep=lambda _s: gate.wait(2))
+    br.check()
+    br.record_failure(OSError("conexão recusada"))
+    assert br.state == "closed"
+    br.record_failure(OSError("conexão recusada"))
+    assert br.state == "open"
+
+    with pytest.raises(DatabaseUnavailable) as info:
+        br.check()
+    assert info.value.retry_after >= 1
+    snap = br.snapshot()
+    assert snap["trips"] == 1 and snap["rejected"] == 1 and "recusada" in snap["last_error"]
+
+    gate.set()  # libera a thread de reconexão
+    br.probe_thread.join(2)
+    assert br.state == "closed"
+    br.check()
+
+
+def test_success_resets_failure_count():
+    br = CircuitBreaker(lambda: None, failure_threshold=2)
+    br.record_failure(OSError("x"))
+    br.record_success()
+    br.record_failure(OSError("x"))
+    assert br.state == "closed"
+
+
+def test_probe_backs_off_until_reconnect_succeeds():
+    delays = []
+    attempts = []
+
+    def reconnect():
+        attempts.append(1)
+        if len(attempts) < 4:
+            raise OSError("ainda fora")
+
+    br = CircuitBreaker(reconnect, backoff=1, max_backoff=3, sleep=delays.append)
+    br.trip(OSError("fora"))
+    br.probe_thread.join(2)
+
+    assert delays == [1, 2, 3, 3]
+    assert br.state == "closed" and br.snapshot()["probes"] == 4
@@ -0,0 +1,260 @@
+import fnmatch
+import socketserver
+import threading
+import time
+
+import pytest
+
+from app.extensions import cache as cache_mod
+from app.extensions.cache import CacheBackend, LocalCache, RedisCache
+
+
+class FakeRedis:
+    """Estado de um servidor Redis mínimo: strings com PX, sets e contadores."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        self.commands = []
+        self.error = None  # resposta de erro para todos os comandos (ex.: NOAUTH)
+
+    def _alive(self, key):
+        exp = self.expires.get(key)
+        if exp is not None and exp <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def run(self, args):
+        cmd, args = args[0].upper().decode(), args[1:]
+        self.commands.append(cmd)
+        if self.error:
+            return ValueError(self.error)
+        with self.lock:
+            if cmd in ("AUTH", "SELECT", "PING"):
+                return "OK"
+            if cmd == "MGET":
+                return [self.data[k] if self._alive(k) else None for k in args]
+            if cmd == "SET":
+                key, value = args[0], args[1]
+                self.data[key] = value
+                self.expires.pop(key, None)
+                if len(args) > 3 and args[2].upper() == b"PX":
+                    self.expires[key] = time.monotonic() + int(args[3]) / 1000
+                return "OK"
+            if cmd == "SADD":
+                members = self.data.setdefault(args[0], set())
+                before = len(members)
+                members.update(args[1:])
+                return len(members) - before
+            if cmd == "SMEMBERS":
+                return sorted(self.data.get(args[0], set())) if self._alive(args[0]) else []
+            if cmd == "PEXPIRE":
+                if not self._alive(args[0]):
+                    return 0
+                self.expires[args[0]] = time.monotonic() + int(args[1]) / 1000
+                return 1
+            if cmd == "DEL":
+                n = 0
+                for key in args:
+                    if self._alive(key):
+                        n += 1
+                    self.data.pop(key, None)
+                    self.expires.pop(key, None)
+                return n
+            if cmd == "INCRBY":
+                value = int(self.data.get(args[0], b"0")) + int(args[1]) if self._alive(args[0]) else int(args[1])
+                self.data[args[0]] = str(value).encode()
+                return value
+            if cmd == "EVAL":  # só o script de invalidação por tags do RedisCache
+                n = 0
+                for tag in args[2:2 + int(args[1])]:
+                    for name in self.data.get(tag, set()) if self._alive(tag) else ():
+                        n += int(self._alive(name))
+                        self.data.pop(name, None)
+                    self.data.pop(tag, None)
+                return n
+            if cmd == "SCAN":
+                pattern = args[2].decode()
+                return [b"0", [k for k in list(self.data) if self._alive(k) and fnmatch.fnmatch(k.decode(), pattern)]]
+        return ValueError(f"ERR unknown command {cmd}")
+
+
+def _reply(value):
+    if isinstance(value, ValueError):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(_reply(v) for v in value)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                n = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(n + 2)[:-2])
+            self.wfile.write(_reply(self.server.state.run(args)))
+
+
+@pytest.fixture
+def redis_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.state = FakeRedis()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["local", "redis"])
+def backend(request, redis_server):
+    if request.param == "local":
+        return LocalCache(max_entries=100, ttl=60)
+    host, port = redis_server.server_address
+    return RedisCache(f"redis://:segredo@{host}:{port}/2", prefix="t:", ttl=60)
+
+
+def test_backend_contract(backend):
+    backend.set("a", {"x": 1}, tags=("animais",))
+    backend.set("b", (b"corpo", "application/json"), tags=("animal:7",))
+    assert backend.get("a") == {"x": 1}
+    assert backend.get_many(["a", "b", "nada"]) == {"a": {"x": 1}, "b": (b"corpo", "application/json")}
+
+    assert backend.incr("contador") == 1
+    assert backend.incr("contador", 5) == 6
+    assert backend.get("contador") == 6
+
+    assert backend.invalidate("animal:7") == 1
+    assert backend.get("b") is None and backend.get("a") == {"x": 1}
+    assert backend.delete("a", "nada") == 1
+
+    backend.set("c", 3, ttl=0.05)
+    time.sleep(0.1)
+    assert backend.get("c") is None
+
+    backend.set("d", 4)
+    backend.clear()
+    assert backend.get_many(["d", "contador"]) == {}
+    m = backend.metrics()
+    assert m["hits"] >= 4 and m["misses"] >= 3
+
+
+def test_incomplete_backend_fails_on_creation():
+    class SoGet(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        SoGet()
+
+
+def test_redis_values_shared_between_instances(redis_server):
+    host, port = redis_server.server_address
+    url = f"redis://{host}:{port}/0"
+    a, b = RedisCache(url, prefix="p:"), RedisCache(url, prefix="p:")
+    a.set("k", [1, 2], tags=("animais",))
+    assert b.get("k") == [1, 2]  # outro processo (ou depois de um restart) vê a entrada
+    b.invalidate("animais")
+    assert a.get("k") is None
+    assert "SMEMBERS" not in redis_server.state.commands  # ler e apagar numa operação só
+    other = RedisCache(url, prefix="outro:")
+    other.clear()
+    a.set("k", 1)
+    other.clear()
+    assert a.get("k") == 1  # clear só mexe no próprio prefixo
+
+
+def test_redis_values_are_not_pickled(redis_server):
+    import pickle
+
+    host, port = redis_server.server_address
+    c = RedisCache(f"redis://{host}:{port}/0", prefix="p:")
+    c.set("resp", (b"\x00corpo", "application/json"))
+    c.set("linhas", [{"id": 1, "especie": "Gato", "vec_porte": 0.5}])
+    assert redis_server.state.data[b"p:resp"] == b"Rapplication/json\x00\x00corpo"
+    assert c.get("resp") == (b"\x00corpo", "application/json")
+    assert c.get("linhas") == [{"id": 1, "especie": "Gato", "vec_porte": 0.5}]
+
+    class Evil:
+        def __reduce__(self):
+            return (exec, ("raise SystemExit('executou')",))
+
+    redis_server.state.data[b"p:mal"] = pickle.dumps(Evil())
+    assert c.get("mal") is None  # lido como lixo, nunca desserializado com pickle
+    c.set("objeto", object())
+    assert c.get("objeto") is None
+
+
+def test_redis_down_is_a_miss(redis_server):
+    host, port = redis_server.server_address
+    redis_server.shutdown()
+    redis_server.server_close()
+    c = RedisCache(f"redis://{host}:{port}/0", timeout=0.1, retry_after=60)
+    c.set("k", 1)
+    assert c.get("k") is None
+    assert c.metrics()["errors"] == 1  # a segunda chamada nem tenta: backend em pausa
+
+
+def test_redis_error_reply_is_a_miss(redis_server):
+    host, port = redis_server.server_address
+    redis_server.state.error = "NOAUTH Authentication required."
+    c = RedisCache(f"redis://:errada@{host}:{port}/0", timeout=0.1, retry_after=0.05)
+    c.set("k", 1)  # AUTH falha no connect: nenhum erro sobe para o request
+    assert c.get("k") is None
+    assert c.metrics()["errors"] == 1 and c._idle == []
+
+    redis_server.state.error = None
+    time.sleep(0.06)
+    c.set("k", 1)
+    redis_server.state.error = "READONLY You can't write against a read only replica."
+    c.set("k", 2)
+    assert c.metrics()["errors"] == 2 and None not in c._idle
+    redis_server.state.error = None
+    time.sleep(0.06)
+    assert c.get("k") == 1
+
+
+def test_make_backend_from_env(monkeypatch, redis_server):
+    monkeypatch.delenv("CACHE_BACKEND", raising=False)
+    assert isinstance(cache_mod.make_backend("resp:"), LocalCache)
+
+    host, port = redis_server.server_address
+    monkeypatch.setenv("CACHE_BACKEND", "redis")
+    monkeypatch.setenv("CACHE_URL", f"redis://{host}:{port}/0")
+    monkeypatch.setenv("CACHE_PREFIX", "app:")
+    backend = cache_mod.make_backend("resp:")
+    assert isinstance(backend, RedisCache) and backend.shared
+    backend.set("x", 1)
+    assert b"app:resp:x" in redis_server.state.data
+
+    monkeypatch.setenv("CACHE_BACKEND", "memcached")
+    with pytest.raises(RuntimeError):
+        cache_mod.make_backend("resp:")
+
+
+def test_shared_response_cache_skips_remote_invalidation(monkeypatch, redis_server):
+    from app.extensions import catalog
+    from app.extensions import response_cache as rc
+
+    host, port = redis_server.server_address
+    shared = RedisCache(f"redis://{host}:{port}/0", prefix="resp:")
+    monkeypatch.setattr(rc, "response_cache", shared)
+    shared.set("lista", 1, tags=("animais",))
+    rc.on_catalog_change(catalog.REMOTE, None, None, 1)
+    assert shared.get("lista") == 1  # quem escreveu já invalidou
+    rc.on_catalog_change("update", 5, {}, 2)
+    assert shared.get("lista") is None
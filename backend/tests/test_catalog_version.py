@@ -0,0 +1,188 @@
+import socket
+import time
+
+import pytest
+
+from app.extensions import catalog
+from app.extensions import db as db_mod
+from app.extensions import migrations
+from app.extensions.response_cache import response_cache
+
+
+@pytest.fixture
+def shared_db(monkeypatch, tmp_path):
+    """Banco SQLite próprio com as migrações e o estado compartilhado do catálogo zerado."""
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", str(tmp_path / "catalog.db"))
+    monkeypatch.setattr(catalog, "_shared_version", None)
+    monkeypatch.setattr(catalog, "_synced_at", -1)
+    migrations.migrate()
+
+
+def _other_worker_writes():
+    """Escrita feita por outro processo: só a tabela muda, nenhum ouvinte local é chamado."""
+    with db_mod.db() as conn:
+        cur = conn.cursor()
+        return catalog.bump_in_transaction(cur)
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event, animal_id, row, version):
+        self.events.append((event, animal_id))
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    rec = Recorder()
+    monkeypatch.setattr(catalog, "_listeners", [*catalog._listeners, rec])
+    return rec
+
+
+def test_bump_is_part_of_the_write_transaction(shared_db):
+    assert catalog.read_shared_version() == 0
+    assert _other_worker_writes() == 1
+
+    with pytest.raises(RuntimeError):
+        with db_mod.db() as conn:
+            cur = conn.cursor()
+            catalog.bump_in_transaction(cur)
+            raise RuntimeError("escrita falhou")
+    assert catalog.read_shared_version() == 1  # rollback desfez o incremento
+
+
+def test_poll_invalidates_after_write_in_other_process(shared_db, recorder):
+    watcher = catalog.VersionWatcher(read=catalog.read_shared_version)
+    assert watcher.poll() is True  # primeira leitura: sincroniza
+    assert catalog.version_tag() == "g0"
+    assert watcher.poll() is False
+
+    response_cache.set("k", b"x", tags=("animais",))
+    _other_worker_writes()
+    assert watcher.poll() is True
+    assert recorder.events[-1] == (catalog.REMOTE, None)
+    assert response_cache.get("k") is None
+    assert catalog.version_tag() == "g1"
+
+
+def test_own_writes_stay_incremental_and_gaps_invalidate(shared_db, recorder):
+    catalog.VersionWatcher(read=catalog.read_shared_version).poll()
+
+    catalog.animal_changed("update", 7, {"nome": "x"}, db_version=_other_worker_writes())
+    assert recorder.events[-1] == ("update", 7)
+    assert catalog.version_tag() == "g1"
+
+    _other_worker_writes()  # outro worker, ainda não visto
+    catalog.animal_changed("update", 8, {"nome": "y"}, db_version=_other_worker_writes())
+    assert recorder.events[-1] == (None, None)
+    assert catalog.version_tag() == "g3"
+
+    n = len(recorder.events)
+    assert catalog.observe(3) is False and len(recorder.events) == n
+
+
+def test_api_write_bumps_shared_version(client, monkeypatch, tmp_db_path):
+    import app.api as api_mod
+
+    monkeypatch.setitem(client.application.view_functions, "api.create_animal", api_mod.create_animal)
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", tmp_db_path)
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 3, raising=False)
+    monkeypatch.setattr(catalog, "_shared_version", None)
+    monkeypatch.setattr(catalog, "_synced_at", -1)
+    before = catalog.read_shared_version()
+    r = client.post("/api/animais", json={"nome": "V", "especie": "Gato", "cidade": "X", "descricao": "d"})
+    assert r.status_code == 200
+    assert catalog.read_shared_version() == before + 1
+
+
+def test_watcher_thread_polls(shared_db, recorder):
+    watcher = catalog.VersionWatcher(interval=0.01, read=catalog.read_shared_version).start()
+    try:
+        _other_worker_writes()
+        deadline = time.monotonic() + 2
+        while catalog.version_tag() != "g1" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert catalog.version_tag() == "g1"
+    finally:
+        watcher.stop()
+        watcher.thread.join(1)
+
+
+def test_watcher_starts_and_retries_when_first_poll_fails(shared_db):
+    reads = []
+
+    def read():
+        reads.append(1)
+        if len(reads) < 3:
+            raise RuntimeError("banco fora do ar")
+        return 7
+
+    watcher = catalog.VersionWatcher(interval=0.01, read=read).start()
+    try:
+        assert watcher.thread.is_alive() and watcher.stats["errors"] == 1
+        assert not catalog.version_tag().startswith("g")  # sem sincronizar: tag do processo
+        deadline = time.monotonic() + 2
+        while catalog.version_tag() != "g7" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert catalog.version_tag() == "g7" and watcher.stats["errors"] == 2
+    finally:
+        watcher.stop()
+        watcher.thread.join(1)
+
+
+class FakeNotify:
+    def __init__(self, payload):
+        self.payload = payload
+
+
+class FakeListenConn:
+    """Conexão em LISTEN: o socket fica legível quando chega um NOTIFY."""
+
+    def __init__(self):
+        self.sock, self.peer = socket.socketpair()
+        self.notifies = []
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def notify(self, payload):
+        self.notifies.append(FakeNotify(payload))
+        self.peer.send(b"x")
+
+    def poll(self):
+        self.sock.recv(64)
+
+    def close(self):
+        self.sock.close()
+        self.peer.close()
+
+
+def test_watcher_listen_notify(shared_db, recorder):
+    conn = FakeListenConn()
+    reads = []
+
+    def read():
+        reads.append(1)
+        return 0
+
+    watcher = catalog.VersionWatcher(safety_interval=5, read=read, listen=lambda: conn).start()
+    try:
+        deadline = time.monotonic() + 2
+        while len(reads) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)  # leitura do start + a feita logo depois do LISTEN
+        conn.notify("4")
+        conn.notify("5")
+        while catalog.version_tag() != "g5" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert catalog.version_tag() == "g5"
+        assert watcher.stats["notifies"] == 2 and len(reads) == 2
+    finally:
+        watcher.stop()
+        conn.notify("5")  # acorda o select
+        watcher.thread.join(1)
+        conn.close()
@@ -1,4 +1,6 @@
-﻿import pytest
+﻿import sqlite3
+
+import pytest
 
 import app.extensions.db as db_mod
 
@@ -116,7 +118,7 @@ def test_init_db_postgres_path(monkeypatch):
     monkeypatch.setenv("DATABASE_URL", "postgres://example")
     monkeypatch.delenv("PYTEST_CURRENT_TEST", raising=False)
     monkeypatch.setattr(db_mod, "_psycopg2", object())
-    monkeypatch.setattr(db_mod, "ThreadedConnectionPool", lambda *_a, **_k: pool)
+    monkeypatch.setattr(db_mod, "BlockingPool", lambda *_a, **_k: pool)
 
     prev = (db_mod._using_sqlite, db_mod._using_postgres, db_mod._sqlite_path, db_mod._pg_pool)
     try:
@@ -227,3 +229,496 @@ def test_db_context_manager_commit_and_rollback(monkeypatch):
             raise ValueError("boom")
 
     assert raw2.rolled_back == 1
+
+
+def test_sqlite_pool_reuses_per_thread_connections(tmp_path):
+    import threading
+
+    pool = db_mod._SQLitePool(max_idle_per_thread=2)
+    path = str(tmp_path / "pool.db")
+
+    conn = pool.acquire(path)
+    raw = conn._conn
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE t(id INTEGER PRIMARY KEY)")
+    conn.commit()
+    conn.close()
+
+    again = pool.acquire(path)
+    assert again._conn is raw  # mesma thread: reaproveita
+    nested = pool.acquire(path)
+    assert nested is not again  # bloco aninhado: conexão distinta
+    nested.close()
+    again.close()
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(pool.acquire(path)))
+    t.start()
+    t.join()
+    assert other[0] is not again  # outra thread: conjunto próprio
+    assert pool.stats["opened"] == 3 and pool.stats["reused"] == 1
+    pool.close_all()
+
+
+def test_sqlite_pool_closes_idle_connections_of_finished_threads(tmp_path):
+    import gc
+    import threading
+
+    pool = db_mod._SQLitePool()
+    raws = []
+
+    def worker():
+        conn = pool.acquire(str(tmp_path / "pool.db"))
+        raws.append(conn._conn)
+        conn.close()  # fica ociosa na thread, que termina em seguida
+
+    t = threading.Thread(target=worker)
+    t.start()
+    t.join()
+    gc.collect()
+    with pytest.raises(sqlite3.ProgrammingError):
+        raws[0].execute("SELECT 1")  # fechada junto com a thread
+    assert len(pool._open) == 0
+
+
+def test_sqlite_pool_pragmas_and_readonly_set(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_SYNCHRONOUS", "OFF")
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT_MS", "1234")
+    pool = db_mod._SQLitePool()
+    path = str(tmp_path / "pragmas.db")
+
+    rw = pool.acquire(path)
+    assert rw.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert rw.execute("PRAGMA synchronous").fetchone()[0] == 0
+    assert rw.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    rw.execute("CREATE TABLE t(id INTEGER PRIMARY KEY)")
+    rw.commit()
+
+    ro = pool.acquire(path, readonly=True)
+    assert ro is not rw and ro.readonly
+    with pytest.raises(Exception):
+        ro.execute("INSERT INTO t(id) VALUES (1)")
+    ro.close()
+    assert pool.acquire(path, readonly=True) is ro
+    pool.close_all()
+
+
+def test_sqlite_pragmas_reject_injection(monkeypatch):
+    monkeypatch.setenv("SQLITE_JOURNAL_MODE", "WAL; DROP TABLE x")
+    with pytest.raises(ValueError):
+        db_mod.sqlite_pragmas()
+
+
+def test_db_readonly_uses_sqlite_readonly_set(monkeypatch, tmp_path):
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", str(tmp_path / "ro.db"))
+
+    with db_mod.db(readonly=True) as conn:
+        assert conn.raw.readonly is True
+    with db_mod.db() as conn:
+        assert conn.raw.readonly is False
+
+
+def test_request_scoped_connection_reused_and_nested(monkeypatch, tmp_path):
+    from flask import Flask
+
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", str(tmp_path / "req.db"))
+    checkouts = []
+    real_get = db_mod._get_raw_conn
+
+    def counting_get(readonly=False):
+        conn = real_get(readonly=readonly)
+        checkouts.append(conn)
+        return conn
+
+    monkeypatch.setattr(db_mod, "_get_raw_conn", counting_get)
+
+    app = Flask("req_scope_test")
+    app.teardown_request(db_mod.release_request_connections)
+
+    @app.get("/x")
+    def view():
+        with db_mod.db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("CREATE TABLE IF NOT EXISTS t(v TEXT)")
+                cur.execute("INSERT INTO t(v) VALUES (%s)", ("externo",))
+            with db_mod.db() as inner:  # aninhado: SAVEPOINT
+                with inner.cursor() as cur:
+                    cur.execute("INSERT INTO t(v) VALUES (%s)", ("aninhado",))
+            try:
+                with db_mod.db() as inner:
+                    with inner.cursor() as cur:
+                        cur.execute("INSERT INTO t(v) VALUES (%s)", ("desfeito",))
+                    raise ValueError("boom")
+            except ValueError:
+                pass
+        with db_mod.db(readonly=True) as conn:  # leitura vê as escritas do request
+            with conn.cursor() as cur:
+                cur.execute("SELECT v FROM t ORDER BY rowid")
+                return {"v": [r[0] for r in cur.fetchall()]}
+
+    resp = app.test_client().get("/x")
+    assert resp.get_json() == {"v": ["externo", "aninhado"]}
+    assert len(checkouts) == 1
+
+    # a conexão voltou ao pool no teardown e os dados foram commitados
+    with db_mod.db(readonly=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM t")
+            assert cur.fetchone()[0] == 2
+
+
+def test_db_readonly_skips_commit_and_uses_autocommit_on_postgres(monkeypatch):
+    raw = DummyRawConn()
+    monkeypatch.setattr(db_mod, "_get_raw_conn", lambda readonly=False: raw)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    with db_mod.db(readonly=True) as conn:
+        conn.cursor()
+    assert raw.committed == 0
+
+    class Pool:
+        def getconn(self):
+            return DummyRawConn()
+
+    monkeypatch.undo()
+    monkeypatch.setattr(db_mod, "_using_sqlite", False)
+    monkeypatch.setattr(db_mod, "_using_postgres", True)
+    monkeypatch.setattr(db_mod, "_pg_pool", Pool())
+    assert db_mod._get_raw_conn(readonly=True).autocommit is True
+    assert db_mod._get_raw_conn().autocommit is False
+
+
+def test_readonly_route_makes_request_blocks_readonly(monkeypatch, tmp_path):
+    from flask import Flask
+
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", str(tmp_path / "ro_route.db"))
+    with db_mod.db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CREATE TABLE t(v TEXT)")
+
+    app = Flask("ro_route_test")
+    app.teardown_request(db_mod.release_request_connections)
+
+    @app.get("/ler")
+    @db_mod.readonly_route
+    def ler():
+        with db_mod.db() as conn:
+            assert conn.raw.readonly is True
+            with conn.cursor() as cur:
+                cur.execute("INSERT INTO t(v) VALUES ('x')")
+        return "ok"
+
+    @app.get("/escrever")
+    def escrever():
+        with db_mod.db() as conn:
+            assert conn.raw.readonly is False
+        return "ok"
+
+    client = app.test_client()
+    assert client.get("/ler").status_code == 500  # query_only recusa a escrita
+    assert client.get("/escrever").status_code == 200
+
+
+def _sqlite_with_origin(path, origin):
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE t(v TEXT)")
+    con.execute("INSERT INTO t(v) VALUES (?)", (origin,))
+    con.commit()
+    con.close()
+
+
+def _origin(**kw):
+    with db_mod.db(**kw) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT v FROM t")
+            return cur.fetchone()[0]
+
+
+def test_replica_routing_round_robin_with_sqlite_files(monkeypatch, tmp_path):
+    from flask import Flask
+
+    primary, r1, r2 = (str(tmp_path / f"{n}.db") for n in ("primario", "r1", "r2"))
+    for path, origin in ((primary, "primario"), (r1, "r1"), (r2, "r2")):
+        _sqlite_with_origin(path, origin)
+    monkeypatch.setattr(db_mod, "_using_sqlite", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", None)
+    monkeypatch.setattr(db_mod, "_replicas", None)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{primary}")
+    monkeypatch.setenv("DATABASE_REPLICA_URLS", f"sqlite:///{r1}, sqlite:///{r2}")
+    db_mod.init_db()
+
+    try:
+        assert [_origin(readonly=True) for _ in range(4)] == ["r1", "r2", "r1", "r2"]
+        assert _origin() == "primario"
+        assert _origin(readonly=True, replica=False) == "primario"
+        assert db_mod.pool_metrics()["replicas"]["checkouts"] == 4
+
+        app = Flask("replica_test")
+        app.teardown_request(db_mod.release_request_connections)
+
+        @app.get("/ler")
+        @db_mod.readonly_route
+        def ler():
+            return {"v": [_origin(), _origin()]}  # uma conexão de réplica por request
+
+        @app.get("/proprio")
+        @db_mod.readonly_route(replica=False)
+        def proprio():
+            return {"v": [_origin()]}
+
+        @app.get("/escreve-e-le")
+        def escreve_e_le():
+            with db_mod.db() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("UPDATE t SET v = %s", ("escrito",))
+            return {"v": [_origin(readonly=True)]}  # read-your-writes: primário
+
+        client = app.test_client()
+        assert client.get("/ler").get_json()["v"] in (["r1", "r1"], ["r2", "r2"])
+        assert client.get("/proprio").get_json() == {"v": ["primario"]}
+        assert client.get("/escreve-e-le").get_json() == {"v": ["escrito"]}
+    finally:
+        db_mod._set_replicas([])
+
+
+def test_replica_failure_falls_back_to_primary(monkeypatch):
+    raw = DummyRawConn()
+
+    class Down:
+        def getconn(self):
+            raise RuntimeError("réplica fora")
+
+    monkeypatch.setattr(db_mod, "_using_sqlite", False)
+    monkeypatch.setattr(db_mod, "_using_postgres", True)
+    monkeypatch.setattr(db_mod, "_replicas", db_mod._ReplicaSet([Down()]))
+    monkeypatch.setattr(db_mod, "_get_raw_conn", lambda readonly=False: raw)
+    with db_mod.db(readonly=True) as conn:
+        assert conn.raw is raw
+    assert db_mod._replicas.stats["fallbacks"] == 1
+
+
+def test_replica_urls_must_match_primary_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(db_mod, "_using_sqlite", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", None)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'p.db'}")
+    monkeypatch.setenv("DATABASE_REPLICA_URLS", "mysql://replica/db")
+    with pytest.raises(RuntimeError):
+        db_mod.init_db()
+
+
+def test_normalize_sql_strips_literals_and_whitespace():
+    sql = "SELECT *\n   FROM t  WHERE a = 'x''y' AND b=42 AND c IN (%s, %s,%s) AND d=$1"
+    assert db_mod.normalize_sql(sql) == "SELECT * FROM t WHERE a = ? AND b=? AND c IN (...) AND d=?"
+    # só placeholders posicionais viram `?`: outros `$` ficam como estão
+    assert db_mod.normalize_sql("SELECT $$a$$ || col$x FROM t WHERE id = $12") == "SELECT $$a$$ || col$x FROM t WHERE id = ?"
+
+
+def test_request_query_summary_and_repeat_warning(monkeypatch, tmp_path, caplog):
+    import logging
+
+    from flask import Flask
+
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", str(tmp_path / "queries.db"))
+    monkeypatch.setenv("DB_QUERY_WARN_COUNT", "4")
+    monkeypatch.setenv("DB_QUERY_REPEAT_WARN", "3")
+
+    app = Flask("query_log_test")
+    app.teardown_request(db_mod.release_request_connections)
+    app.teardown_request(db_mod.log_request_queries)
+    seen = {}
+
+    @app.get("/n1")
+    def n_mais_um():
+        with db_mod.db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("CREATE TABLE t(id INTEGER, v TEXT)")
+                cur.execute("INSERT INTO t VALUES (1, 'a'), (2, 'b')")
+                cur.execute("SELECT id FROM t")
+                ids = [r[0] for r in cur.fetchall()]
+                for i in ids + [1]:
+                    cur.execute("SELECT v FROM t WHERE id = %s", (i,))
+                    cur.fetchone()
+        seen["queries"] = db_mod.request_queries()
+        return "ok"
+
+    with caplog.at_level(logging.INFO, logger="app.db.queries"):
+        assert app.test_client().get("/n1").status_code == 200
+
+    queries = seen["queries"]
+    assert [q.sql for q in queries][-2:] == ["SELECT v FROM t WHERE id = ?", "COMMIT"]
+    select_all = queries[2]
+    assert select_all.rows == 2 and select_all.params == 0
+    assert queries[3].params == 1 and queries[3].rows == 1
+
+    msgs = [r.getMessage() for r in caplog.records if r.name == "app.db.queries"]
+    assert any(m.startswith("GET /n1: 7 queries") for m in msgs)
+    assert any("executou 7 queries" in m for m in msgs)
+    assert any("possível N+1, 3 execuções de: SELECT v FROM t WHERE id = ?" in m for m in msgs)
+
+
+def test_slow_query_log_captures_plan_once_per_interval(monkeypatch, tmp_path):
+    import json
+    import logging
+
+    log_path = tmp_path / "slow.log"
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", str(tmp_path / "slow.db"))
+    monkeypatch.setattr(db_mod, "_slow_in_background", False)
+    monkeypatch.setattr(db_mod, "_slow_seen", {})
+    monkeypatch.setattr(db_mod, "_slow_handler", None)
+    monkeypatch.setenv("DB_SLOW_QUERY_LOG", str(log_path))
+    monkeypatch.setenv("DB_SLOW_QUERY_INTERVAL", "300")
+
+    with db_mod.db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CREATE TABLE animais(id INTEGER PRIMARY KEY, cidade TEXT)")
+
+    monkeypatch.setenv("DB_SLOW_QUERY_MS", "0.000001")
+    sql = "SELECT id FROM animais WHERE LOWER(cidade) LIKE %s"
+    try:
+        for _ in range(3):
+            with db_mod.db(readonly=True) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql, ("%sao paulo%",))
+                    cur.fetchall()
+        monkeypatch.setenv("DB_SLOW_QUERY_INTERVAL", "0")
+        with db_mod.db(readonly=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, ("%rio%",))
+    finally:
+        handler = db_mod._slow_handler
+        if handler is not None:
+            logging.getLogger("app.db.slow").removeHandler(handler)
+            handler.close()
+
+    entries = [json.loads(line) for line in log_path.read_text(encoding="utf-8").splitlines()]
+    assert len(entries) == 2
+    first, second = entries
+    assert first["sql"] == "SELECT id FROM animais WHERE LOWER(cidade) LIKE ?"
+    assert first["params"] == ["str[11]"] and "sao paulo" not in json.dumps(first)
+    assert first["dialect"] == "sqlite" and any("SCAN" in step for step in first["plan"])
+    assert first["fingerprint"] == second["fingerprint"]
+    assert first["suppressed"] == 0 and second["suppressed"] == 2
+
+
+def test_slow_query_skips_failed_statements_and_bounds_the_queue(monkeypatch, tmp_path):
+    import threading
+    import time
+
+    captured = []
+    on_slow = db_mod._on_slow_query
+    monkeypatch.setattr(db_mod, "_on_slow_query", lambda sql, params, s: captured.append(sql))
+    monkeypatch.setenv("DB_SLOW_QUERY_MS", "0.000001")
+    db_mod._record_query("SELECT 1", None, 1.0, failed=True)
+    db_mod._record_query("SELECT 2", None, 1.0)
+    assert captured == ["SELECT 2"]  # timeout/erro não vira EXPLAIN
+    monkeypatch.setattr(db_mod, "_on_slow_query", on_slow)
+
+    # uma thread só atende a fila; cheia, a captura é descartada (sem thread nova)
+    gate, done = threading.Event(), []
+    monkeypatch.setattr(db_mod, "_slow_in_background", True)
+    monkeypatch.setattr(db_mod, "_slow_seen", {})
+    monkeypatch.setattr(db_mod, "_slow_worker_pid", None)
+    monkeypatch.setattr(db_mod, "_slow_stats", {"captured": 0, "dropped": 0})
+    monkeypatch.setattr(db_mod, "_write_slow_entry", lambda sql, params, entry: gate.wait(2) and done.append(sql))
+    monkeypatch.setenv("DB_SLOW_QUERY_QUEUE", "1")
+    threads = threading.active_count()
+    for i in range(4):
+        db_mod._on_slow_query(f"SELECT id FROM tabela_{i}", None, 1.0)
+    assert threading.active_count() == threads + 1
+    assert db_mod._slow_stats["dropped"] >= 2
+    gate.set()
+    deadline = time.monotonic() + 2
+    while len(done) < 4 - db_mod._slow_stats["dropped"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert done[0] == "SELECT id FROM tabela_0" and len(done) == 4 - db_mod._slow_stats["dropped"]
+
+
+def test_breaker_fails_fast_with_503_and_health_reports_state(monkeypatch):
+    import threading
+
+    from flask import Flask
+
+    import app.health as health_mod
+
+    gate = threading.Event()
+    reconnected = []
+    breaker = db_mod.CircuitBreaker(lambda: reconnected.append(1), failure_threshold=2,
+                                    sleep=lambda _s: gate.wait(2))
+    calls = []
+
+    class DownPool:
+        def getconn(self):
+            calls.append(1)
+            raise OSError("could not connect to server")
+
+    monkeypatch.setattr(db_mod, "_breaker", breaker)
+    monkeypatch.setattr(db_mod, "_using_sqlite", False)
+    monkeypatch.setattr(db_mod, "_using_postgres", True)
+    monkeypatch.setattr(db_mod, "_pg_pool", DownPool())
+
+    app = Flask("breaker_test")
+    app.register_error_handler(db_mod.DatabaseUnavailable, db_mod._database_unavailable_response)
+    app.register_blueprint(health_mod.health_bp)
+
+    @app.get("/x")
+    def view():
+        with db_mod.db():
+            return "ok"
+
+    client = app.test_client()
+    for _ in range(3):
+        resp = client.get("/x")
+        assert resp.status_code == 503 and resp.headers["Retry-After"]
+    assert len(calls) == 2  # terceira falhou na hora, sem tocar no pool
+
+    health = client.get("/db-health")
+    assert health.status_code == 503
+    assert health.get_json()["breaker"]["state"] == "open"
+
+    gate.set()
+    breaker.probe_thread.join(2)
+    assert reconnected == [1] and db_mod.breaker_state()["state"] == "closed"
+
+
+def test_init_db_failure_opens_breaker_and_reconnects(monkeypatch):
+    import threading
+
+    gate = threading.Event()
+    attempts = []
+    raw = DummyRawConn()
+
+    def make_pool(*_a, **_k):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("connection refused")
+        return DummyPool(raw)
+
+    breaker = db_mod.CircuitBreaker(lambda: db_mod._connect(), sleep=lambda _s: gate.wait(2))
+    monkeypatch.setattr(db_mod, "_breaker", breaker)
+    monkeypatch.setenv("DATABASE_URL", "postgres://example")
+    monkeypatch.delenv("PYTEST_CURRENT_TEST", raising=False)
+    monkeypatch.setattr(db_mod, "_psycopg2", object())
+    monkeypatch.setattr(db_mod, "BlockingPool", make_pool)
+
+    prev = (db_mod._using_sqlite, db_mod._using_postgres, db_mod._sqlite_path, db_mod._pg_pool)
+    try:
+        with pytest.raises(OSError):
+            db_mod.init_db()
+        with pytest.raises(db_mod.DatabaseUnavailable):
+            db_mod._get_raw_conn()  # antes: "Pool Postgres não inicializado" até reiniciar
+
+        gate.set()
+        breaker.probe_thread.join(2)
+        assert breaker.state == "closed" and len(attempts) == 2
+        assert db_mod._get_raw_conn() is raw
+    finally:
+        db_mod._using_sqlite, db_mod._using_postgres, db_mod._sqlite_path, db_mod._pg_pool = prev
@@ -1,11 +1,11 @@
+import pytest
 import pandas as pd
 from app.recommendation.engine import (
     _preferencias_porte,
     _energia_por_tempo_estilo,
-    _split_columns,
-    _build_feature_matrix,
     knn_rank,
 )
+from reference_engine import build_feature_matrix, build_user_vector, split_columns
 
 def test_preferencias_porte_apartamento():
     prefs = _preferencias_porte("Apartamento")
@@ -37,7 +37,7 @@ def test_split_columns():
         }]
     )
 
-    cat, num, passthrough = _split_columns(df)
+    cat, num, passthrough = split_columns(df)
 
     assert "porte" in cat
     assert "energia" in cat
@@ -58,7 +58,7 @@ def test_build_feature_matrix():
         ]
     )
 
-    X, meta, enc, scaler, cat_cols, num_cols = _build_feature_matrix(df)
+    X, meta, enc, scaler, cat_cols, num_cols = build_feature_matrix(df)
 
     assert X.shape[0] == 1
     assert "id" in meta
@@ -98,4 +98,205 @@ def test_knn_rank_returns_results():
 
 def test_knn_rank_empty():
     results = knn_rank([], {}, 5)
-    assert results == []
\ No newline at end of file
+    assert results == []
+
+def _catalogo():
+    return [
+        {"id": 1, "nome": "Rex", "porte": "Grande", "energia": "Alta", "idade": 3, "bom_com_criancas": 1},
+        {"id": 2, "nome": "Luna", "porte": "Pequeno", "energia": "Baixa", "idade": 2, "bom_com_criancas": 1},
+        {"id": 3, "nome": "Tob", "porte": "Medio", "energia": "Media", "idade": 5, "bom_com_criancas": 0},
+    ]
+
+
+def test_feature_index_query_matches_knn_rank():
+    from app.recommendation.engine import FeatureIndex
+
+    prefs = {"tipo_moradia": "Casa", "tempo_disponivel_horas_semana": 20, "estilo_vida": "Ativo", "tem_criancas": 1}
+    index = FeatureIndex(_catalogo())
+
+    assert len(index) == 3
+    assert index.query(prefs, top_n=3) == knn_rank(_catalogo(), prefs, top_n=3)
+    assert knn_rank(index, prefs, top_n=1)[0]["nome"] == "Rex"
+
+
+def _catalogo_aleatorio(n, seed):
+    import random
+
+    rnd = random.Random(seed)
+    portes = ["Pequeno", "Medio", "Grande", "grande", None]
+    energias = ["Baixa", "Media", "Alta", None]
+    especies = ["Cachorro", "Gato", "Coelho"]
+    return [
+        {
+            "id": i,
+            "nome": f"A{i}",
+            "especie": rnd.choice(especies),
+            "porte": rnd.choice(portes),
+            "energia": rnd.choice(energias),
+            "bom_com_criancas": rnd.choice([0, 1, True, False]),
+            "idade": rnd.randint(0, 15),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+_PERFIS = [
+    {"tipo_moradia": "Apartamento", "tempo_disponivel_horas_semana": 4, "estilo_vida": "Tranquilo", "tem_criancas": 0},
+    {"tipo_moradia": "Casa", "tempo_disponivel_horas_semana": 10, "estilo_vida": "Moderado", "tem_criancas": 1},
+    {"tipo_moradia": "Casa", "tempo_disponivel_horas_semana": 30, "estilo_vida": "Ativo", "tem_criancas": 1,
+     "especie_pref": "Gato"},
+]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_feature_layout_matches_pandas_sklearn_path(seed):
+    import numpy as np
+    from app.recommendation.engine import FeatureLayout
+
+    animals = _catalogo_aleatorio(40, seed)
+    X_ref, _meta, enc, scaler, cat_cols, num_cols = build_feature_matrix(pd.DataFrame(animals))
+
+    layout = FeatureLayout(animals)
+    np.testing.assert_allclose(layout.transform(animals), X_ref)
+    for prefs in _PERFIS:
+        np.testing.assert_allclose(
+            layout.user_vector(prefs),
+            build_user_vector(prefs, enc, scaler, cat_cols, num_cols),
+        )
+
+
+def test_feature_layout_ignores_unknown_category():
+    import numpy as np
+    from app.recommendation.engine import FeatureLayout
+
+    layout = FeatureLayout(_catalogo())
+    X = layout.transform([{"porte": "Gigante", "energia": "Alta", "bom_com_criancas": 1, "idade": 3}])
+    assert X.shape == (1, layout.n_features)
+    assert np.count_nonzero(X[0, : layout.n_cat]) == 1  # só energia
+
+
+def test_feature_index_groups_animals_by_signature():
+    from app.recommendation.engine import FeatureIndex
+
+    animals = _catalogo_aleatorio(500, 3)
+    index = FeatureIndex(animals)
+
+    assert index.n_buckets < 100
+    assert sum(len(m) for m in index._bucket_members) == 500
+
+
+@pytest.mark.parametrize("prefs", _PERFIS)
+def test_bucketed_query_matches_brute_force_scores(prefs):
+    import numpy as np
+    from app.recommendation.engine import FeatureIndex
+
+    animals = _catalogo_aleatorio(200, 4)
+    X, _meta, enc, scaler, cat_cols, num_cols = build_feature_matrix(pd.DataFrame(animals))
+    x = build_user_vector(prefs, enc, scaler, cat_cols, num_cols)
+    brute = np.sort(np.sqrt(((X - x) ** 2).sum(axis=1)))[:25]
+
+    got = FeatureIndex(animals).query(prefs, top_n=25)
+    assert [r["_score"] for r in got] == [round(float(1 / (1 + d)), 4) for d in brute]
+
+
+def test_bucketed_query_breaks_ties_newest_first():
+    from app.recommendation.engine import FeatureIndex
+
+    base = {"porte": "Pequeno", "energia": "Baixa", "bom_com_criancas": 1, "idade": 2}
+    animals = [dict(base, id=i, nome=f"A{i}") for i in (3, 10, 7)]
+    animals.append({"id": 99, "nome": "Longe", "porte": "Grande", "energia": "Alta", "bom_com_criancas": 0, "idade": 2})
+
+    got = FeatureIndex(animals).query(_PERFIS[0], top_n=3)
+    assert [r["id"] for r in got] == [10, 7, 3]
+
+
+def test_knn_rank_batch_matches_single_queries():
+    from app.recommendation.engine import FeatureIndex, knn_rank_batch
+
+    index = FeatureIndex(_catalogo_aleatorio(300, 5))
+    batch = knn_rank_batch(index, _PERFIS, top_n=12)
+
+    assert len(batch) == len(_PERFIS)
+    for prefs, got in zip(_PERFIS, batch):
+        assert got == index.query(prefs, top_n=12)
+
+
+def test_knn_rank_batch_edge_cases():
+    from app.recommendation.engine import knn_rank_batch
+
+    assert knn_rank_batch([], _PERFIS, top_n=3) == [[], [], []]
+    assert knn_rank_batch(_catalogo(), [], top_n=3) == []
+    assert [len(r) for r in knn_rank_batch(_catalogo(), _PERFIS[:2], top_n=10)] == [3, 3]
+
+
+def test_topk_sq_distances_matches_full_sort():
+    import numpy as np
+    from app.recommendation.engine import as_float32_matrix, topk_sq_distances
+
+    rng = np.random.default_rng(0)
+    M = rng.random((1000, 8))
+    X = rng.random((3, 8))
+    M32, norms = as_float32_matrix(M)
+    assert M32.dtype == np.float32 and M32.flags["C_CONTIGUOUS"]
+
+    for x, (idx, sqd) in zip(X, topk_sq_distances(M32, norms, X, 10)):
+        full = ((M - x) ** 2).sum(axis=1)
+        np.testing.assert_array_equal(idx, np.argsort(full)[:10])
+        np.testing.assert_allclose(sqd, np.sort(full)[:10], rtol=1e-4, atol=1e-5)
+
+
+def test_topk_sq_distances_keeps_ties_and_handles_empty():
+    import numpy as np
+    from app.recommendation.engine import as_float32_matrix, topk_sq_distances
+
+    M32, norms = as_float32_matrix(np.array([[0.0], [1.0], [1.0], [5.0]]))
+    [(idx, _)] = topk_sq_distances(M32, norms, np.array([[0.0]]), 2)
+    assert list(idx) == [0, 1, 2]
+
+    E32, enorms = as_float32_matrix(np.zeros((0, 1)))
+    [(idx, sqd)] = topk_sq_distances(E32, enorms, np.array([[0.0]]), 3)
+    assert idx.size == 0 and sqd.size == 0
+
+
+def test_incremental_index_matches_fresh_rebuild(monkeypatch):
+    import random
+    from app.recommendation.engine import FeatureIndex
+
+    rnd = random.Random(6)
+    pool = _catalogo_aleatorio(400, 6)
+    index = FeatureIndex(pool[:150])
+    monkeypatch.setattr(FeatureIndex, "COMPACT_MIN", 10**9)  # só tombstones, sem compactar
+    alive = {a["id"]: a for a in pool[:150]}
+    for step in range(300):
+        op = rnd.random()
+        if op < 0.4:
+            row = pool[150 + step % 250]
+            index.upsert(row)
+            alive[row["id"]] = row
+        elif op < 0.7 and alive:
+            key = rnd.choice(sorted(alive))
+            row = dict(alive[key], energia=rnd.choice(["Baixa", "Media", "Alta"]))
+            index.upsert(row)
+            alive[key] = row
+        elif alive:
+            key = rnd.choice(sorted(alive))
+            index.remove(key)
+            del alive[key]
+
+    fresh = FeatureIndex(list(alive.values()))
+    assert len(index) == len(fresh) == len(alive)
+    for prefs in _PERFIS:
+        assert index.query(prefs, top_n=20) == fresh.query(prefs, top_n=20)
+
+
+def test_index_compacts_tombstones():
+    from app.recommendation.engine import FeatureIndex
+
+    animals = _catalogo_aleatorio(300, 7)
+    index = FeatureIndex(animals)
+    for a in animals[:100]:
+        index.remove(a["id"])
+
+    assert len(index) == 200
+    assert len(index.rows) < 300  # compactou pelo menos uma vez
+    assert index.matrix.shape[0] == 200
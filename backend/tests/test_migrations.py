@@ -0,0 +1,180 @@
+import sqlite3
+
+import pytest
+
+import app.extensions.db as db_mod
+from app.extensions import migrations
+
+
+@pytest.fixture
+def sqlite_file(monkeypatch, tmp_path):
+    path = str(tmp_path / "migr.db")
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", path)
+    return path
+
+
+def _indexes(path):
+    con = sqlite3.connect(path)
+    try:
+        return {name: sql for name, sql in con.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        con.close()
+
+
+def _columns(path, table):
+    con = sqlite3.connect(path)
+    try:
+        return {r[1] for r in con.execute(f"PRAGMA table_info({table})")}
+    finally:
+        con.close()
+
+
+def test_migrate_fresh_database_is_idempotent(sqlite_file):
+    applied = migrations.migrate()
+    assert [v for v, _ in applied] == [m.version for m in migrations.MIGRATIONS]
+    assert migrations.migrate() == []
+    assert migrations.applied_versions() == [m.version for m in migrations.MIGRATIONS]
+
+    idx = _indexes(sqlite_file)
+    assert "idx_animais_doador_criado_em" in idx
+    assert "WHERE adotado_em IS NULL" in idx["idx_animais_disponiveis"]
+    assert {"disponivel", "status", "city"} <= _columns(sqlite_file, "animais")
+    assert "atualizado_em" in _columns(sqlite_file, "perfil_adotante")
+
+
+def test_migrate_upgrades_old_sqlite_schema(sqlite_file):
+    con = sqlite3.connect(sqlite_file)
+    con.executescript(
+        """
+        CREATE TABLE usuarios (id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT, email TEXT UNIQUE,
+                               password_hash TEXT, google_sub TEXT, avatar_url TEXT);
+        CREATE TABLE animais (id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT, especie TEXT, raca TEXT,
+                              idade TEXT, porte TEXT, descricao TEXT, cidade TEXT, photo_url TEXT,
+                              donor_name TEXT, donor_whatsapp TEXT, doador_id INTEGER, criado_em TEXT,
+                              adotado_em TEXT, energia TEXT, bom_com_criancas INTEGER);
+        CREATE TABLE perfil_adotante (usuario_id INTEGER PRIMARY KEY, tipo_moradia TEXT,
+                                      tem_criancas INTEGER, tempo_disponivel_horas_semana INTEGER,
+                                      estilo_vida TEXT);
+        INSERT INTO animais (nome, especie) VALUES ('Rex', 'Cachorro');
+        """
+    )
+    con.commit()
+    con.close()
+
+    migrations.migrate()
+    assert {"disponivel", "usuario_id"} <= _columns(sqlite_file, "animais")
+    assert "atualizado_em" in _columns(sqlite_file, "perfil_adotante")
+    # banco anterior ao vetor pré-calculado: a tabela vem da migração, não do backfill
+    assert "vec_porte" in _columns(sqlite_file, "animal_features")
+
+    con = sqlite3.connect(sqlite_file)
+    try:
+        assert con.execute("SELECT nome FROM animais").fetchall() == [("Rex",)]
+        plan = " ".join(
+            r[3] for r in con.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM animais WHERE doador_id = 1 ORDER BY criado_em DESC"
+            )
+        )
+    finally:
+        con.close()
+    assert "idx_animais_doador_criado_em" in plan
+
+
+def test_target_stops_at_version(sqlite_file):
+    assert [v for v, _ in migrations.migrate(target=1)] == [1]
+    assert [m.version for m in migrations.pending()] == [2, 3, 4, 5, 6]
+
+
+class RecordingCursor:
+    def __init__(self, existing=()):
+        self.sqls = []
+        self.existing = set(existing)
+        self._last = []
+
+    def execute(self, sql, params=None):
+        self.sqls.append(sql)
+        self._last = [(1,)] if params and params[-1] in self.existing else []
+
+    def fetchall(self):
+        return self._last
+
+
+def test_mysql_index_step_checks_catalog_and_drops_partial_filter():
+    step = migrations.create_index(
+        "idx_animais_disponiveis", "animais", "id", where="adotado_em IS NULL", mysql_columns="adotado_em, id"
+    )
+    cur = RecordingCursor()
+    step(cur, "mysql")
+    assert cur.sqls[-1] == "CREATE INDEX idx_animais_disponiveis ON animais (adotado_em, id)"
+
+    cur = RecordingCursor(existing={"idx_animais_disponiveis"})
+    step(cur, "mysql")
+    assert len(cur.sqls) == 1  # já existe: só a consulta ao information_schema
+
+    cur = RecordingCursor()
+    step(cur, "postgres")
+    assert cur.sqls == [
+        "CREATE INDEX IF NOT EXISTS idx_animais_disponiveis ON animais (id) WHERE adotado_em IS NULL"
+    ]
+
+
+class _RecordingConn:
+    def __init__(self):
+        self.log = []
+
+    def cursor(self):
+        conn = self
+
+        class Cur:
+            def execute(self, sql, params=None):
+                conn.log.append(sql.split("(")[0].strip())
+
+            def fetchall(self):
+                return []
+
+            def close(self):
+                pass
+
+        return Cur()
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+
+def test_postgres_lock_covers_versions_table_and_all_migrations(monkeypatch):
+    from contextlib import contextmanager
+
+    conn = _RecordingConn()
+
+    @contextmanager
+    def fake_db(readonly=False):
+        yield conn
+
+    monkeypatch.setattr(migrations, "current_dialect", lambda: "postgres")
+    monkeypatch.setattr(db_mod, "db", fake_db)
+    steps = [migrations.Migration(1, "a", {"*": ["CREATE TABLE a"]}), migrations.Migration(2, "b", {"*": ["CREATE TABLE b"]})]
+    assert [v for v, _ in migrations.migrate(steps)] == [1, 2]
+    assert conn.log[0] == "SELECT pg_advisory_lock"
+    assert conn.log[1].startswith("CREATE TABLE IF NOT EXISTS schema_migrations")
+    assert conn.log.index("CREATE TABLE b") < conn.log.index("SELECT pg_advisory_unlock")
+    assert conn.log[-2:] == ["SELECT pg_advisory_unlock", "COMMIT"]
+
+
+def test_auto_migrate_on_startup_creates_write_path_schema(sqlite_file, monkeypatch):
+    # DB_AUTO_MIGRATE=1 (docker-compose): escritas em animais e o upsert do
+    # perfil dependem de catalog_version e perfil_adotante.versao
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{sqlite_file}")
+    monkeypatch.setenv("DB_AUTO_MIGRATE", "1")
+    db_mod.init_db()
+    assert migrations.pending() == []
+    assert "versao" in _columns(sqlite_file, "perfil_adotante")
+    con = sqlite3.connect(sqlite_file)
+    try:
+        assert con.execute("SELECT version FROM catalog_version WHERE id = 1").fetchall() == [(0,)]
+    finally:
+        con.close()
@@ -11,8 +11,16 @@ def mock_get_conn():
 
 
 @pytest.fixture
-def mock_knn_rank():
-    with patch("app.services.recommendation_service.knn_rank") as m:
+def mock_rank():
+    with patch.object(rsvc.scoring, "rank") as m:
+        yield m
+
+
+@pytest.fixture
+def mock_catalog():
+    with patch.object(rsvc.scoring, "load_catalog") as m, \
+         patch.object(rsvc.scoring, "hydrate_rows",
+                      side_effect=lambda ids: {r["id"]: r for r in m.return_value or [] if r["id"] in ids}):
         yield m
 
 
@@ -190,67 +198,63 @@ def test_carregar_prefs_db_row_partially_overrides(mock_get_conn):
     }
 
 
-def test_carregar_animais_returns_rows(mock_get_conn):
-    mock_cur = MagicMock()
-    rows = [
-        {"id": 1, "nome": "Rex", "especie": "Cachorro", "idade": 2, "porte": "M", "energia": "Alta", "bom_com_criancas": 1, "cidade": "SP", "disponivel": 1},
-        {"id": 3, "nome": "Luna", "especie": "Gato", "idade": 3, "porte": "P", "energia": "Média", "bom_com_criancas": 0, "cidade": "RJ", "disponivel": 1},
-    ]
-    mock_cur.fetchall.return_value = rows
-    mock_cur.close.return_value = None
-    mock_conn = MagicMock()
-    mock_conn.cursor.return_value = mock_cur
-    mock_conn.close.return_value = None
-    mock_get_conn.return_value = mock_conn
+def test_recomendar_calls_internal_and_scoring_engine(mock_get_conn, mock_rank):
+    mock_rank.return_value = ["result"]
+    with patch.object(rsvc, "_carregar_prefs", return_value={"tipo_moradia": "Apartamento"}) as mock_prefs:
+        res = rsvc.recomendar(5, {"param": "val"}, top_n=2)
+        assert res == ["result"]
+        mock_prefs.assert_called_once_with(5, {"param": "val"})
+        mock_rank.assert_called_once_with(rsvc.SCORER, {"tipo_moradia": "Apartamento"}, top_n=2)
 
-    result = rsvc._carregar_animais()
-    assert result == rows
-    mock_cur.execute.assert_called_once()
-    mock_cur.close.assert_called_once()
-    mock_conn.close.assert_called_once()
 
+def test_recomendar_reuses_index_until_catalog_changes(mock_get_conn, mock_catalog):
+    from app.extensions import catalog
 
-def test_carregar_animais_empty(mock_get_conn):
-    mock_cur = MagicMock()
-    mock_cur.fetchall.return_value = []
-    mock_cur.close.return_value = None
-    mock_conn = MagicMock()
-    mock_conn.cursor.return_value = mock_cur
-    mock_conn.close.return_value = None
-    mock_get_conn.return_value = mock_conn
-    result = rsvc._carregar_animais()
-    assert result == []
+    mock_catalog.return_value = [{"id": 1}]
+    with patch.object(rsvc, "_carregar_prefs", return_value={}):
+        rsvc.recomendar(1, {})
+        rsvc.recomendar(1, {})
+        assert mock_catalog.call_count == 1
 
+        catalog.bump()
+        rsvc.recomendar(1, {})
+        assert mock_catalog.call_count == 2
 
-def test_carregar_animais_db_exception(mock_get_conn):
-    mock_get_conn.side_effect = Exception("Database unavailable")
-    with pytest.raises(Exception):
-        rsvc._carregar_animais()
 
+def test_recomendar_empty_animals(mock_get_conn, mock_catalog):
+    mock_catalog.return_value = []
+    with patch.object(rsvc, "_carregar_prefs", return_value={}):
+        assert rsvc.recomendar(None, {}) == []
+        mock_catalog.assert_called_once()
 
-def test_recomendar_calls_internal_and_knn(mock_get_conn, mock_knn_rank):
-    mock_knn_rank.return_value = ["result"]
-    with patch.object(rsvc, "_carregar_animais", return_value=[{"id": 1}]) as mock_animais, \
-         patch.object(rsvc, "_carregar_prefs", return_value={"tipo_moradia": "Apartamento"}) as mock_prefs:
-        res = rsvc.recomendar(5, {"param": "val"}, top_n=2)
-        assert res == ["result"]
-        mock_animais.assert_called_once()
-        mock_prefs.assert_called_once_with(5, {"param": "val"})
-        mock_knn_rank.assert_called_once_with([{"id": 1}], {"tipo_moradia": "Apartamento"}, top_n=2)
 
+def test_recomendar_rank_raises(mock_get_conn, mock_rank):
+    mock_rank.side_effect = RuntimeError("fail")
+    with patch.object(rsvc, "_carregar_prefs", return_value={"tipo_moradia": "Apartamento"}):
+        with pytest.raises(RuntimeError):
+            rsvc.recomendar(1, {}, top_n=5)
 
-def test_recomendar_empty_animals(mock_get_conn, mock_knn_rank):
-    mock_knn_rank.return_value = []
-    with patch.object(rsvc, "_carregar_animais", return_value=[]), \
-         patch.object(rsvc, "_carregar_prefs", return_value={}):
-        res = rsvc.recomendar(None, {})
-        assert res == []
-        mock_knn_rank.assert_called_once()
 
+def test_recomendar_todos_ranks_every_profile(mock_get_conn, mock_catalog):
+    perfis = [
+        {"usuario_id": 7, "tipo_moradia": "Casa", "tem_criancas": 1,
+         "tempo_disponivel_horas_semana": 20, "estilo_vida": "Ativo"},
+        {"usuario_id": 8, "tipo_moradia": None, "tem_criancas": None,
+         "tempo_disponivel_horas_semana": None, "estilo_vida": None},
+    ]
+    animais = [
+        {"id": 1, "nome": "Rex", "porte": "Grande", "energia": "Alta", "bom_com_criancas": 1},
+        {"id": 2, "nome": "Luna", "porte": "Pequeno", "energia": "Baixa", "bom_com_criancas": 0},
+    ]
+    mock_catalog.return_value = animais
+    with patch.object(rsvc, "_carregar_perfis", return_value=perfis):
+        res = rsvc.recomendar_todos(top_n=1)
 
-def test_recomendar_knn_raises(mock_get_conn, mock_knn_rank):
-    mock_knn_rank.side_effect = RuntimeError("fail")
-    with patch.object(rsvc, "_carregar_animais", return_value=[{"id": 1}]), \
-         patch.object(rsvc, "_carregar_prefs", return_value={"tipo_moradia": "Apartamento"}):
-        with pytest.raises(RuntimeError):
-            rsvc.recomendar(1, {}, top_n=5)
+    assert set(res) == {7, 8}
+    assert res[7][0]["nome"] == "Rex"
+    assert len(res[8]) == 1
+
+
+def test_recomendar_todos_without_profiles(mock_get_conn):
+    with patch.object(rsvc, "_carregar_perfis", return_value=[]):
+        assert rsvc.recomendar_todos() == {}
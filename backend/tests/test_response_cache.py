@@ -0,0 +1,237 @@
+import pytest
+
+from app.extensions import catalog
+from app.extensions import db as db_mod
+from app.extensions.cache import LocalCache
+from app.extensions.response_cache import response_cache
+
+
+@pytest.fixture
+def client(client, monkeypatch, tmp_db_path):
+    """Rotas reais de app.api no banco dos testes (outros testes trocam views e banco)."""
+    import app.api as api_mod
+
+    for name in (
+        "list_animais", "create_animal", "get_animal", "update_animal",
+        "animais_mine", "recomendacoes", "upsert_perfil_adotante",
+    ):
+        monkeypatch.setitem(client.application.view_functions, f"api.{name}", getattr(api_mod, name))
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", tmp_db_path)
+    return client
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_ttl_and_tags():
+    clock = Clock()
+    cache = LocalCache(max_entries=2, ttl=10, clock=clock)
+    cache.set("a", 1, tags=("animais",))
+    cache.set("b", 2, tags=("animal:7",))
+    assert cache.get("a") == 1  # "a" passa a ser a mais recente
+    cache.set("c", 3, tags=("animais",))
+    assert cache.get("b") is None  # menos usada recentemente saiu
+
+    assert cache.invalidate("animais") == 2
+    assert cache.get("a") is None and cache.get("c") is None
+
+    cache.set("d", 4)
+    clock.now = 10
+    assert cache.get("d") is None
+    m = cache.metrics()
+    assert m["evictions"] == 1 and m["expirations"] == 1 and m["invalidations"] == 2 and m["size"] == 0
+
+
+def _create(client, nome):
+    return client.post(
+        "/api/animais",
+        json={"nome": nome, "especie": "Gato", "cidade": "Recife", "descricao": "teste cache"},
+    ).get_json()["id"]
+
+
+def test_list_cached_until_write(client, monkeypatch):
+    import app.api as api_mod
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 3, raising=False)
+    r1 = client.get("/api/animais?cidade=Recife")
+    r2 = client.get("/api/animais?cidade=recife&_=123")  # mesma chave normalizada
+    assert r1.headers["X-Cache"] == "MISS" and r2.headers["X-Cache"] == "HIT"
+    assert r1.get_data() == r2.get_data()
+
+    _create(client, "Cacheado")
+    r3 = client.get("/api/animais?cidade=Recife")
+    assert r3.headers["X-Cache"] == "MISS"
+    assert any(a["nome"] == "Cacheado" for a in r3.get_json())
+
+
+def test_get_animal_invalidation_is_per_id(client, monkeypatch):
+    import app.api as api_mod
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 3, raising=False)
+    a, b = _create(client, "Um"), _create(client, "Dois")
+    client.get(f"/api/animais/{a}")
+    client.get(f"/api/animais/{b}")
+
+    client.put(f"/api/animais/{a}", json={"nome": "Um editado"})
+    ra, rb = client.get(f"/api/animais/{a}"), client.get(f"/api/animais/{b}")
+    assert ra.headers["X-Cache"] == "MISS" and ra.get_json()["nome"] == "Um editado"
+    assert rb.headers["X-Cache"] == "HIT"
+
+    assert client.get("/api/animais/999999").status_code == 404
+    assert response_cache.get("get_animal:999999") is None  # 404 não é guardado
+
+
+def test_recomendacoes_only_anonymous_fallback_is_cached(client, monkeypatch):
+    import app.api as api_mod
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: None, raising=False)
+    assert client.get("/api/recomendacoes?n=3").headers["X-Cache"] == "MISS"
+    assert client.get("/api/recomendacoes?n=3").headers["X-Cache"] == "HIT"
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 3, raising=False)
+    assert "X-Cache" not in client.get("/api/recomendacoes?n=3").headers
+
+
+def test_response_computed_across_a_write_is_not_stored(client, monkeypatch):
+    import app.api as api_mod
+
+    real = api_mod._row_to_animal
+
+    def racing(row):
+        catalog.bump()  # escrita concorrente enquanto a resposta é montada
+        return real(row)
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 3, raising=False)
+    aid = _create(client, "Corrida")
+    monkeypatch.setattr(api_mod, "_row_to_animal", racing)
+    client.get(f"/api/animais/{aid}")
+    assert response_cache.get(f"get_animal:{aid}") is None
+
+
+def test_response_read_from_replica_is_not_stored():
+    from flask import Flask, jsonify
+
+    from app.extensions.response_cache import cached_response
+
+    app = Flask(__name__)
+
+    @app.get("/lista")
+    @cached_response(key=lambda: "replica")
+    def lista():
+        db_mod._mark_replica_read()  # o que _get_replica_conn faz ao entregar uma réplica
+        return jsonify([1])
+
+    c = app.test_client()
+    assert c.get("/lista").headers["X-Cache"] == "MISS"
+    assert c.get("/lista").headers["X-Cache"] == "MISS"
+    assert response_cache.get("lista:'replica'") is None
+
+
+def test_etag_304_without_touching_the_view(client, monkeypatch):
+    import app.api as api_mod
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 3, raising=False)
+    aid = _create(client, "Etag")
+    r1 = client.get(f"/api/animais/{aid}")
+    etag = r1.headers["ETag"]
+    assert r1.headers["Cache-Control"] == "no-cache"
+
+    def boom(*_a, **_kw):
+        raise AssertionError("304 não deveria consultar o banco")
+
+    monkeypatch.setattr(db_mod, "db", boom)
+    r2 = client.get(f"/api/animais/{aid}", headers={"If-None-Match": etag})
+    assert r2.status_code == 304 and r2.headers["ETag"] == etag and not r2.get_data()
+    r3 = client.get("/api/animais", headers={"If-None-Match": etag})
+    assert r3.status_code == 304  # mesma versão do catálogo
+
+
+def test_etag_changes_with_catalog_and_profile(client, monkeypatch):
+    import app.api as api_mod
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 3, raising=False)
+    mine = client.get("/api/animais/mine")
+    assert mine.headers["Cache-Control"] == "private, no-cache" and "Authorization" in mine.headers["Vary"]
+    rec = client.get("/api/recomendacoes?n=2")
+    rec_etag = rec.headers["ETag"]
+
+    client.post("/api/perfil_adotante", json={"tipo_moradia": "casa", "estilo_vida": "ativo"})
+    rec2 = client.get("/api/recomendacoes?n=2", headers={"If-None-Match": rec_etag})
+    assert rec2.status_code == 200 and rec2.headers["ETag"] != rec_etag
+
+    _create(client, "Novo")
+    r = client.get("/api/animais/mine", headers={"If-None-Match": mine.headers["ETag"]})
+    assert r.status_code == 200 and any(a["nome"] == "Novo" for a in r.get_json())
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 4, raising=False)
+    other = client.get("/api/animais/mine", headers={"If-None-Match": r.headers["ETag"]})
+    assert other.status_code == 200  # ETag de outro usuário não vale
+
+
+def test_etag_routes_never_read_from_a_replica(client, monkeypatch):
+    import app.api as api_mod
+
+    def boom():
+        raise AssertionError("ETag do primário com corpo de réplica")
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 3, raising=False)
+    aid = _create(client, "Primario")
+    monkeypatch.setattr(db_mod, "_replicas", object())
+    monkeypatch.setattr(db_mod, "_get_replica_conn", boom)
+    for path in ("/api/animais", f"/api/animais/{aid}", "/api/recomendacoes?n=2"):
+        assert client.get(path).status_code == 200
+
+
+def test_profile_version_lives_in_the_database(client, monkeypatch):
+    import app.api as api_mod
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 5, raising=False)
+    perfil = {"tipo_moradia": "apartamento", "estilo_vida": "calmo"}
+    client.post("/api/perfil_adotante", json=perfil)
+    before = catalog.profile_version(5)
+    etag = client.get("/api/recomendacoes?n=2").headers["ETag"]
+
+    client.post("/api/perfil_adotante", json=perfil)
+    # outro worker (sem nenhum estado deste processo) lê a mesma versão do banco
+    assert catalog.profile_version(5) == before + 1
+    r = client.get("/api/recomendacoes?n=2", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
+
+
+def test_profile_version_revalidation_uses_shared_cache(client, monkeypatch):
+    import app.api as api_mod
+
+    class SharedCache(LocalCache):
+        shared = True
+
+    reads = []
+    read = catalog._read_profile_version
+    monkeypatch.setattr(catalog, "_profile_versions", SharedCache(max_entries=8, ttl=60))
+    monkeypatch.setattr(catalog, "_read_profile_version", lambda uid: reads.append(uid) or read(uid))
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: 6, raising=False)
+    perfil = {"tipo_moradia": "casa", "estilo_vida": "ativo"}
+    client.post("/api/perfil_adotante", json=perfil)
+
+    etag = client.get("/api/recomendacoes?n=2").headers["ETag"]
+    for _ in range(3):
+        assert client.get("/api/recomendacoes?n=2", headers={"If-None-Match": etag}).status_code == 304
+    assert reads == [6]  # 304 sem ir ao banco
+
+    client.post("/api/perfil_adotante", json=perfil)  # o upsert apaga a versão em cache
+    r = client.get("/api/recomendacoes?n=2", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag and reads == [6, 6]
+
+
+def test_no_etag_on_errors(client, monkeypatch):
+    import app.api as api_mod
+
+    monkeypatch.setattr(api_mod, "_require_auth", lambda: None, raising=False)
+    assert "ETag" not in client.get("/api/animais/mine").headers
+    assert "ETag" not in client.get("/api/animais/999999").headers
@@ -0,0 +1,207 @@
+import pytest
+from unittest.mock import MagicMock
+
+from app.extensions import catalog
+from app.recommendation import scoring
+
+
+def _catalogo():
+    return [
+        {"id": 1, "nome": "Rex", "especie": "Cachorro", "porte": "Grande", "energia": "Alta", "bom_com_criancas": 1, "idade": 3},
+        {"id": 2, "nome": "Luna", "especie": "Gato", "porte": "Pequeno", "energia": "Baixa", "bom_com_criancas": 0, "idade": 5},
+        {"id": 3, "nome": "Toby", "especie": "Cachorro", "porte": "Medio", "energia": "Media", "bom_com_criancas": 1, "idade": 1},
+    ]
+
+
+_ATIVO = {"tipo_moradia": "Casa", "tempo_disponivel_horas_semana": 20, "estilo_vida": "Ativo", "tem_criancas": 1}
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    calls = []
+
+    def _loader():
+        calls.append(1)
+        return _catalogo()
+
+    monkeypatch.setattr(scoring.default_engine, "_loader", _loader)
+    monkeypatch.setattr(scoring.default_engine, "_hydrator", lambda ids: {r["id"]: r for r in _catalogo() if r["id"] in ids})
+    return calls
+
+
+def test_load_catalog_only_available_animals(monkeypatch):
+    cur = MagicMock()
+    cur.__enter__.return_value = cur
+    cur.fetchall.return_value = _catalogo()
+    conn = MagicMock()
+    conn.__enter__.return_value = conn
+    conn.cursor.return_value = cur
+    monkeypatch.setattr(scoring.db_ext, "db", lambda readonly=False, replica=True: conn)
+
+    assert scoring.load_catalog() == _catalogo()
+    conn.cursor.assert_called_once_with(dictionary=True)
+    assert "adotado_em IS NULL" in cur.execute.call_args.args[0]
+
+
+def test_rank_hydrates_winners_in_rank_order(loader, monkeypatch):
+    pedidos = []
+
+    def hydrator(ids):
+        pedidos.append(list(ids))
+        return {i: {"id": i, "nome": f"Completo {i}", "descricao": "texto longo"} for i in ids if i != 3}
+
+    monkeypatch.setattr(scoring.default_engine, "_hydrator", hydrator)
+    estreito = scoring.rank("weighted_onehot_knn", _ATIVO, top_n=3, hydrate=False)
+    ranked = scoring.rank_batch("weighted_onehot_knn", [_ATIVO, _ATIVO], top_n=3)
+
+    assert len(pedidos) == 1 and sorted(pedidos[0]) == [1, 2, 3]
+    # o 3 sumiu entre as fases: sai do resultado em vez de virar um card vazio
+    vivos = [r for r in estreito if r["id"] != 3]
+    for top in ranked:
+        assert [r["id"] for r in top] == [r["id"] for r in vivos]
+        assert [r["_rank"] for r in top] == [1, 2]
+        assert [r["_score"] for r in top] == [r["_score"] for r in vivos]
+    completos = {r["id"]: r for r in ranked[0]}
+    assert completos[1]["descricao"] == "texto longo" and "porte" not in completos[1]
+    assert scoring.metrics()["hydrated_rows"] == 3 and scoring.metrics()["hydrate_dropped"] == 2
+
+
+def test_load_catalog_and_hydrate_rows_sql(monkeypatch):
+    cur = MagicMock()
+    cur.__enter__.return_value = cur
+    cur.fetchall.return_value = [{"id": 2, "nome": "Luna"}, {"id": 1, "nome": "Rex"}]
+    conn = MagicMock()
+    conn.__enter__.return_value = conn
+    conn.cursor.return_value = cur
+    monkeypatch.setattr(scoring.db_ext, "db", lambda readonly=False, replica=True: conn)
+
+    scoring.load_catalog()
+    fase1 = cur.execute.call_args.args[0]
+    assert "descricao" not in fase1 and "photo_url" not in fase1
+
+    assert scoring.hydrate_rows([1, 2]) == {1: {"id": 1, "nome": "Rex"}, 2: {"id": 2, "nome": "Luna"}}
+    sql, params = cur.execute.call_args.args
+    assert "WHERE id IN (%s,%s)" in sql and params == (1, 2)
+    assert scoring.hydrate_rows([]) == {}
+
+
+def test_load_catalog_skips_unavailable_animals(monkeypatch, tmp_db_path):
+    import app.extensions.db as db_mod
+    from app.extensions.db import db
+
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", tmp_db_path)
+
+    with db() as conn:
+        with conn.cursor() as cur:
+            ids = {}
+            for nome, disponivel in (("Livre", None), ("Sim", 1), ("Suspenso", 0)):
+                cur.execute("INSERT INTO animais (nome, especie, disponivel) VALUES (%s, %s, %s)", (nome, "Gato", disponivel))
+                ids[nome] = cur.lastrowid
+    try:
+        carregados = {r["id"] for r in scoring.load_catalog()}
+        assert {ids["Livre"], ids["Sim"]} <= carregados
+        assert ids["Suspenso"] not in carregados
+    finally:
+        with db() as conn:
+            with conn.cursor() as cur:
+                cur.executemany("DELETE FROM animais WHERE id = %s", [(i,) for i in ids.values()])
+
+
+def test_hydrate_rows_reads_the_primary(monkeypatch):
+    chamadas = []
+
+    def fake_db(readonly=False, replica=True):
+        chamadas.append((readonly, replica))
+        raise RuntimeError("só a origem importa")
+
+    monkeypatch.setattr(scoring.db_ext, "db", fake_db)
+    with pytest.raises(RuntimeError):
+        scoring.hydrate_rows([1])
+    assert chamadas == [(True, False)]
+
+
+def test_unknown_scorer():
+    with pytest.raises(KeyError):
+        scoring.rank("nao_existe", _ATIVO)
+
+
+def test_snapshot_shared_between_scorers_and_reloaded_on_bump(loader):
+    import app.api  # noqa: F401  registra o scorer vec4
+
+    scoring.rank("weighted_onehot_knn", _ATIVO)
+    scoring.rank("vec4_minkowski", _ATIVO)
+    scoring.rank_batch("weighted_onehot_knn", [_ATIVO, _ATIVO])
+    assert len(loader) == 1
+
+    m = scoring.metrics()
+    assert m["snapshot_loads"] == 1 and m["rows"] == 3
+    assert m["indexes"] == ["vec4_minkowski", "weighted_onehot_knn"]
+    assert m["scorers"]["weighted_onehot_knn"]["builds"] == 1
+    assert m["scorers"]["weighted_onehot_knn"]["queries"] == 2
+    assert m["scorers"]["weighted_onehot_knn"]["users"] == 3
+
+    catalog.bump()  # alteração sem detalhes: snapshot e índices recarregados
+    scoring.rank("weighted_onehot_knn", _ATIVO)
+    assert len(loader) == 2
+
+
+def test_catalog_hooks_update_cached_index_in_place(loader):
+    index = scoring.default_engine.index("weighted_onehot_knn")
+    novo = {"nome": "Bidu", "porte": "Grande", "energia": "Alta", "bom_com_criancas": 1, "idade": 4}
+    catalog.animal_changed("insert", 50, novo)
+    catalog.animal_changed("adopt", 1, None)
+    catalog.animal_changed("update", 2, {"adotado_em": "2024-01-01"})
+
+    catalog.animal_changed("update", 3, {"disponivel": 0})  # marcado como indisponível
+
+    assert scoring.default_engine.index("weighted_onehot_knn") is index
+    assert len(loader) == 1
+    assert scoring.metrics()["incremental_updates"] == 4
+    top = scoring.rank("weighted_onehot_knn", _ATIVO, top_n=5, hydrate=False)
+    assert [r["id"] for r in top] == [50]
+
+
+def test_missed_version_drops_snapshot(loader):
+    scoring.rank("weighted_onehot_knn", _ATIVO)
+    engine = scoring.default_engine
+    engine.on_catalog_change("insert", 9, {"nome": "X"}, catalog.current_version() + 2)
+    assert engine.metrics()["rows"] == 0
+    scoring.rank("weighted_onehot_knn", _ATIVO)
+    assert len(loader) == 2
+
+
+def test_vec4_scorer_matches_weighted_minkowski(loader):
+    import numpy as np
+    from sklearn.metrics import pairwise_distances
+
+    from app.api import VEC_WEIGHTS, _build_animal_vector, _build_user_vector
+
+    top = scoring.rank("vec4_minkowski", _ATIVO, top_n=3)
+
+    X = np.array([_build_animal_vector(a) for a in _catalogo()])
+    d = pairwise_distances([_build_user_vector(_ATIVO)], X, metric="minkowski", p=2, w=VEC_WEIGHTS)[0]
+    esperado = {
+        a["id"]: round(max(0, 100 * (1 - float(di) / np.sqrt(VEC_WEIGHTS.sum()))), 1)
+        for a, di in zip(_catalogo(), d)
+    }
+    assert {r["id"]: r["compatibility_score"] for r in top} == esperado
+    scores = [r["compatibility_score"] for r in top]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_vec4_scorer_reads_precomputed_features(monkeypatch):
+    import app.api  # noqa: F401  registra o scorer vec4
+
+    # vetor gravado em animal_features prevalece sobre o texto livre da linha
+    rows = [
+        {"id": 1, "nome": "Gravado", "especie": "Gato", "porte": "Pequeno",
+         "vec_porte": 1.0, "vec_criancas": 1.0, "vec_tempo": 1.0, "vec_atividade": 1.0},
+        {"id": 2, "nome": "Sem features", "especie": "Gato", "porte": "Pequeno"},
+    ]
+    monkeypatch.setattr(scoring.default_engine, "_loader", lambda: rows)
+    monkeypatch.setattr(scoring.default_engine, "_hydrator", lambda ids: {r["id"]: r for r in rows if r["id"] in ids})
+    top = scoring.rank("vec4_minkowski", _ATIVO, top_n=2)
+    assert [r["nome"] for r in top] == ["Gravado", "Sem features"]
+    assert top[0]["compatibility_score"] == 100.0
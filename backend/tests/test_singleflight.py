@@ -0,0 +1,225 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+from flask import Flask, jsonify
+
+from app.extensions import catalog
+from app.extensions import response_cache as rc
+from app.extensions.cache import LocalCache
+from app.extensions.singleflight import FileLocks, SingleFlight
+from app.recommendation import scoring
+
+
+def _wait(cond, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert cond()
+
+
+def _run_concurrently(n, target):
+    results, threads = [None] * n, []
+    for i in range(n):
+        def run(i=i):
+            try:
+                results[i] = target()
+            except Exception as exc:
+                results[i] = exc
+        threads.append(threading.Thread(target=run))
+        threads[-1].start()
+    return results, threads
+
+
+def test_concurrent_callers_share_one_computation():
+    sf = SingleFlight(timeout=2)
+    release, calls = threading.Event(), []
+
+    def slow():
+        calls.append(1)
+        release.wait(2)
+        return {"linhas": 42}
+
+    results, threads = _run_concurrently(5, lambda: sf.do("k", slow))
+    _wait(lambda: sf.metrics()["calls"] == 5)
+    release.set()
+    for t in threads:
+        t.join(2)
+    assert calls == [1]
+    assert all(r is results[0] for r in results) and results[0] == {"linhas": 42}
+    m = sf.metrics()
+    assert m["leaders"] == 1 and m["shared"] == 4 and m["in_flight"] == 0
+
+    assert sf.do("k", lambda: "de novo") == "de novo"  # terminado, a chave sai do voo
+
+
+def test_error_is_shared_and_timeout_falls_back():
+    sf = SingleFlight(timeout=2)
+    release = threading.Event()
+
+    def failing():
+        release.wait(2)
+        raise RuntimeError("banco caiu")
+
+    results, threads = _run_concurrently(3, lambda: sf.do("k", failing))
+    _wait(lambda: sf.metrics()["calls"] == 3)
+    release.set()
+    for t in threads:
+        t.join(2)
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    stuck = threading.Event()
+    leader = threading.Thread(target=lambda: sf.do("lento", lambda: stuck.wait(2)))
+    leader.start()
+    _wait(lambda: sf.metrics()["in_flight"] == 1)
+    assert sf.do("lento", lambda: "sozinho", timeout=0.05) == "sozinho"
+    assert sf.metrics()["timeouts"] == 1
+    stuck.set()
+    leader.join(2)
+
+
+def test_process_lock_recheck_skips_work(tmp_path):
+    locks = FileLocks(str(tmp_path))
+    sf = SingleFlight(timeout=2, locks=locks)
+    shared = {}
+    holding, release = threading.Event(), threading.Event()
+
+    def other_worker():
+        # outro descritor de arquivo: flock se comporta como outro processo
+        with locks.hold("k", 1) as ok:
+            assert ok
+            holding.set()
+            release.wait(2)
+            shared["k"] = "do outro worker"
+
+    t = threading.Thread(target=other_worker)
+    t.start()
+    holding.wait(2)
+    threading.Timer(0.05, release.set).start()
+    calls = []
+    value = sf.do("k", lambda: calls.append(1) or "recalculado", recheck=lambda: shared.get("k"))
+    t.join(2)
+    assert value == "do outro worker" and not calls
+    assert sf.metrics()["rechecks"] == 1 and sf.metrics()["lock_waits"] == 1
+
+    # sem recheck não há lock entre processos: nada a reaproveitar do outro lado
+    with locks.hold("k", 1):
+        assert sf.do("k", lambda: "local") == "local"
+
+
+def test_file_lock_excludes_other_process(tmp_path):
+    code = textwrap.dedent(f"""
+        import sys, time
+        from app.extensions.singleflight import FileLocks
+        with FileLocks({str(tmp_path)!r}).hold("snapshot", 1) as ok:
+            print("ok" if ok else "falhou", flush=True)
+            time.sleep(0.3)
+    """)
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code], stdout=subprocess.PIPE, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    try:
+        assert proc.stdout.readline().strip() == "ok"
+        locks = FileLocks(str(tmp_path))
+        with locks.hold("snapshot", 0.02) as ok:
+            assert not ok
+        with locks.hold("snapshot", 2) as ok:
+            assert ok  # liberado quando o outro processo termina
+    finally:
+        proc.wait(5)
+        proc.stdout.close()
+
+
+def test_file_lock_is_per_key_and_cleans_up(tmp_path):
+    locks = FileLocks(str(tmp_path))
+    with locks.hold("snapshot:v1", 1) as ok:
+        assert ok
+        with FileLocks(str(tmp_path)).hold("snapshot:v2", 0) as other:
+            assert other  # chave diferente nunca espera por esta
+        with FileLocks(str(tmp_path)).hold("snapshot:v1", 0.02) as same:
+            assert not same
+    assert os.listdir(tmp_path) == []  # chaves versionadas não acumulam arquivos
+
+    holding, release, got = threading.Event(), threading.Event(), []
+
+    def holder():
+        with locks.hold("k", 1):
+            holding.set()
+            release.wait(2)
+
+    t = threading.Thread(target=holder)
+    t.start()
+    holding.wait(2)
+    threading.Timer(0.05, release.set).start()
+    with FileLocks(str(tmp_path)).hold("k", 2) as ok:
+        # quem esperava no arquivo apagado segura o novo, visível a terceiros
+        got.append(ok)
+        with FileLocks(str(tmp_path)).hold("k", 0.02) as third:
+            got.append(third)
+    t.join(2)
+    assert got == [True, False]
+
+
+def test_cached_response_miss_runs_view_once(monkeypatch):
+    app = Flask(__name__)
+    release, calls = threading.Event(), []
+
+    @app.get("/lista")
+    @rc.cached_response(key=lambda: "x")
+    def lista():
+        calls.append(1)
+        release.wait(2)
+        return jsonify([1, 2, 3])
+
+    flight = SingleFlight(timeout=2)
+    monkeypatch.setattr(rc, "flight", flight)
+    results, threads = _run_concurrently(4, lambda: app.test_client().get("/lista"))
+    _wait(lambda: flight.metrics()["calls"] == 4)
+    release.set()
+    for t in threads:
+        t.join(2)
+    assert calls == [1]
+    assert all(r.status_code == 200 and r.get_json() == [1, 2, 3] for r in results)
+    assert all(r.headers["X-Cache"] == "MISS" and r.mimetype == "application/json" for r in results)
+    assert app.test_client().get("/lista").headers["X-Cache"] == "HIT"
+
+
+class SharedCache(LocalCache):
+    """LocalCache fazendo o papel do Redis visto por dois workers."""
+
+    shared = True
+
+
+@pytest.fixture
+def synced(monkeypatch):
+    monkeypatch.setattr(catalog, "_shared_version", 5)
+    monkeypatch.setattr(catalog, "_synced_at", catalog._version)
+
+
+def test_snapshot_rows_shared_between_workers(monkeypatch, synced):
+    loads = []
+    monkeypatch.setattr(scoring, "_shared_rows", SharedCache(max_entries=4, ttl=60))
+    monkeypatch.setattr(scoring, "load_catalog", lambda: loads.append(1) or [{"id": 1, "especie": "Gato"}])
+
+    worker_a, worker_b = scoring.ScoringEngine(), scoring.ScoringEngine()
+    assert worker_a.snapshot().rows == worker_b.snapshot().rows == [{"id": 1, "especie": "Gato"}]
+    assert loads == [1]  # o segundo worker leu as linhas do cache compartilhado
+
+    monkeypatch.setattr(catalog, "_shared_version", 6)
+    catalog.bump()
+    monkeypatch.setattr(catalog, "_synced_at", catalog._version)
+    worker_b.snapshot()
+    assert loads == [1, 1]  # versão nova, chave nova
+
+
+def test_snapshot_local_backend_loads_directly(monkeypatch, synced):
+    loads = []
+    monkeypatch.setattr(scoring, "load_catalog", lambda: loads.append(1) or [])
+    scoring.ScoringEngine().snapshot()
+    scoring.ScoringEngine().snapshot()
+    assert loads == [1, 1]
@@ -0,0 +1,122 @@
+import pytest
+
+import app.extensions.db as db_mod
+from app.extensions import statements
+from app.extensions.statements import Statement, prepared
+
+
+@pytest.fixture(autouse=True)
+def _reset_metrics():
+    statements.reset_statement_metrics()
+    yield
+    statements.reset_statement_metrics()
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.sqls = []
+
+    def execute(self, sql, params=None):
+        self.sqls.append((sql, params))
+
+    def fetchone(self):
+        return {"id": 1}
+
+    def close(self):
+        pass
+
+
+class RawConn:
+    def __init__(self):
+        self.cursors = []
+
+    def cursor(self, **kwargs):
+        cur = RecordingCursor()
+        cur.kwargs = kwargs
+        self.cursors.append(cur)
+        return cur
+
+
+def test_placeholders_translated_once_per_dialect():
+    stmt = Statement("teste_dialeto", "SELECT * FROM t WHERE a=%s AND b=%s")
+    assert stmt == "SELECT * FROM t WHERE a=%s AND b=%s"  # continua sendo o SQL
+    assert stmt.for_sqlite() == "SELECT * FROM t WHERE a=? AND b=?"
+    assert stmt.pg_prepare() == "PREPARE stmt_teste_dialeto AS SELECT * FROM t WHERE a=$1 AND b=$2"
+    assert stmt.pg_execute() == "EXECUTE stmt_teste_dialeto (%s, %s)"
+    assert stmt.for_sqlite() is stmt.for_sqlite()
+    assert Statement("sem_param", "SELECT 1").pg_execute() == "EXECUTE stmt_sem_param"
+
+
+def test_registry_rejects_conflicting_sql():
+    a = prepared("teste_registro", "SELECT 1")
+    assert prepared("teste_registro", "SELECT 1") is a
+    with pytest.raises(ValueError):
+        prepared("teste_registro", "SELECT 2")
+    with pytest.raises(ValueError):
+        prepared("nome; DROP", "SELECT 1")
+
+
+def test_postgres_prepares_once_per_connection(monkeypatch):
+    monkeypatch.setattr(db_mod, "_using_sqlite", False)
+    monkeypatch.setattr(db_mod, "_using_postgres", True)
+    monkeypatch.setattr(db_mod, "_pg_extras", type("Extras", (), {"RealDictCursor": object}))
+    stmt = prepared("teste_pg", "SELECT * FROM animais WHERE id=%s")
+    raw = RawConn()
+    proxy = db_mod.ConnProxy(raw)
+
+    for aid in (1, 2):
+        with proxy.cursor(dictionary=True) as cur:
+            cur.execute(stmt, (aid,))
+            assert cur.fetchone() == {"id": 1}
+    with proxy.cursor() as cur:
+        cur.execute("SELECT 1")
+
+    sqls = [sql for c in raw.cursors for sql, _ in c.sqls]
+    assert sqls == [
+        "PREPARE stmt_teste_pg AS SELECT * FROM animais WHERE id=$1",
+        "EXECUTE stmt_teste_pg (%s)",
+        "EXECUTE stmt_teste_pg (%s)",
+        "SELECT 1",
+    ]
+    m = statements.statement_metrics()["teste_pg"]
+    assert m["executions"] == 2 and m["prepares"] == 1 and m["seconds"] >= 0
+
+    # outra conexão: sessão nova, prepara de novo
+    with db_mod.ConnProxy(RawConn()).cursor() as cur:
+        cur.execute(stmt, (3,))
+    assert statements.statement_metrics()["teste_pg"]["prepares"] == 2
+
+    monkeypatch.setenv("DB_PREPARED_STATEMENTS", "0")
+    raw3 = RawConn()
+    with db_mod.ConnProxy(raw3).cursor() as cur:
+        cur.execute(stmt, (4,))
+    assert raw3.cursors[0].sqls == [(stmt, (4,))]
+
+
+def test_mysql_uses_prepared_cursor(monkeypatch):
+    monkeypatch.setattr(db_mod, "_using_sqlite", False)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    stmt = prepared("teste_mysql", "SELECT * FROM usuarios WHERE id=%s")
+    raw = RawConn()
+    with db_mod.ConnProxy(raw).cursor(dictionary=True) as cur:
+        cur.execute(stmt, (7,))
+        assert cur.fetchone() == {"id": 1}
+
+    plain, prep = raw.cursors
+    assert plain.sqls == [] and prep.kwargs == {"prepared": True, "dictionary": True}
+    assert prep.sqls == [("SELECT * FROM usuarios WHERE id=%s", (7,))]
+    assert statements.statement_metrics()["teste_mysql"]["executions"] == 1
+
+
+def test_sqlite_statement_metrics(monkeypatch, tmp_path):
+    monkeypatch.setattr(db_mod, "_using_sqlite", True)
+    monkeypatch.setattr(db_mod, "_using_postgres", False)
+    monkeypatch.setattr(db_mod, "_sqlite_path", str(tmp_path / "stmt.db"))
+    stmt = prepared("teste_sqlite", "SELECT v FROM t WHERE v=%s")
+    with db_mod.db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CREATE TABLE t(v TEXT)")
+            cur.execute("INSERT INTO t(v) VALUES (%s)", ("x",))
+            cur.execute(stmt, ("x",))
+            assert cur.fetchone()[0] == "x"
+    assert statements.statement_metrics()["teste_sqlite"]["executions"] == 1
@@ -39,6 +39,11 @@ for i in $(seq 1 60); do
   sleep 2
 done
 
+# --- Migrações de schema (imagem nova, antes de trocar o backend) ---
+# Escritas em `animais` e o perfil de adotante dependem de tabelas/colunas das
+# migrações (catalog_version, perfil_adotante.versao, animal_features).
+docker compose -f docker-compose.prod.yml run --rm --no-deps backend flask --app wsgi db-migrate
+
 # --- Recriar backend e frontend ---
 docker compose -f docker-compose.prod.yml up -d --no-deps --force-recreate backend
 docker compose -f docker-compose.prod.yml up -d --no-deps --force-recreate frontend